@@ -0,0 +1,92 @@
+"""
+Recall@k and latency of the IVF snapshot (lambda/ann_index.py) vs exact search.
+
+    python benchmarks/bench_ann_index.py --rows 100000 --dim 1024 --users 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda"))
+from ann_index import AnnIndex, build_index  # noqa: E402
+
+
+def synthetic_records(rows, dim, users, clusters, seed):
+    """Clustered unit vectors, roughly how check-in memories group by theme."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(clusters, size=rows)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32)
+    return [
+        {"user_id": f"user{rng.integers(users)}", "timestamp": f"2025-01-01T00:00:{i:08d}",
+         "vector_id": str(i), "embedding": vectors[i]}
+        for i in range(rows)
+    ], centers
+
+
+def percentile(values, p):
+    return float(np.percentile(np.asarray(values) * 1000, p))
+
+
+def run(index, queries, k, nprobe, user_filter):
+    exact_ms, ann_ms, recalls = [], [], []
+    for q, users in zip(queries, user_filter):
+        t0 = time.perf_counter()
+        truth = index.exact_search(q, k, users)
+        t1 = time.perf_counter()
+        approx = index.search(q, k, users, nprobe=nprobe)
+        t2 = time.perf_counter()
+        exact_ms.append(t1 - t0)
+        ann_ms.append(t2 - t1)
+        want = {r["vector_id"] for r in truth}
+        if want:
+            recalls.append(len(want & {r["vector_id"] for r in approx}) / len(want))
+    return {
+        "recall": float(np.mean(recalls)) if recalls else 0.0,
+        "exact_p50": percentile(exact_ms, 50), "exact_p95": percentile(exact_ms, 95),
+        "ann_p50": percentile(ann_ms, 50), "ann_p95": percentile(ann_ms, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    records, centers = synthetic_records(args.rows, args.dim, args.users, 64, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = centers[rng.integers(len(centers), size=args.queries)] \
+        + 0.6 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.ivf")
+    t0 = time.perf_counter()
+    build_index(records, path)
+    print(f"build: {time.perf_counter() - t0:.1f}s, file: {os.path.getsize(path) / 2**20:.1f} MiB")
+    index = AnnIndex(path)
+
+    cohort = [f"user{i}" for i in range(args.users // 4)]
+    scenarios = {
+        "all users": [None] * args.queries,
+        "cohort (25%)": [cohort] * args.queries,
+    }
+    print(f"{'scenario':<14} {'nprobe':>6} {'recall@' + str(args.k):>10} "
+          f"{'exact p50/p95 ms':>18} {'ann p50/p95 ms':>16}")
+    for name, filters in scenarios.items():
+        for nprobe in args.nprobe:
+            r = run(index, queries, args.k, nprobe, filters)
+            print(f"{name:<14} {nprobe:>6} {r['recall']:>10.3f} "
+                  f"{r['exact_p50']:>8.2f}/{r['exact_p95']:<8.2f} {r['ann_p50']:>7.2f}/{r['ann_p95']:<7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Payload size and client parse time for /checkins transport formats.
+
+Encodes synthetic check-ins with ui/lambda_function.rows_response exactly as the API
+would, then decodes them the way ui/utils/api does (JSON → normalize_df vs Arrow → pandas).
+
+    python benchmarks/bench_checkin_transport.py --rows 100000
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ui"))
+import pandas as pd  # noqa: E402
+from lambda_function import ARROW_STREAM, NDJSON, rows_response  # noqa: E402
+from utils.api import normalize_df  # noqa: E402
+
+TIERS = ["Stable", "Stirred", "At-Risk", "Critical", "Auto"]
+TONES = ["gentle", "reassuring", "reflective", "empowering", "neutral"]
+
+
+def synthetic_rows(n, seed=0):
+    rng = random.Random(seed)
+    return [{
+        "user_id": f"user{rng.randrange(2000)}",
+        "timestamp": f"2025-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}T{rng.randrange(24):02d}:00:00",
+        "tier": rng.choice(TIERS),
+        "tone": rng.choice(TONES),
+        "message": "Feeling tired but okay, missed the bus again " * rng.randrange(1, 4),
+        "response": "I noticed some strain—would it help to look at next steps or just pause?",
+        "source": "Claude-via-us-east-1",
+        "score": Decimal(str(round(rng.random(), 3))),
+    } for _ in range(n)]
+
+
+def body_bytes(resp):
+    body = resp["body"]
+    raw = base64.b64decode(body) if resp.get("isBase64Encoded") else body.encode("utf-8")
+    return raw
+
+
+def decode(resp):
+    raw = body_bytes(resp)
+    if resp["headers"].get("Content-Encoding") == "gzip":
+        raw = gzip.decompress(raw)
+    ctype = resp["headers"]["Content-Type"]
+    if ctype == ARROW_STREAM:
+        import pyarrow as pa
+        return pa.ipc.open_stream(raw).read_pandas()
+    if ctype == NDJSON:
+        return pd.DataFrame([json.loads(line) for line in raw.decode("utf-8").splitlines()])
+    return pd.DataFrame(json.loads(raw))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    args = parser.parse_args()
+    rows = synthetic_rows(args.rows)
+
+    formats = {
+        "json": {},
+        "ndjson": {"accept": NDJSON},
+        "ndjson+gzip": {"accept": NDJSON, "accept-encoding": "gzip"},
+        "arrow": {"accept": ARROW_STREAM},
+        "arrow+gzip": {"accept": ARROW_STREAM, "accept-encoding": "gzip"},
+    }
+    print(f"{'format':<12} {'bytes':>12} {'vs json':>8} {'encode ms':>10} {'decode+normalize ms':>20}")
+    baseline = None
+    for name, headers in formats.items():
+        t0 = time.perf_counter()
+        resp = rows_response(200, rows, headers)
+        encode_ms = 1000 * (time.perf_counter() - t0)
+        size = len(body_bytes(resp))
+        baseline = baseline or size
+        t0 = time.perf_counter()
+        normalize_df(decode(resp))
+        decode_ms = 1000 * (time.perf_counter() - t0)
+        print(f"{name:<12} {size:>12,} {baseline / size:>7.1f}x {encode_ms:>10.1f} {decode_ms:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
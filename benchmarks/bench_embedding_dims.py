@@ -0,0 +1,100 @@
+"""
+Accuracy vs latency of Titan v2 output dimensions (256 / 512 / 1024).
+
+Embeds a corpus of check-in texts at each dimension (needs Bedrock access), then reports:
+  • Titan embed latency p50/p95
+  • per-query scoring latency over the corpus: dot product (normalized) vs cosine
+  • approximate item size in DynamoDB
+  • recall@k of each dimension's ranking against the 1024-d ranking
+
+    python benchmarks/bench_embedding_dims.py --corpus memories.jsonl --queries 50
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda"))
+from retrieve_memory import cosine_similarity, dot_product  # noqa: E402
+from update_memory import SUPPORTED_DIMENSIONS, get_embedding  # noqa: E402
+
+SAMPLE_TEXTS = [
+    "Missed my appointment again and feel like I'm letting everyone down",
+    "Had a good talk with my case worker about housing",
+    "Tired today, barely slept, but I went to work",
+    "Feeling okay, started the new medication this week",
+    "Panic at the bus station, couldn't breathe for a while",
+    "Got my ID renewed, one less thing to worry about",
+    "Late for my shift because the train broke down",
+    "Meh. Just a regular day, nothing special",
+    "Visited my kids for the first time in months",
+    "Stressed about the court date next Tuesday",
+]
+
+
+def load_corpus(path):
+    if not path:
+        return SAMPLE_TEXTS
+    texts = []
+    with open(path) as f:
+        for line in f:
+            row = json.loads(line)
+            texts.append(row.get("text") or f"{row.get('message', '')} | {row.get('response', '')}")
+    return texts
+
+
+def ms(values, q):
+    values = sorted(values)
+    return 1000 * values[min(len(values) - 1, int(q * len(values)))]
+
+
+def rank(query, corpus, score):
+    scores = [score(query, doc) for doc in corpus]
+    return sorted(range(len(corpus)), key=lambda i: scores[i], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="JSONL with text or message/response fields")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus)
+    queries = texts[:args.queries]
+    embedded = {}
+
+    print(f"{'dim':>5} {'embed p50/p95 ms':>17} {'dot ms':>8} {'cosine ms':>10} "
+          f"{'item KiB':>9} {'recall@' + str(args.k):>9}")
+    for dim in sorted(SUPPORTED_DIMENSIONS, reverse=True):
+        latencies, vectors = [], []
+        for text in texts:
+            t0 = time.perf_counter()
+            vectors.append(get_embedding(text, dim))
+            latencies.append(time.perf_counter() - t0)
+        embedded[dim] = vectors
+        qvecs = vectors[:len(queries)]
+
+        t0 = time.perf_counter()
+        rankings = [rank(q, vectors, dot_product) for q in qvecs]
+        dot_ms = 1000 * (time.perf_counter() - t0) / len(qvecs)
+        t0 = time.perf_counter()
+        for q in qvecs:
+            rank(q, vectors, cosine_similarity)
+        cos_ms = 1000 * (time.perf_counter() - t0) / len(qvecs)
+
+        item_kib = sum(len(str(Decimal(str(x)))) + 1 for x in vectors[0]) / 1024
+        reference = [rank(q, embedded[max(embedded)], dot_product)
+                     for q in embedded[max(embedded)][:len(queries)]]
+        recall = statistics.mean(
+            len(set(r[:args.k]) & set(ref[:args.k])) / args.k for r, ref in zip(rankings, reference)
+        )
+        print(f"{dim:>5} {ms(latencies, .5):>8.1f}/{ms(latencies, .95):<8.1f} "
+              f"{dot_ms:>8.2f} {cos_ms:>10.2f} {item_kib:>9.1f} {recall:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
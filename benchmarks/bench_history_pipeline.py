@@ -0,0 +1,106 @@
+"""
+Peak memory and rerun latency of the history-feed DataFrame pipeline.
+
+Compares the previous pipeline (astype(str) everywhere, df.copy() + per-rerun .str.lower()
+in _apply_filters, another copy for the table) with the current one (categoricals,
+cached lowercase search column, boolean masks) at 100k and 1M rows.
+
+    python benchmarks/bench_history_pipeline.py --rows 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ui"))
+import pandas as pd  # noqa: E402
+from components.history_feed import TIER_LABELS, _apply_filters, _table_view  # noqa: E402
+from utils.api import normalize_df  # noqa: E402
+
+TIERS = ["Stable", "Stirred", "At-Risk", "Critical", "Auto"]
+TONES = ["gentle", "reassuring", "reflective", "empowering", "neutral"]
+FILTERS = dict(users=[f"user{i}" for i in range(50)], tiers=TIERS[:4], include_auto=False,
+               date_range=(date(2025, 3, 1), date(2025, 9, 30)), query="bus")
+
+
+def raw_frame(n, seed=0):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "user_id": [f"user{rng.randrange(2000)}" for _ in range(n)],
+        "timestamp": [f"2025-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}T{rng.randrange(24):02d}:00:00"
+                      for _ in range(n)],
+        "tier": [rng.choice(TIERS) for _ in range(n)],
+        "tone": [rng.choice(TONES) for _ in range(n)],
+        "message": [rng.choice(["Missed the bus again", "Feeling okay today", "Tired but going to work"])
+                    for _ in range(n)],
+        "response": ["I noticed some strain—would it help to look at next steps or just pause?"] * n,
+        "source": ["Claude-via-us-east-1"] * n,
+    })
+
+
+# ----- previous implementation, kept here as the baseline -----
+def legacy_normalize(df):
+    df = df.copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce", utc=True)
+    for col in ["user_id", "tier", "message", "response", "tone", "source"]:
+        df[col] = df[col].astype(str).fillna("")
+    df["tier"] = df["tier"].str.strip().str.title()
+    df["tone"] = df["tone"].str.strip().str.lower()
+    return df.sort_values("timestamp", ascending=False).reset_index(drop=True)
+
+
+def legacy_filters(df, users, tiers, include_auto, date_range, query):
+    v = df.copy()
+    s = datetime.combine(date_range[0], datetime.min.time(), tzinfo=timezone.utc)
+    e = datetime.combine(date_range[1], datetime.max.time(), tzinfo=timezone.utc)
+    v = v[(v["timestamp"] >= s) & (v["timestamp"] <= e)]
+    if users: v = v[v["user_id"].isin(users)]
+    if tiers: v = v[v["tier"].isin(tiers)]
+    if not include_auto: v = v[v["tier"] != "Auto"]
+    q = query.lower()
+    return v[v["message"].str.lower().str.contains(q, na=False) | v["response"].str.lower().str.contains(q, na=False)]
+
+
+def legacy_table(view):
+    view = view.sort_values("timestamp", ascending=False).copy()
+    view["Tier"] = view["tier"].map(TIER_LABELS).fillna("⚫ Unknown")
+    view["Time (UTC)"] = view["timestamp"].dt.strftime("%Y-%m-%d %H:%M")
+    return view[["Time (UTC)", "user_id", "Tier", "message", "response"]]
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed * 1000, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'pipeline':<8} {'frame MiB':>10} {'normalize ms':>13} {'norm peak MiB':>14} "
+          f"{'rerun ms':>9} {'rerun peak MiB':>15}")
+    for n in args.rows:
+        raw = raw_frame(n)
+        pipelines = {
+            "legacy": (legacy_normalize, lambda df: legacy_table(legacy_filters(df, **FILTERS))),
+            "current": (lambda df: normalize_df(df.copy()), lambda df: _table_view(_apply_filters(df, **FILTERS))),
+        }
+        for name, (normalize, rerun) in pipelines.items():
+            df, norm_ms, norm_peak = measure(normalize, raw)
+            frame_mib = df.memory_usage(deep=True).sum() / 2**20
+            _, rerun_ms, rerun_peak = measure(rerun, df)
+            print(f"{n:>9,} {name:<8} {frame_mib:>10.1f} {norm_ms:>13.0f} {norm_peak:>14.1f} "
+                  f"{rerun_ms:>9.0f} {rerun_peak:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
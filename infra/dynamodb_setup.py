@@ -1,44 +1,287 @@
-import boto3 
-
-TABLE_NAME= 'SainiCheckins'
-dynamodb = boto3.resource('dynamodb')
-
-
-def create_table():
-    exisiting_tables = dynamodb.meta.client.list_tables()["TableNames"]
-    if TABLE_NAME in exisiting_tables:
-        print("*****")
-        print(f"Table '{TABLE_NAME} already exits ")
-        print("*****")
-        return
-
-    table = dynamodb.create_table(
-        TableName=TABLE_NAME,
-        KeySchema= [
-            {
-                "AttributeName":"user_id" , "KeyType":"HASH"
-            },
-            {
-                "AttributeName":"timestamp" , "KeyType":"RANGE"
-            },
-        ],
-        AttributeDefinations=[
-            {
-                "AttributeName":"user_id" , "AttributeType":"S"
-            },
-            {
-                "AttributeName":"timestamp" , "AttributeType":"S"
-            }
-        ],
-        ProvisionedThroughput= {
-            "ReadCapacityUnites": 5,
-            "WriteCapacityUnits":5  
-        }
-    )
-    table.wait_until_exists()
-    print(f"Created Table: {TABLE_NAME}")
+"""
+Declarative DynamoDB provisioning for every table the Lambdas and the dashboard use.
 
+    python infra/dynamodb_setup.py                 # create missing tables, reconcile existing ones
+    python infra/dynamodb_setup.py --dry-run       # print the plan only
+    python infra/dynamodb_setup.py --local --reset --seed 5000   # fresh DynamoDB Local mirror
+
+Each run compares TABLES with what exists and only applies the difference (new tables, missing
+GSIs, on-demand billing, streams, TTL), so it is safe to rerun. Changes DynamoDB can't make in
+place (key schema, stream view type, TTL attribute, GSI keys) are reported, not forced.
+Table names follow the same environment variables as the code that reads them.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import boto3
+from botocore.exceptions import ClientError
+
+REGION = os.getenv("AWS_REGION", "us-east-2")
+LOCAL_ENDPOINT = "http://localhost:8000"
+
+# ===== DECLARATIONS =====
+# key / index keys: (attribute, type, key type)
+TABLES = [
+    {
+        "name": os.getenv("TABLE_NAME", "SainiCheckins"),
+        "key": [("user_id", "S", "HASH"), ("timestamp", "S", "RANGE")],
+        # Tier-filtered dashboard views (ui/lambda_function.py TIER_INDEX)
+        "indexes": [{"name": os.getenv("TIER_INDEX", "tier-timestamp-index"),
+                     "key": [("tier", "S", "HASH"), ("timestamp", "S", "RANGE")]}],
+        # Change versions, /search index and rollups are maintained from this stream
+        "stream": "NEW_AND_OLD_IMAGES",
+        # Set on rows already copied to the cold archive (lambda/archive_checkins.py)
+        "ttl": "expires_at",
+    },
+    {
+        # Memories partitioned per user (see lambda/migrate_vectors.py)
+        "name": os.getenv("VECTOR_TABLE", "SainiUserVectors"),
+        "key": [("user_id", "S", "HASH"), ("timestamp", "S", "RANGE")],
+    },
+    {
+        "name": os.getenv("TERM_INDEX_TABLE", "SainiTermIndex"),
+        "key": [("user_id", "S", "HASH"), ("entry", "S", "RANGE")],
+    },
+    {
+        "name": os.getenv("VERSION_TABLE", "SainiChangeVersions"),
+        "key": [("scope", "S", "HASH")],
+        # Sparse: only "user#<id>" items carry kind/last_activity (shared/last_activity.py);
+        # keys only, since readers just need the user and the timestamp
+        "indexes": [{"name": os.getenv("LAST_ACTIVITY_INDEX", "last-activity-index"),
+                     "key": [("kind", "S", "HASH"), ("last_activity", "S", "RANGE")],
+                     "projection": "KEYS_ONLY"}],
+    },
+    {
+        "name": os.getenv("SEARCH_INDEX_TABLE", "SainiCheckinSearch"),
+        "key": [("bucket", "S", "HASH"), ("entry", "S", "RANGE")],
+    },
+    {
+        "name": os.getenv("ROLLUP_TABLE", "SainiRollups"),
+        "key": [("series", "S", "HASH"), ("period", "S", "RANGE")],
+        # Expires the per-batch flush ledgers (ui/rollups.py); rollups themselves never expire
+        "ttl": "expires_at",
+    },
+    {
+        # Async check-ins until their finished row is written (lambda/check_in_handler.py)
+        "name": os.getenv("CHECKIN_JOBS_TABLE", "SainiCheckinJobs"),
+        "key": [("user_id", "S", "HASH"), ("timestamp", "S", "RANGE")],
+        "ttl": "expires_at",
+    },
+    {
+        "name": os.getenv("NUDGE_RUNS_TABLE", "SainiNudgeRuns"),
+        "key": [("run_id", "S", "HASH"), ("entry", "S", "RANGE")],
+        "ttl": "expires_at",
+    },
+]
+
+
+def _key_schema(key):
+    return [{"AttributeName": name, "KeyType": key_type} for name, _, key_type in key]
+
+
+def _attribute_definitions(spec):
+    types = {}
+    for name, attr_type, _ in spec["key"] + [k for i in spec.get("indexes", []) for k in i["key"]]:
+        types[name] = attr_type
+    return [{"AttributeName": n, "AttributeType": t} for n, t in types.items()]
+
+
+def _index(index):
+    return {"IndexName": index["name"], "KeySchema": _key_schema(index["key"]),
+            "Projection": {"ProjectionType": index.get("projection", "ALL")}}
+
+
+# ===== PLAN =====
+def _describe(client, name):
+    try:
+        return client.describe_table(TableName=name)["Table"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ResourceNotFoundException":
+            return None
+        raise
+
+
+def _ttl_status(client, name):
+    try:
+        return client.describe_time_to_live(TableName=name)["TimeToLiveDescription"]
+    except ClientError as e:
+        print(f"⚠️ {name}: TTL status unavailable ({e.response['Error']['Code']})")
+        return None
+
+
+def plan(client, spec):
+    """[(description, action)] bringing one table in line with its declaration; [] when it already is."""
+    name = spec["name"]
+    current = _describe(client, name)
+    if current is None:
+        return [(f"create {name}", lambda: create_table(client, spec))] + _ttl_plan(client, spec, None)
+
+    steps = []
+    if current["KeySchema"] != _key_schema(spec["key"]):
+        print(f"⚠️ {name}: key schema differs from the declaration; recreate it to change keys")
+
+    if current.get("BillingModeSummary", {}).get("BillingMode") != "PAY_PER_REQUEST":
+        steps.append((f"{name}: switch to on-demand billing",
+                      lambda: client.update_table(TableName=name, BillingMode="PAY_PER_REQUEST")))
+
+    stream = current.get("StreamSpecification") or {}
+    if spec.get("stream"):
+        if not stream.get("StreamEnabled"):
+            steps.append((f"{name}: enable {spec['stream']} stream",
+                          lambda: client.update_table(TableName=name, StreamSpecification={
+                              "StreamEnabled": True, "StreamViewType": spec["stream"]})))
+        elif stream.get("StreamViewType") != spec["stream"]:
+            print(f"⚠️ {name}: stream is {stream.get('StreamViewType')}, declared {spec['stream']}; "
+                  "changing it means disabling the stream (consumers lose their position), left as is")
+
+    existing = {i["IndexName"]: i for i in current.get("GlobalSecondaryIndexes", [])}
+    for index in spec.get("indexes", []):
+        if index["name"] in existing:
+            if existing[index["name"]]["KeySchema"] != _key_schema(index["key"]):
+                print(f"⚠️ {name}: index {index['name']} has different keys; drop it to redeclare")
+            continue
+        # One GSI per UpdateTable call; each backfills before the next can start
+        steps.append((f"{name}: create index {index['name']}",
+                      lambda index=index: client.update_table(
+                          TableName=name,
+                          AttributeDefinitions=_attribute_definitions(spec),
+                          GlobalSecondaryIndexUpdates=[{"Create": _index(index)}])))
+    return steps + _ttl_plan(client, spec, current)
+
+
+def _ttl_plan(client, spec, current):
+    if not spec.get("ttl"):
+        return []
+    name = spec["name"]
+    if current is not None:
+        status = _ttl_status(client, name)
+        if status is None:
+            return []
+        if status.get("TimeToLiveStatus") in ("ENABLED", "ENABLING"):
+            if status.get("AttributeName") != spec["ttl"]:
+                print(f"⚠️ {name}: TTL is on {status.get('AttributeName')}, declared {spec['ttl']}; left as is")
+            return []
+    return [(f"{name}: enable TTL on {spec['ttl']}",
+             lambda: client.update_time_to_live(TableName=name, TimeToLiveSpecification={
+                 "Enabled": True, "AttributeName": spec["ttl"]}))]
+
+
+# ===== APPLY =====
+def create_table(client, spec):
+    params = {
+        "TableName": spec["name"],
+        "KeySchema": _key_schema(spec["key"]),
+        "AttributeDefinitions": _attribute_definitions(spec),
+        "BillingMode": "PAY_PER_REQUEST",
+    }
+    if spec.get("indexes"):
+        params["GlobalSecondaryIndexes"] = [_index(i) for i in spec["indexes"]]
+    if spec.get("stream"):
+        params["StreamSpecification"] = {"StreamEnabled": True, "StreamViewType": spec["stream"]}
+    client.create_table(**params)
+
+
+def wait_active(client, name, timeout=900):
+    """UpdateTable is rejected while the table or one of its indexes is still changing."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        table = client.describe_table(TableName=name)["Table"]
+        indexes = table.get("GlobalSecondaryIndexes", [])
+        if table["TableStatus"] == "ACTIVE" and all(i["IndexStatus"] == "ACTIVE" for i in indexes):
+            return
+        time.sleep(5)
+    raise TimeoutError(f"{name} still not ACTIVE after {timeout}s")
+
+
+def apply(client, tables=TABLES, dry_run=False):
+    changed = 0
+    for spec in tables:
+        steps = plan(client, spec)
+        if not steps:
+            print(f"✅ {spec['name']} is up to date")
+        for description, action in steps:
+            print(f"{'📝 would' if dry_run else '🔧'} {description}")
+            if dry_run:
+                continue
+            action()
+            wait_active(client, spec["name"])
+            changed += 1
+    return changed
+
+
+# ===== LOCAL MIRROR =====
+def reset_tables(client, tables=TABLES):
+    for spec in tables:
+        try:
+            client.delete_table(TableName=spec["name"])
+            client.get_waiter("table_not_exists").wait(TableName=spec["name"])
+            print(f"🗑 Dropped {spec['name']}")
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ResourceNotFoundException":
+                raise
+
+
+def seed_checkins(resource, n, users=50, seed=0):
+    """Synthetic check-ins for local benchmarks (spread over the last 90 days)."""
+    rng = random.Random(seed)
+    tiers = ["Stable", "Stirred", "At-Risk", "Critical", "Auto"]
+    tones = ["gentle", "reassuring", "reflective", "empowering", "neutral"]
+    words = ["sleep", "work", "bus", "family", "court", "meeting", "tired", "hopeful", "anxious", "calm"]
+    start = datetime.utcnow() - timedelta(days=90)
+    with resource.Table(TABLES[0]["name"]).batch_writer(overwrite_by_pkeys=["user_id", "timestamp"]) as batch:
+        for i in range(n):
+            ts = start + timedelta(seconds=rng.randrange(90 * 86400), microseconds=i)
+            batch.put_item(Item={
+                "user_id": f"user{rng.randrange(users)}",
+                "timestamp": ts.isoformat(),
+                "message": " ".join(rng.choices(words, k=6)),
+                "response": "Thanks for checking in.",
+                "tier": rng.choice(tiers),
+                "tone": rng.choice(tones),
+                "source": "seed",
+            })
+    print(f"🌱 Seeded {n} check-ins for {users} users into {TABLES[0]['name']}")
+
+
+def connect(endpoint=None, region=REGION):
+    """boto3 session for AWS, or for a DynamoDB Local endpoint (which accepts any credentials)."""
+    if endpoint:
+        session = boto3.session.Session(aws_access_key_id="local", aws_secret_access_key="local",
+                                        region_name=region)
+        return session.client("dynamodb", endpoint_url=endpoint), session.resource("dynamodb", endpoint_url=endpoint)
+    return boto3.client("dynamodb", region_name=region), boto3.resource("dynamodb", region_name=region)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--local", action="store_true", help=f"target DynamoDB Local at {LOCAL_ENDPOINT}")
+    parser.add_argument("--endpoint", default=os.getenv("AWS_ENDPOINT_URL_DYNAMODB"),
+                        help="custom DynamoDB endpoint (default: $AWS_ENDPOINT_URL_DYNAMODB)")
+    parser.add_argument("--region", default=REGION)
+    parser.add_argument("--only", nargs="+", metavar="TABLE", help="limit to these table names")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan without changing anything")
+    parser.add_argument("--reset", action="store_true", help="drop the tables first (local endpoints only)")
+    parser.add_argument("--seed", type=int, default=0, metavar="N", help="insert N synthetic check-ins (local only)")
+    args = parser.parse_args()
+
+    endpoint = LOCAL_ENDPOINT if args.local else args.endpoint
+    if (args.reset or args.seed) and not endpoint:
+        parser.error("--reset and --seed only run against a local endpoint (--local or --endpoint)")
+    tables = [t for t in TABLES if not args.only or t["name"] in args.only]
+
+    client, resource = connect(endpoint, args.region)
+    print(f"🎯 {endpoint or f'AWS {args.region}'}")
+    if args.reset and not args.dry_run:
+        reset_tables(client, tables)
+    changed = apply(client, tables, dry_run=args.dry_run)
+    if not args.dry_run:
+        print(f"✅ {changed} change(s) applied")
+    if args.seed and not args.dry_run:
+        seed_checkins(resource, args.seed)
 
 
 if __name__ == "__main__":
-    create_table()
\ No newline at end of file
+    main()
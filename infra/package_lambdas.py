@@ -0,0 +1,58 @@
+"""
+Build the deployment zips, with the modules in shared/ copied into each.
+
+    python infra/package_lambdas.py                # dist/lambda.zip and dist/dashboard.zip
+    python infra/package_lambdas.py --out build/
+
+shared/ (profiling.py, cold_archive.py, row_encoding.py, ddb_jobs.py, last_activity.py) is
+the only copy of that code; lambda/ and ui/ reach it through symlinks for local runs. The zips hold real files, so the
+same package works whether or not the checkout kept the symlinks. Third-party dependencies
+(numpy, pyarrow, ...) stay in the layers listed in each requirements.txt.
+"""
+import argparse
+import os
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_DIR = os.path.join(ROOT, "shared")
+# zip name → (source directory, modules left out); the dashboard zip is the API, not the Streamlit app
+PACKAGES = {
+    "lambda.zip": ("lambda", set()),
+    "dashboard.zip": ("ui", {"saini_dashboard.py"}),
+}
+
+
+def _modules(directory, skip=()):
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(".py") and name not in skip and os.path.isfile(path) and not os.path.islink(path):
+            yield name, path
+
+
+def build(out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    shared = dict(_modules(SHARED_DIR))
+    built = []
+    for zip_name, (source, skip) in PACKAGES.items():
+        modules = dict(_modules(os.path.join(ROOT, source), skip))
+        clash = set(modules) & set(shared)
+        if clash:
+            raise SystemExit(f"❌ {source}/ has its own copy of shared module(s): {sorted(clash)}")
+        target = os.path.join(out_dir, zip_name)
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, path in {**modules, **shared}.items():
+                zf.write(path, arcname=name)
+        print(f"📦 {target}: {len(modules)} modules + {len(shared)} shared")
+        built.append(target)
+    return built
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=os.path.join(ROOT, "dist"), help="output directory (default: dist/)")
+    args = parser.parse_args()
+    build(args.out)
+
+
+if __name__ == "__main__":
+    main()
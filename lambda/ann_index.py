@@ -0,0 +1,256 @@
+"""
+IVF (inverted-file) approximate-nearest-neighbor index over SainiUserVectors.
+
+File layout (little-endian, every section 4-byte aligned):
+    header     magic "SIVF", version, dim, count, nlist, meta_len   (6 × uint32)
+    centroids  float32[nlist, dim]          unit-normalized cluster centers
+    offsets    uint32[nlist + 1]            row range of each inverted list
+    user_idx   uint32[count]                row → position in meta["users"]
+    vectors    float32[count, dim]          unit-normalized, grouped by list
+    meta       utf-8 JSON                   {"users", "rows", "built_at"}
+
+The reader memory-maps the file read-only, so a warm container pays the load once
+and the page cache is shared between invocations.
+"""
+import json
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+
+MAGIC = b"SIVF"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIII")
+DEFAULT_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+
+
+# ===== VECTOR HELPERS =====
+def normalize_rows(matrix):
+    """Scale every row to unit length (zero rows stay zero)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores, best first."""
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    part = np.argpartition(-scores, k)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+# ===== BUILDER =====
+def _train_centroids(vectors, nlist, iterations, seed):
+    """Spherical k-means on a sample of the vectors."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), max(nlist * 64, 4096))
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters so every list stays useful
+                centroids[c] = sample[rng.integers(len(sample))]
+        centroids = normalize_rows(centroids)
+    return centroids.astype(np.float32)
+
+
+def _assign(vectors, centroids, chunk=8192):
+    """Nearest centroid per row, chunked to bound peak memory."""
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        out[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+    return out
+
+
+def build_index(records, path, nlist=None, iterations=10, seed=0, built_at=None):
+    """
+    Build an IVF index file from SainiUserVectors items.
+    Each record needs user_id, timestamp, vector_id and embedding. built_at should be when
+    the records were read: readers treat memories newer than it as missing from the snapshot.
+    """
+    records = [r for r in records if r.get("embedding") is not None and len(r["embedding"])]
+    if not records:
+        raise ValueError("No embeddings to index")
+
+    vectors = normalize_rows(np.asarray(
+        [[float(x) for x in r["embedding"]] for r in records], dtype=np.float32
+    ))
+    count, dim = vectors.shape
+    nlist = nlist or max(1, min(int(np.sqrt(count)), 4096))
+    nlist = min(nlist, count)
+
+    centroids = _train_centroids(vectors, nlist, iterations, seed)
+    assign = _assign(vectors, centroids)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.zeros(nlist + 1, dtype=np.uint32)
+    offsets[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+
+    users = sorted({str(r["user_id"]) for r in records})
+    user_pos = {u: i for i, u in enumerate(users)}
+    user_idx = np.asarray([user_pos[str(records[i]["user_id"])] for i in order], dtype=np.uint32)
+
+    meta = json.dumps({
+        "users": users,
+        "rows": [[str(records[i].get("vector_id", "")), str(records[i]["timestamp"])] for i in order],
+        "built_at": built_at or datetime.utcnow().isoformat(),
+    }).encode("utf-8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, dim, count, nlist, len(meta)))
+        f.write(centroids.astype("<f4").tobytes())
+        f.write(offsets.astype("<u4").tobytes())
+        f.write(user_idx.astype("<u4").tobytes())
+        f.write(vectors[order].astype("<f4").tobytes())
+        f.write(meta)
+    os.replace(tmp_path, path)
+    print(f"✅ ANN index written: {path} (rows={count}, dim={dim}, lists={nlist})")
+    return path
+
+
+# ===== STORAGE =====
+def _split_s3_uri(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def publish_index(local_path, uri):
+    """Copy a built index to its destination (local path or s3://bucket/key)."""
+    if uri.startswith("s3://"):
+        import boto3
+        bucket, key = _split_s3_uri(uri)
+        boto3.client("s3").upload_file(local_path, bucket, key)
+    elif os.path.abspath(uri) != os.path.abspath(local_path):
+        os.replace(local_path, uri)
+    return uri
+
+
+def snapshot_version(uri):
+    """Cheap identity of the published snapshot: S3 ETag, or mtime for a local file."""
+    if not uri.startswith("s3://"):
+        return str(os.stat(uri).st_mtime_ns)
+    import boto3
+    bucket, key = _split_s3_uri(uri)
+    return boto3.client("s3").head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+
+
+def fetch_index(uri, cache_dir="/tmp", version=None):
+    """
+    Return a local path for the index, downloading from S3 when needed. Downloads are
+    cached per ETag, so a republished snapshot is fetched again and older copies are removed.
+    """
+    if not uri.startswith("s3://"):
+        return uri
+    import boto3
+    bucket, key = _split_s3_uri(uri)
+    version = version or snapshot_version(uri)
+    name = os.path.basename(key) or "ann.index"
+    local_path = os.path.join(cache_dir, f"{name}.{version}")
+    if not os.path.exists(local_path):
+        boto3.client("s3").download_file(bucket, key, f"{local_path}.part")
+        os.replace(f"{local_path}.part", local_path)
+    for stale in os.listdir(cache_dir):
+        # Mapped by a previous AnnIndex at most; unlinking keeps the mapping valid
+        if stale.startswith(f"{name}.") and stale != os.path.basename(local_path):
+            os.remove(os.path.join(cache_dir, stale))
+    return local_path
+
+
+# ===== READER =====
+class AnnIndex:
+    """Read-only, memory-mapped view of an IVF index file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, version, dim, count, nlist, meta_len = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Unsupported ANN index file: {path}")
+
+        self.path, self.dim, self.count, self.nlist = path, dim, count, nlist
+        offset = HEADER.size
+        self.centroids = np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=(nlist, dim))
+        offset += nlist * dim * 4
+        self.offsets = np.memmap(path, dtype="<u4", mode="r", offset=offset, shape=(nlist + 1,))
+        offset += (nlist + 1) * 4
+        self.user_idx = np.memmap(path, dtype="<u4", mode="r", offset=offset, shape=(count,))
+        offset += count * 4
+        self.vectors = np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=(count, dim))
+        offset += count * dim * 4
+
+        with open(path, "rb") as f:
+            f.seek(offset)
+            meta = json.loads(f.read(meta_len).decode("utf-8"))
+        self.users = meta["users"]
+        self.rows = meta["rows"]
+        self.built_at = meta.get("built_at")
+        self._user_pos = {u: i for i, u in enumerate(self.users)}
+
+    def covers(self, user_ids):
+        """True when every requested user has vectors in this snapshot."""
+        return all(u in self._user_pos for u in user_ids)
+
+    def _allowed(self, user_ids):
+        if not user_ids:
+            return None
+        return np.asarray([self._user_pos[u] for u in user_ids if u in self._user_pos], dtype=np.uint32)
+
+    def _results(self, rows, scores):
+        return [
+            {
+                "user_id": self.users[int(self.user_idx[r])],
+                "vector_id": self.rows[r][0],
+                "timestamp": self.rows[r][1],
+                "similarity": float(s),
+            }
+            for r, s in zip(rows, scores)
+        ]
+
+    def search(self, query, k=3, user_ids=None, nprobe=DEFAULT_NPROBE):
+        """
+        Approximate top-k by probing the nprobe closest inverted lists. When a user filter
+        leaves fewer than k rows in the probed lists, the filtered users are scored exactly.
+        """
+        q = normalize_rows(np.asarray([query], dtype=np.float32))[0]
+        probes = _top_k(self.centroids @ q, min(nprobe, self.nlist))
+        rows = np.concatenate([
+            np.arange(self.offsets[c], self.offsets[c + 1], dtype=np.int64) for c in probes
+        ])
+        allowed = self._allowed(user_ids)
+        if allowed is not None:
+            rows = rows[np.isin(self.user_idx[rows], allowed)]
+            if len(rows) < k:
+                return self.exact_search(query, k, user_ids)
+        if not len(rows):
+            return []
+        scores = self.vectors[rows] @ q
+        best = _top_k(scores, k)
+        return self._results(rows[best], scores[best])
+
+    def exact_search(self, query, k=3, user_ids=None):
+        """Brute-force top-k over the same snapshot (ground truth for recall)."""
+        q = normalize_rows(np.asarray([query], dtype=np.float32))[0]
+        allowed = self._allowed(user_ids)
+        if allowed is None:
+            rows = np.arange(self.count, dtype=np.int64)
+        else:
+            rows = np.flatnonzero(np.isin(self.user_idx, allowed))
+        if not len(rows):
+            return []
+        scores = self.vectors[rows] @ q
+        best = _top_k(scores, k)
+        return self._results(rows[best], scores[best])
+
+
+def open_index(uri, cache_dir="/tmp", version=None):
+    """Fetch (if remote) and memory-map an index snapshot."""
+    index = AnnIndex(fetch_index(uri, cache_dir, version))
+    index.version = version
+    return index
@@ -0,0 +1,116 @@
+import json
+import os
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+import cold_archive
+import ddb_jobs
+from profiling import profiled
+
+# ===== AWS CONFIGURATION =====
+TABLE_NAME = os.getenv("TABLE_NAME", "SainiCheckins")
+
+# ===== ARCHIVE POLICY =====
+# Check-ins older than this move to the cold Parquet archive (cold_archive.ARCHIVE_URI)
+ARCHIVE_AGE_DAYS = int(os.getenv("ARCHIVE_AGE_DAYS", "180"))
+ARCHIVE_SEGMENTS = int(os.getenv("ARCHIVE_SEGMENTS", "8"))
+# DynamoDB TTL attribute on SainiCheckins; TTL deletes cost no write capacity and show up in
+# the stream as service deletes, so rollups keep counting archived history
+TTL_ATTRIBUTE = os.getenv("TTL_ATTRIBUTE", "expires_at")
+
+def scan_segment(segment: int, total_segments: int, cutoff: str):
+    """Old, not-yet-archived check-ins in one parallel-scan segment."""
+    return list(ddb_jobs.scan_items(
+        TABLE_NAME, Segment=segment, TotalSegments=total_segments,
+        FilterExpression=Attr("timestamp").lt(cutoff) & Attr("archived_at").not_exists(),
+    ))
+
+
+def mark_archived(items, path: str, archived_at: str, expires_at: int):
+    """
+    Hand verified rows to DynamoDB TTL. Until TTL removes them, readers skip hot rows that
+    carry archived_at and serve the archived copy instead.
+    """
+    marked = 0
+    for item in items:
+        try:
+            ddb_jobs.table(TABLE_NAME).update_item(
+                Key={"user_id": item["user_id"], "timestamp": item["timestamp"]},
+                UpdateExpression="SET archived_at = :a, archive_path = :p, #ttl = :e",
+                ConditionExpression="attribute_exists(user_id)",
+                ExpressionAttributeNames={"#ttl": TTL_ATTRIBUTE},
+                ExpressionAttributeValues={":a": archived_at, ":p": path, ":e": expires_at},
+            )
+            marked += 1
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+    return marked
+
+
+def archive_segment(segment: int, total_segments: int, cutoff: str, run_id: str) -> dict:
+    items = scan_segment(segment, total_segments, cutoff)
+    partitions = defaultdict(list)
+    for item in items:
+        partitions[(item["user_id"], cold_archive.month_of(item["timestamp"]))].append(item)
+
+    archived_at = datetime.utcnow().isoformat()
+    stats = {"rows": 0, "partitions": 0, "failed": 0}
+    for (user_id, month), rows in partitions.items():
+        path = cold_archive.write_partition(rows, user_id, month, f"{run_id}-s{segment:03d}")
+        keys = [(r["user_id"], r["timestamp"]) for r in rows]
+        # Nothing leaves the hot table unless the file reads back with every key
+        if not cold_archive.verify_partition(path, keys):
+            print(f"❌ [Archive] Verification failed for {path}; rows left in {TABLE_NAME}")
+            stats["failed"] += len(rows)
+            continue
+        stats["rows"] += mark_archived(rows, path, archived_at, int(time.time()))
+        stats["partitions"] += 1
+    print(f"[Archive] segment {segment}: {stats}")
+    return stats
+
+
+# ===== MAIN LAMBDA HANDLER =====
+@profiled
+def lambda_handler(event, context):
+    """
+    Periodic job (e.g. weekly EventBridge rule): move check-ins older than
+    ARCHIVE_AGE_DAYS into cold Parquet partitions, then expire them from the hot table.
+    Optional event: {"age_days": 365, "segments": 16}.
+    """
+    try:
+        event = event or {}
+        if not cold_archive.ARCHIVE_URI:
+            raise ValueError("ARCHIVE_URI is not configured")
+        age_days = int(event.get("age_days", ARCHIVE_AGE_DAYS))
+        total_segments = int(event.get("segments", ARCHIVE_SEGMENTS))
+        cutoff = (datetime.utcnow() - timedelta(days=age_days)).isoformat()
+        run_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+        with ThreadPoolExecutor(max_workers=total_segments) as pool:
+            results = list(pool.map(lambda seg: archive_segment(seg, total_segments, cutoff, run_id),
+                                    range(total_segments)))
+
+        totals = {key: sum(r[key] for r in results) for key in ("rows", "partitions", "failed")}
+        print(f"✅ Archived check-ins before {cutoff} to {cold_archive.ARCHIVE_URI}: {totals}")
+        return {
+            "statusCode": 200 if not totals["failed"] else 207,
+            "body": json.dumps({"cutoff": cutoff, "run_id": run_id, **totals})
+        }
+
+    except Exception as e:
+        print(f"❌ Error in archive_checkins: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }
+
+
+if __name__ == "__main__":
+    print(lambda_handler({}, None))
@@ -1,67 +1,464 @@
-import boto3, os, json, datetime
+import boto3, os, json, datetime, hashlib, random, time
 from decimal import Decimal
+from botocore.exceptions import ClientError
+
+import batch_inference
+import last_activity
+from model_router import ModelRouter, parse_text, request_body
+from profiling import profiled
 
 # Initialize AWS clients
+REGION = os.environ.get("AWS_REGION", "us-east-2")
 dynamodb = boto3.resource("dynamodb")
 checkins_table = dynamodb.Table(os.environ.get("TABLE_NAME", "SainiCheckins"))
-bedrock = boto3.client("bedrock-runtime", region_name=os.environ.get("AWS_REGION", "us-east-2"))
+bedrock = boto3.client("bedrock-runtime", region_name=REGION)
+lambda_client = boto3.client("lambda", region_name=REGION)
+router = ModelRouter(bedrock, caller="auto_nudge_runner")
 
-def lambda_handler(event, context):
+# ===== SCHEDULER CONFIGURATION =====
+# HASH run_id (UTC day), RANGE entry:
+#   "shard#NNN"  checkpoint → users, cursor, status (pending/running/done), lease_until
+#   "sent#<uid>" dedup marker → status (claimed/sent), claimed_at
+RUNS_TABLE = os.environ.get("NUDGE_RUNS_TABLE", "SainiNudgeRuns")
+runs_table = dynamodb.Table(RUNS_TABLE)
+versions_table = dynamodb.Table(os.environ.get("VERSION_TABLE", "SainiChangeVersions"))
+NUDGE_SHARDS = int(os.environ.get("NUDGE_SHARDS", "16"))
+INACTIVE_DAYS = int(os.environ.get("NUDGE_INACTIVE_DAYS", "2"))
+# Nudges only go out between these UTC hours (start inclusive, end exclusive)
+SEND_WINDOW_START = int(os.environ.get("NUDGE_WINDOW_START_HOUR", "14"))
+SEND_WINDOW_END = int(os.environ.get("NUDGE_WINDOW_END_HOUR", "22"))
+# The coordinator runs every few minutes inside the window and starts at most this many shards
+# per tick; each worker spaces its Bedrock calls, so load is spread across the window
+MAX_SHARDS_PER_TICK = int(os.environ.get("NUDGE_SHARDS_PER_TICK", "4"))
+NUDGE_INTERVAL_SECONDS = float(os.environ.get("NUDGE_INTERVAL_SECONDS", "1.5"))
+SHARD_LEASE_SECONDS = int(os.environ.get("NUDGE_SHARD_LEASE_SECONDS", "960"))
+# Stop (and checkpoint) this long before the Lambda timeout
+TIMEOUT_MARGIN_MS = 20_000
+RUN_RETENTION_DAYS = 7
+# "realtime" (one invoke_model per user, sharded) or "batch" (one batch-inference job per day)
+NUDGE_MODE = os.environ.get("NUDGE_MODE", "realtime")
+# Bedrock batch jobs have a minimum record count; smaller days go through the realtime path
+BATCH_MIN_RECORDS = int(os.environ.get("NUDGE_BATCH_MIN_RECORDS", "100"))
+FALLBACK_NUDGE = "Just checking in gently 💬"
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+def shard_of(user_id, shards=NUDGE_SHARDS):
+    return int(hashlib.sha1(str(user_id).encode("utf-8")).hexdigest()[:8], 16) % shards
+
+
+def in_send_window(now=None):
+    hour = (now or _now()).hour
+    if SEND_WINDOW_START <= SEND_WINDOW_END:
+        return SEND_WINDOW_START <= hour < SEND_WINDOW_END
+    return hour >= SEND_WINDOW_START or hour < SEND_WINDOW_END
+
+
+# ===== INACTIVE USERS =====
+def find_inactive_users(now):
+    """Users whose most recent check-in (auto nudges included) is older than INACTIVE_DAYS."""
+    cutoff = (now - datetime.timedelta(days=INACTIVE_DAYS)).isoformat()
+    # One query on the last-activity GSI rather than a scan of every check-in
+    return sorted(last_activity.user_ids(versions_table, before=cutoff))
+
+
+# ===== CHECKPOINTS =====
+def _shard_key(run_id, shard):
+    return {"run_id": run_id, "entry": f"shard#{shard:03d}"}
+
+
+def plan_run(run_id, now):
+    """Create the day's shard checkpoints once; later ticks reuse them."""
+    # The last shard is written last, so a plan interrupted halfway is completed next tick
+    existing = runs_table.get_item(Key=_shard_key(run_id, NUDGE_SHARDS - 1), ConsistentRead=True).get("Item")
+    if existing:
+        return False
+    users = find_inactive_users(now)
+    shards = [[] for _ in range(NUDGE_SHARDS)]
+    for uid in users:
+        shards[shard_of(uid)].append(uid)
+    expires_at = int(time.time()) + RUN_RETENTION_DAYS * 86400
+    for shard, members in enumerate(shards):
+        try:
+            runs_table.put_item(
+                Item={**_shard_key(run_id, shard), "users": members, "cursor": 0,
+                      "status": "done" if not members else "pending", "expires_at": expires_at},
+                ConditionExpression="attribute_not_exists(run_id)",
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+    print(f"[AUTO_NUDGE] Planned {run_id}: {len(users)} inactive users in {NUDGE_SHARDS} shards")
+    return True
+
+
+def lease_shard(run_id, shard, now_epoch):
+    """Take a pending shard (or one whose worker died) — false if someone else holds it."""
+    try:
+        runs_table.update_item(
+            Key=_shard_key(run_id, shard),
+            UpdateExpression="SET #s = :running, lease_until = :lease",
+            ConditionExpression="#s <> :done AND (attribute_not_exists(lease_until) OR lease_until < :now)",
+            ExpressionAttributeNames={"#s": "status"},
+            ExpressionAttributeValues={":running": "running", ":done": "done",
+                                       ":lease": now_epoch + SHARD_LEASE_SECONDS, ":now": now_epoch},
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+
+
+def save_cursor(run_id, shard, cursor, status="running"):
+    """Checkpoint progress; leaving "running" also releases the lease for the next tick."""
+    update = "SET #c = :c, #s = :s" + ("" if status == "running" else " REMOVE lease_until")
+    runs_table.update_item(
+        Key=_shard_key(run_id, shard),
+        UpdateExpression=update,
+        ExpressionAttributeNames={"#c": "cursor", "#s": "status"},
+        ExpressionAttributeValues={":c": cursor, ":s": status},
+    )
+
+
+# ===== PER-USER DEDUP =====
+def claim_user(run_id, user_id, now_epoch, status="claimed"):
+    """
+    One nudge per user per day: claim before calling Bedrock, mark sent after writing.
+    A claim older than the shard lease (worker died mid-send) can be taken over.
+    """
+    try:
+        runs_table.put_item(
+            Item={"run_id": run_id, "entry": f"sent#{user_id}", "status": status, "claimed_at": now_epoch,
+                  "expires_at": now_epoch + RUN_RETENTION_DAYS * 86400},
+            ConditionExpression="attribute_not_exists(run_id) OR (#s = :claimed AND claimed_at < :stale)",
+            ExpressionAttributeNames={"#s": "status"},
+            ExpressionAttributeValues={":claimed": "claimed", ":stale": now_epoch - SHARD_LEASE_SECONDS},
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+
+
+def mark_sent(run_id, user_id):
+    runs_table.update_item(
+        Key={"run_id": run_id, "entry": f"sent#{user_id}"},
+        UpdateExpression="SET #s = :sent",
+        ExpressionAttributeNames={"#s": "status"},
+        ExpressionAttributeValues={":sent": "sent"},
+    )
+
+
+# ===== NUDGE =====
+def nudge_prompt(uid):
+    return [{"role": "user", "content": f"Write a short, supportive daily check-in message for user {uid} who hasn’t checked in for 2 days. Keep it warm, brief, and encouraging."}]
+
+
+def nudge_request(uid, model_id):
+    """Model request body for one nudge (batch records use the same prompt as realtime calls)."""
+    return request_body(model_id, nudge_prompt(uid), max_tokens=150, temperature=0.7)
+
+
+def parse_nudge(model_id, result):
+    return parse_text(model_id, result or {}) or FALLBACK_NUDGE
+
+
+def generate_nudge(uid):
+    try:
+        text, _ = router.generate(nudge_prompt(uid), tier="Auto", max_tokens=150, temperature=0.7)
+        return text or FALLBACK_NUDGE
+    except Exception as e:
+        return f"{FALLBACK_NUDGE} (fallback due to {str(e)[:50]})"
+
+
+def nudge_item(uid, msg):
+    return {
+        "user_id": uid,
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "message": "[AUTO] Daily nudge",
+        "tier": "Auto",
+        "response": msg,
+        "is_auto": True
+    }
+
+
+def send_nudge(uid):
+    msg = generate_nudge(uid)
+    # Log auto-nudge in DynamoDB
+    checkins_table.put_item(Item=nudge_item(uid, msg))
+
+
+# ===== WORKER =====
+def run_shard(run_id, shard, context=None, force=False):
+    """Nudge one shard's users from its checkpointed cursor; stops early before a timeout."""
+    item = runs_table.get_item(Key=_shard_key(run_id, shard), ConsistentRead=True).get("Item") or {}
+    users, cursor = item.get("users", []), int(item.get("cursor", 0))
+    sent = skipped = 0
+
+    while cursor < len(users):
+        if context is not None and context.get_remaining_time_in_millis() < TIMEOUT_MARGIN_MS:
+            save_cursor(run_id, shard, cursor, "pending")
+            print(f"[AUTO_NUDGE] {run_id} shard {shard}: paused at {cursor}/{len(users)}")
+            return {"shard": shard, "sent": sent, "skipped": skipped, "done": False}
+        if not force and not in_send_window():
+            save_cursor(run_id, shard, cursor, "pending")
+            print(f"[AUTO_NUDGE] {run_id} shard {shard}: send window closed at {cursor}/{len(users)}")
+            return {"shard": shard, "sent": sent, "skipped": skipped, "done": False}
+
+        uid = users[cursor]
+        if claim_user(run_id, uid, int(time.time())):
+            send_nudge(uid)
+            mark_sent(run_id, uid)
+            sent += 1
+            # Stagger Bedrock calls (with jitter so parallel shards don't align)
+            time.sleep(NUDGE_INTERVAL_SECONDS * random.uniform(0.75, 1.25))
+        else:
+            skipped += 1
+        cursor += 1
+        save_cursor(run_id, shard, cursor)
+
+    save_cursor(run_id, shard, cursor, "done")
+    print(f"[AUTO_NUDGE] {run_id} shard {shard}: done ({sent} sent, {skipped} already nudged)")
+    return {"shard": shard, "sent": sent, "skipped": skipped, "done": True}
+
+
+# ===== COORDINATOR =====
+def coordinate(run_id, now, context=None, force=False):
+    """Start up to MAX_SHARDS_PER_TICK unfinished shards whose lease is free."""
+    plan_run(run_id, now)
+    now_epoch = int(time.time())
+    started, remaining = [], 0
+    for shard in range(NUDGE_SHARDS):
+        item = runs_table.get_item(Key=_shard_key(run_id, shard), ConsistentRead=True).get("Item") or {}
+        if item.get("status") == "done":
+            continue
+        remaining += 1
+        if len(started) >= MAX_SHARDS_PER_TICK or not lease_shard(run_id, shard, now_epoch):
+            continue
+        started.append(shard)
+        payload = {"mode": "worker", "run_id": run_id, "shard": shard, "force": force}
+        if context is None:
+            # Local run: no function to fan out to, so work inline
+            run_shard(run_id, shard, force=force)
+        else:
+            lambda_client.invoke(FunctionName=context.function_name, InvocationType="Event",
+                                 Payload=json.dumps(payload).encode("utf-8"))
+    print(f"[AUTO_NUDGE] {run_id}: started shards {started}, {remaining} unfinished")
+    return {"run_id": run_id, "started_shards": started, "unfinished_shards": remaining}
+
+
+# ===== BATCH MODE =====
+def _batch_key(run_id):
+    return {"run_id": run_id, "entry": "batch"}
+
+
+def _record_id(uid):
+    return hashlib.sha1(str(uid).encode("utf-8")).hexdigest()[:11]
+
+
+def _planned_users(run_id):
+    """{shard: users} from the day's checkpoints, skipping shards already finished."""
+    planned = {}
+    for shard in range(NUDGE_SHARDS):
+        item = runs_table.get_item(Key=_shard_key(run_id, shard), ConsistentRead=True).get("Item") or {}
+        if item.get("status") != "done" and item.get("users"):
+            planned[shard] = item["users"]
+    return planned
+
+
+def batch_model_id():
+    """The routing policy's preferred model for auto nudges (latency doesn't matter for batch)."""
+    _, candidates, _ = router.route("Auto")
+    return candidates[0]
+
+
+def submit_batch(run_id):
+    """Write every planned user's prompt into one batch job (at most once per run)."""
+    users = [uid for members in _planned_users(run_id).values() for uid in members]
+    if len(users) < BATCH_MIN_RECORDS:
+        return None
+    model_id = batch_model_id()
     try:
-        # 1️⃣ Find users who haven’t checked in for 2+ days
-        all_items = checkins_table.scan()["Items"]
-        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=2)
-        inactive_users = {}
-        for item in all_items:
-            try:
-                ts = datetime.datetime.fromisoformat(item["timestamp"])
-                if ts < cutoff:
-                    inactive_users[item["user_id"]] = item
-            except Exception:
+        runs_table.put_item(
+            Item={**_batch_key(run_id), "status": "submitting", "submitted_at": int(time.time()),
+                  "model_id": model_id,
+                  "expires_at": int(time.time()) + RUN_RETENTION_DAYS * 86400},
+            ConditionExpression="attribute_not_exists(run_id)",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return "already submitted"
+        raise
+    records = [{"recordId": _record_id(uid), "modelInput": nudge_request(uid, model_id)} for uid in users]
+    job_id = batch_inference.get_backend(model_id).submit(records, f"saini-nudges-{run_id}-{int(time.time())}")
+    runs_table.update_item(
+        Key=_batch_key(run_id),
+        UpdateExpression="SET #s = :s, job_id = :j, record_count = :n",
+        ExpressionAttributeNames={"#s": "status"},
+        ExpressionAttributeValues={":s": "submitted", ":j": job_id, ":n": len(records)},
+    )
+    print(f"[AUTO_NUDGE] {run_id}: submitted batch job {job_id} ({model_id}) with {len(records)} prompts")
+    return job_id
+
+
+def requeue_shard(run_id, shard, users):
+    """Point a shard at just these users again (pending, cursor 0) for the realtime path."""
+    runs_table.update_item(
+        Key=_shard_key(run_id, shard),
+        UpdateExpression="SET #u = :u, #c = :zero, #s = :pending REMOVE lease_until",
+        ExpressionAttributeNames={"#u": "users", "#c": "cursor", "#s": "status"},
+        ExpressionAttributeValues={":u": users, ":zero": 0, ":pending": "pending"},
+    )
+
+
+def ingest_batch(run_id, job_id, model_id, backend, send_day=None):
+    """
+    Read the job's output and write every nudge in one bulk pass. Nudges are deduped on the
+    day they are actually sent (send_day, default run_id): a batch ingested a day late must
+    not double up with the new day's run. Users the output leaves out (PartiallyCompleted
+    jobs) go back to their shards for the realtime path — on a late ingest, the new day's
+    plan already holds them, since they are still inactive.
+    """
+    send_day = send_day or run_id
+    planned = _planned_users(run_id)
+    by_record = {_record_id(uid): uid for members in planned.values() for uid in members}
+    now_epoch, written, failed = int(time.time()), 0, 0
+    seen = set()
+
+    with checkins_table.batch_writer() as batch:
+        for record_id, output, error in backend.results(job_id):
+            uid = by_record.get(record_id)
+            if uid is None:
                 continue
+            seen.add(uid)
+            if error:
+                failed += 1
+            # Claimed as sent up front: a crash mid-ingest can miss a nudge, never double it
+            if claim_user(send_day, uid, now_epoch, status="sent"):
+                batch.put_item(Item=nudge_item(uid, FALLBACK_NUDGE if error else parse_nudge(model_id, output)))
+                written += 1
+
+    missing = 0
+    for shard, members in planned.items():
+        leftover = [uid for uid in members if uid not in seen]
+        if leftover and send_day == run_id:
+            requeue_shard(run_id, shard, leftover)
+        else:
+            save_cursor(run_id, shard, len(members), "done")
+        missing += len(leftover)
+    runs_table.update_item(
+        Key=_batch_key(run_id),
+        UpdateExpression="SET #s = :s, written = :w, missing = :m",
+        ExpressionAttributeNames={"#s": "status"},
+        ExpressionAttributeValues={":s": "ingested", ":w": written, ":m": missing},
+    )
+    print(f"[AUTO_NUDGE] {run_id}: ingested batch {job_id}: {written} nudges written, "
+          f"{failed} records errored, {missing} missing from the output")
+    return {"run_id": run_id, "batch_job": job_id, "written": written, "errored": failed, "missing": missing}
+
+
+def coordinate_batch(run_id, now, context=None, ingest=True, force=False, send_day=None):
+    """
+    Batch-mode tick: plan the day, submit one batch job, then poll it on later ticks and
+    ingest the output (inside the send window). Days below BATCH_MIN_RECORDS, failed jobs,
+    stuck submissions and users missing from the output fall back to the realtime shards.
+    A previous day's run (send_day later than run_id) only finishes its job: anything it
+    would hand to the realtime shards is left to send_day's own run.
+    """
+    send_day = send_day or run_id
+
+    def realtime():
+        if not ingest:
+            return {"run_id": run_id, "waiting": "send window"}
+        if send_day != run_id:
+            return {"run_id": run_id, "status": "left to " + send_day}
+        return coordinate(run_id, now, context, force)
+
+    plan_run(run_id, now)
+    job = runs_table.get_item(Key=_batch_key(run_id), ConsistentRead=True).get("Item")
+
+    if job is None:
+        submitted = submit_batch(run_id)
+        if submitted is None:
+            return realtime()
+        return {"run_id": run_id, "batch_job": submitted}
+
+    status = job.get("status")
+    if status == "ingested":
+        # Users the job's output left out are finished by the realtime shards
+        if job.get("missing") and _planned_users(run_id):
+            return realtime()
+        return {"run_id": run_id, "batch_job": job.get("job_id"), "status": status}
+    if status == "submitting":
+        # A coordinator that died between claiming and submitting leaves this behind
+        if int(time.time()) - int(job.get("submitted_at", 0)) <= SHARD_LEASE_SECONDS:
+            return {"run_id": run_id, "status": status}
+        status = "failed"
+    elif status != "failed":
+        backend = batch_inference.get_backend(job["model_id"])
+        state = backend.status(job["job_id"])
+        if state in batch_inference.FAILED_STATES:
+            status = "failed"
+            runs_table.update_item(Key=_batch_key(run_id), UpdateExpression="SET #s = :s",
+                                   ExpressionAttributeNames={"#s": "status"}, ExpressionAttributeValues={":s": status})
+        elif state not in batch_inference.DONE_STATES:
+            return {"run_id": run_id, "batch_job": job["job_id"], "status": state}
+        elif not ingest:
+            return {"run_id": run_id, "batch_job": job["job_id"], "status": state, "waiting": "send window"}
+        else:
+            result = ingest_batch(run_id, job["job_id"], job["model_id"], backend, send_day)
+            if result["missing"] and send_day == run_id:
+                result["realtime"] = coordinate(run_id, now, context, force)
+            return result
 
-        # 2️⃣ Generate supportive nudges using Bedrock Nova model
-        for uid in inactive_users:
-            prompt = f"Write a short, supportive daily check-in message for user {uid} who hasn’t checked in for 2 days. Keep it warm, brief, and encouraging."
-            body = json.dumps({
-                "inputText": prompt,
-                "textGenerationConfig": {
-                    "temperature": 0.7,
-                    "maxTokenCount": 150
-                }
-            })
-            
-            try:
-                response = bedrock.invoke_model(
-                    modelId="amazon.nova-pro-v1:0",
-                    body=body,
-                    contentType="application/json",
-                    accept="application/json"
-                )
-                result = json.loads(response["body"].read())
-                msg = result.get("outputText", "Just checking in gently 💬")
-            except Exception as e:
-                msg = f"Just checking in gently 💬 (fallback due to {str(e)[:50]})"
-
-            # 3️⃣ Log auto-nudge in DynamoDB
-            checkins_table.put_item(Item={
-                "user_id": uid,
-                "timestamp": datetime.datetime.utcnow().isoformat(),
-                "message": "[AUTO] Daily nudge",
-                "tier": "Auto",
-                "response": msg,
-                "is_auto": True
-            })
-
-        print(f"[AUTO_NUDGE] Sent nudges to: {list(inactive_users.keys())}")
-        return {
-            "statusCode": 200,
-            "body": json.dumps({
-                "nudged_users": list(inactive_users.keys()),
-                "count": len(inactive_users)
-            })
-        }
+    print(f"[AUTO_NUDGE] {run_id}: batch job unavailable, falling back to realtime shards")
+    return realtime()
+
+
+@profiled
+def lambda_handler(event, context):
+    """
+    Scheduled (e.g. every 10 minutes) as the coordinator; re-invokes itself asynchronously
+    with {"mode": "worker", "run_id", "shard"} for each shard it starts. A run is one UTC day:
+    shards that time out or fail keep their cursor and are picked up again by a later tick.
+    With NUDGE_MODE=batch (or {"mode": "batch"}) the day goes through one batch-inference job.
+    """
+    try:
+        event = event or {}
+        if event.get("mode") == "worker":
+            result = run_shard(event["run_id"], int(event["shard"]), context, bool(event.get("force")))
+            return {"statusCode": 200, "body": json.dumps(result)}
+
+        now = _now()
+        force = bool(event.get("force"))
+        if (event.get("mode") or NUDGE_MODE) == "batch":
+            # Submitting and polling can happen any time; nudges are only written in the window
+            ingest = force or in_send_window(now)
+            today = now.strftime("%Y-%m-%d")
+            yesterday = (now - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+            if runs_table.get_item(Key=_batch_key(yesterday)).get("Item", {}).get("status") not in (None, "ingested", "failed"):
+                # Nudges from a late job go out today, so they are deduped against today's markers
+                result = coordinate_batch(yesterday, now, context, ingest, force, send_day=today)
+                print(f"[AUTO_NUDGE] Previous day's batch: {result}")
+            result = coordinate_batch(event.get("run_id") or today, now, context, ingest, force)
+            return {"statusCode": 200, "body": json.dumps(result, default=str)}
+
+        if not in_send_window(now) and not force:
+            print(f"[AUTO_NUDGE] Outside send window ({SEND_WINDOW_START}:00–{SEND_WINDOW_END}:00 UTC)")
+            return {"statusCode": 200, "body": json.dumps({"skipped": "outside send window"})}
+
+        result = coordinate(event.get("run_id") or now.strftime("%Y-%m-%d"), now, context, force)
+        return {"statusCode": 200, "body": json.dumps(result)}
 
     except Exception as e:
         print(f"[ERROR] {str(e)}")
         return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
+
+
+if __name__ == "__main__":
+    print(lambda_handler({"force": True}, None))
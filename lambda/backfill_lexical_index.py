@@ -0,0 +1,99 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+import ddb_jobs
+import lexical_index
+from profiling import profiled
+
+# ===== AWS CONFIGURATION =====
+VECTORS_TABLE = os.getenv("VECTOR_TABLE", "SainiUserVectors")
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "8"))
+REINDEX_ATTEMPTS = 3
+
+
+def _tables():
+    return ddb_jobs.table(VECTORS_TABLE), ddb_jobs.table(lexical_index.TERM_INDEX_TABLE)
+
+
+def load_memories(user_id: str):
+    """One user's memories without embeddings (the index only needs the text)."""
+    return ddb_jobs.load_memories(
+        VECTORS_TABLE, user_id,
+        ProjectionExpression="#ts, message, #resp, content_hash",
+        ExpressionAttributeNames={"#ts": "timestamp", "#resp": "response"},
+    )
+
+
+# ===== PER-USER BACKFILL =====
+def backfill_user(user_id: str) -> dict:
+    """Rebuild the user's BM25 index and register dedup markers for older memories."""
+    _, terms = _tables()
+    for _ in range(REINDEX_ATTEMPTS):
+        # Counters first: a memory indexed after this read makes reindex_user return None
+        stats = lexical_index.read_stats(terms, user_id)
+        memories = load_memories(user_id)
+        indexed = lexical_index.reindex_user(terms, user_id, memories, stats)
+        if indexed is not None:
+            break
+        print(f"[Backfill] {user_id}: memories changed during reindex, retrying")
+    else:
+        raise RuntimeError(f"index kept changing over {REINDEX_ATTEMPTS} attempts")
+
+    markers = 0
+    for item in memories:
+        digest = item.get("content_hash") or lexical_index.content_hash(
+            item.get("message", ""), item.get("response", ""))
+        try:
+            # Only fills gaps: a marker already pointing at a surviving memory is kept
+            terms.put_item(
+                Item={"user_id": user_id, "entry": f"h#{digest}", "doc_key": item["timestamp"]},
+                ConditionExpression="attribute_not_exists(entry)",
+            )
+            markers += 1
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+    return {"memories": len(memories), "indexed": indexed, "markers": markers}
+
+
+# ===== MAIN LAMBDA HANDLER =====
+@profiled
+def lambda_handler(event, context):
+    """
+    One-off job after deploying hybrid retrieval: index memories written before
+    SainiTermIndex existed. Idempotent; optional event: {"user_ids": [...]}.
+    """
+    try:
+        event = event or {}
+        user_ids = event.get("user_ids") or ddb_jobs.list_users(VECTORS_TABLE)
+
+        def run(uid):
+            try:
+                return backfill_user(uid)
+            except Exception as e:
+                print(f"⚠️ Backfill failed for {uid}: {e}")
+                return {"memories": 0, "indexed": 0, "markers": 0, "failed": 1}
+
+        with ThreadPoolExecutor(max_workers=BACKFILL_WORKERS) as pool:
+            results = list(pool.map(run, user_ids))
+
+        totals = {key: sum(r.get(key, 0) for r in results) for key in ("memories", "indexed", "markers", "failed")}
+        print(f"✅ Lexical backfill complete for {len(user_ids)} users: {totals}")
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"users": len(user_ids), **totals})
+        }
+
+    except Exception as e:
+        print(f"❌ Error in backfill_lexical_index: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }
+
+
+if __name__ == "__main__":
+    print(lambda_handler({}, None))
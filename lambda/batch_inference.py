@@ -0,0 +1,139 @@
+"""
+Pluggable batch-inference backends for non-interactive generation (auto nudges).
+
+Records follow the Bedrock batch format, one JSON object per line:
+    input   {"recordId": "...", "modelInput": {...model request body...}}
+    output  {"recordId": "...", "modelInput": {...}, "modelOutput": {...}}  or  {..., "error": {...}}
+
+    backend = get_backend()                      # NUDGE_BATCH_BACKEND = bedrock | local
+    job_id = backend.submit(records, "nudges-2025-10-19")
+    backend.status(job_id)                       # "InProgress" | "Completed" | "Failed"
+    for record_id, output, error in backend.results(job_id): ...
+"""
+import json
+import os
+from abc import ABC, abstractmethod
+
+BATCH_BACKEND = os.getenv("NUDGE_BATCH_BACKEND", "bedrock")
+BATCH_BUCKET = os.getenv("BATCH_BUCKET", "")
+BATCH_PREFIX = os.getenv("BATCH_PREFIX", "nudge-batches/")
+BATCH_ROLE_ARN = os.getenv("BATCH_ROLE_ARN", "")
+LOCAL_BATCH_DIR = os.getenv("LOCAL_BATCH_DIR", "/tmp/nudge_batches")
+
+DONE_STATES = {"Completed", "PartiallyCompleted"}
+FAILED_STATES = {"Failed", "Stopped", "Expired"}
+
+
+def to_jsonl(records) -> bytes:
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+
+
+def parse_output_lines(lines):
+    """Yield (record_id, model_output or None, error or None) from output JSONL lines."""
+    for line in lines:
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        yield row.get("recordId"), row.get("modelOutput"), row.get("error")
+
+
+class BatchBackend(ABC):
+    """Interface: submit JSONL records, poll, read results."""
+
+    @abstractmethod
+    def submit(self, records, job_name: str) -> str:
+        """Start a job over the records; returns its job id."""
+
+    @abstractmethod
+    def status(self, job_id: str) -> str:
+        """Job state, e.g. "InProgress" or one of DONE_STATES / FAILED_STATES."""
+
+    @abstractmethod
+    def results(self, job_id: str):
+        """Yield (record_id, model_output or None, error or None) for a finished job."""
+
+
+class BedrockBatchBackend(BatchBackend):
+    """Bedrock model-invocation jobs with S3 input/output (needs a service role for Bedrock)."""
+
+    def __init__(self, model_id, bucket=BATCH_BUCKET, prefix=BATCH_PREFIX, role_arn=BATCH_ROLE_ARN, region=None):
+        import boto3
+        if not bucket or not role_arn:
+            raise ValueError("BATCH_BUCKET and BATCH_ROLE_ARN are required for Bedrock batch inference")
+        region = region or os.getenv("AWS_REGION", "us-east-2")
+        self.model_id, self.bucket, self.prefix, self.role_arn = model_id, bucket, prefix, role_arn
+        self.s3 = boto3.client("s3", region_name=region)
+        self.bedrock = boto3.client("bedrock", region_name=region)
+
+    def submit(self, records, job_name):
+        key = f"{self.prefix}{job_name}/input.jsonl"
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=to_jsonl(records))
+        resp = self.bedrock.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self.role_arn,
+            modelId=self.model_id,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{self.bucket}/{key}"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{self.bucket}/{self.prefix}{job_name}/output/"}},
+        )
+        return resp["jobArn"]
+
+    def status(self, job_id):
+        return self.bedrock.get_model_invocation_job(jobIdentifier=job_id)["status"]
+
+    def results(self, job_id):
+        job = self.bedrock.get_model_invocation_job(jobIdentifier=job_id)
+        output_uri = job["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"]
+        bucket, _, prefix = output_uri[len("s3://"):].partition("/")
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                if not obj["Key"].endswith(".jsonl.out"):
+                    continue
+                body = self.s3.get_object(Bucket=bucket, Key=obj["Key"])["Body"]
+                yield from parse_output_lines(line.decode("utf-8") for line in body.iter_lines())
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    Filesystem stand-in for tests and local runs: submit writes input.jsonl and immediately
+    "completes" by writing input.jsonl.out with respond(model_input) for each record.
+    """
+
+    def __init__(self, directory=LOCAL_BATCH_DIR, respond=None):
+        self.directory = directory
+        self.respond = respond or (lambda model_input: {"outputText": "Just checking in gently 💬"})
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    def submit(self, records, job_name):
+        job_dir = self._job_dir(job_name)
+        os.makedirs(job_dir, exist_ok=True)
+        records = list(records)
+        with open(os.path.join(job_dir, "input.jsonl"), "wb") as f:
+            f.write(to_jsonl(records))
+        outputs = []
+        for r in records:
+            try:
+                outputs.append({**r, "modelOutput": self.respond(r["modelInput"])})
+            except Exception as e:
+                outputs.append({**r, "error": {"errorMessage": str(e)}})
+        with open(os.path.join(job_dir, "input.jsonl.out"), "wb") as f:
+            f.write(to_jsonl(outputs))
+        return job_name
+
+    def status(self, job_id):
+        return "Completed" if os.path.exists(os.path.join(self._job_dir(job_id), "input.jsonl.out")) else "Failed"
+
+    def results(self, job_id):
+        with open(os.path.join(self._job_dir(job_id), "input.jsonl.out"), encoding="utf-8") as f:
+            yield from parse_output_lines(f)
+
+
+def get_backend(model_id, name=None, **kwargs) -> BatchBackend:
+    name = (name or BATCH_BACKEND).lower()
+    if name == "local":
+        return LocalBatchBackend(**kwargs)
+    if name == "bedrock":
+        return BedrockBatchBackend(model_id, **kwargs)
+    raise ValueError(f"Unknown batch backend: {name}")
@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import ddb_jobs
+from ann_index import build_index, publish_index
+from profiling import profiled
+
+# ===== AWS CONFIGURATION =====
+VECTORS_TABLE = os.getenv("VECTOR_TABLE", "SainiUserVectors")
+# Local path or s3://bucket/key — the same value retrieve_memory reads from
+ANN_INDEX_URI = os.getenv("ANN_INDEX_URI", "/tmp/saini_vectors.ivf")
+TOTAL_SEGMENTS = int(os.getenv("ANN_BUILD_SEGMENTS", "8"))
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", "1024"))
+
+def scan_segment(segment: int, total_segments: int):
+    """Read one parallel-scan segment of the vectors table."""
+    return list(ddb_jobs.scan_items(
+        VECTORS_TABLE, Segment=segment, TotalSegments=total_segments,
+        ProjectionExpression="user_id, #ts, vector_id, embedding",
+        ExpressionAttributeNames={"#ts": "timestamp"},
+    ))
+
+
+# ===== MAIN LAMBDA HANDLER =====
+@profiled
+def lambda_handler(event, context):
+    """Offline job: snapshot SainiUserVectors into an IVF index file."""
+    try:
+        event = event or {}
+        total_segments = int(event.get("segments", TOTAL_SEGMENTS))
+        uri = event.get("index_uri", ANN_INDEX_URI)
+
+        # Taken before the scan: memories written while it runs count as newer than the snapshot
+        built_at = datetime.utcnow().isoformat()
+        with ThreadPoolExecutor(max_workers=total_segments) as pool:
+            segments = pool.map(lambda seg: scan_segment(seg, total_segments), range(total_segments))
+            records = [item for seg in segments for item in seg]
+        # Only index vectors at the configured dimension (others await reembed_memory.py)
+        records = [r for r in records if len(r.get("embedding", [])) == EMBED_DIMENSIONS]
+        print(f"[AnnBuild] Loaded {len(records)} vectors ({EMBED_DIMENSIONS}-d) from {VECTORS_TABLE}")
+
+        local_path = uri
+        if uri.startswith("s3://"):
+            local_path = os.path.join(tempfile.gettempdir(), "saini_vectors.ivf")
+        build_index(records, local_path, nlist=event.get("nlist"), built_at=built_at)
+        publish_index(local_path, uri)
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"index_uri": uri, "vectors": len(records)})
+        }
+
+    except Exception as e:
+        print(f"❌ Error in build_ann_index: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }
+
+
+if __name__ == "__main__":
+    print(lambda_handler({}, None))
@@ -1,8 +1,17 @@
+import base64
 import json
 import boto3
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from classify_state import classify_user_state
+from profiling import profiled
+
 # ===== AWS CONFIGURATION =====
 REGION_LOCAL = "us-east-2"          # main region (Lambda + DynamoDB)
 REGION_REMOTE = "us-east-1"         # Claude model region
@@ -10,15 +19,366 @@ REGION_REMOTE = "us-east-1"         # Claude model region
 # Clients
 bedrock = boto3.client("bedrock-runtime", region_name=REGION_LOCAL)
 lambda_client = boto3.client("lambda", region_name=REGION_REMOTE)
+# Async check-ins re-invoke this function in its own region
+self_client = boto3.client("lambda", region_name=REGION_LOCAL)
 dynamodb = boto3.resource("dynamodb", region_name=REGION_LOCAL)
 
 # Tables
 TABLE_NAME = os.getenv("TABLE_NAME", "SainiCheckins")
 table = dynamodb.Table(TABLE_NAME)
+# Async check-ins in flight: HASH user_id, RANGE timestamp (the row's future key), TTL expires_at
+JOBS_TABLE_NAME = os.getenv("CHECKIN_JOBS_TABLE", "SainiCheckinJobs")
+jobs_table = dynamodb.Table(JOBS_TABLE_NAME)
+
+# ===== ASYNC CHECK-INS =====
+# POST /checkin with "Prefer: respond-async" records a pending job and answers 202 with a
+# checkin_id; generation runs in a background invocation that writes the finished row to
+# SainiCheckins once, and GET /checkin/{id}?wait=N long-polls for it. SainiCheckins never holds
+# a half-written row, so readers that sync on timestamp (the dashboard) can't miss its completion.
+# Waits stay well under API Gateway's 29 s integration timeout.
+CHECKIN_MAX_WAIT_S = float(os.getenv("CHECKIN_MAX_WAIT_S", "20"))
+# A job pending this long means the background invocation was lost
+CHECKIN_PENDING_TIMEOUT_S = int(os.getenv("CHECKIN_PENDING_TIMEOUT_S", "120"))
+CHECKIN_JOB_TTL_S = 86400
+FALLBACK_REFLECTION = "No reflection generated."
+
+# ===== TIER-AWARE SCHEDULING =====
+# Critical check-ins skip the cross-region conversational Lambda: a short direct Bedrock call
+# on clients created at init (kept warm by {"warmup": true} pings), hedged to a second region,
+# and a fixed safe response if neither answers inside the deadline.
+CRITICAL_MODEL_ID = os.getenv("CRITICAL_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0")
+CRITICAL_DEADLINE_MS = int(os.getenv("CRITICAL_DEADLINE_MS", "2500"))
+CRITICAL_HEDGE_AFTER_MS = int(os.getenv("CRITICAL_HEDGE_AFTER_MS", "800"))
+CRITICAL_MAX_TOKENS = int(os.getenv("CRITICAL_MAX_TOKENS", "120"))
+# Latency target per tier (ms) — reported as WithinSLO in the metrics
+TIER_SLO_MS = {"Critical": CRITICAL_DEADLINE_MS, "At-Risk": 8000, "Stirred": 10000, "Stable": 10000}
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "Sainte/CheckIn")
+
+# No SDK retries: the hedge is the retry, and a retry would blow the deadline
+_fast_config = Config(connect_timeout=1, read_timeout=CRITICAL_DEADLINE_MS / 1000,
+                      retries={"max_attempts": 0}, tcp_keepalive=True)
+critical_clients = [
+    boto3.client("bedrock-runtime", region_name=REGION_REMOTE, config=_fast_config),
+    boto3.client("bedrock-runtime", region_name=REGION_LOCAL, config=_fast_config),
+]
+# Created once per container so the fast path never pays thread start-up
+_critical_pool = ThreadPoolExecutor(max_workers=4)
+
+CRITICAL_SYSTEM_PROMPT = (
+    "You are Sainte, a trauma-informed support companion. The person may be in crisis. "
+    "Reply in 2-3 short, calm sentences: acknowledge their pain, say they are not alone, and "
+    "encourage them to contact the 988 Suicide & Crisis Lifeline (call or text 988 in the US) "
+    "or local emergency services if they are in danger. No advice lists, no questions about details."
+)
+# Deterministic reply when no model answers in time — reviewed wording, never generated
+SAFE_CRITICAL_RESPONSE = (
+    "I'm really glad you reached out, and you don't have to go through this alone. "
+    "If you might act on thoughts of hurting yourself or you're in danger, please call or text 988 "
+    "(Suicide & Crisis Lifeline) or your local emergency number right now. I'm here with you."
+)
+
+
+def effective_tier(tier: str, message: str) -> str:
+    """The caller's tier, escalated to Critical when the message itself reads as Critical."""
+    return "Critical" if classify_user_state(message or "") == "Critical" else tier
+
+
+def emit_metrics(tier: str, path: str, latency_ms: float, **counts):
+    """CloudWatch Embedded Metric Format: one log line becomes per-tier/per-path metrics."""
+    slo_ms = TIER_SLO_MS.get(tier, TIER_SLO_MS["Stable"])
+    values = {"LatencyMs": round(latency_ms, 1), "WithinSLO": int(latency_ms <= slo_ms), **counts}
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["Tier"], ["Tier", "Path"]],
+                "Metrics": [{"Name": "LatencyMs", "Unit": "Milliseconds"}]
+                           + [{"Name": k, "Unit": "Count"} for k in values if k != "LatencyMs"],
+            }],
+        },
+        "Tier": tier,
+        "Path": path,
+        **values,
+    }))
+
+
+def _critical_invoke(client, message: str) -> str:
+    response = client.invoke_model(
+        modelId=CRITICAL_MODEL_ID,
+        body=json.dumps({
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": CRITICAL_MAX_TOKENS,
+            "temperature": 0.3,
+            "system": CRITICAL_SYSTEM_PROMPT,
+            "messages": [{"role": "user", "content": message}],
+        }),
+        contentType="application/json",
+        accept="application/json",
+    )
+    content = json.loads(response["body"].read()).get("content", [])
+    text = (content[0].get("text", "") if content else "").strip()
+    if not text:
+        raise ValueError("empty completion")
+    return text
+
+
+def critical_reflection(message: str, started: float):
+    """
+    Primary request; if it hasn't answered after CRITICAL_HEDGE_AFTER_MS, a hedge to the
+    second region. First success wins. Past the deadline the safe response is returned.
+    Returns (text, stats) with Hedged / SafeFallback counts for the metrics.
+    """
+    deadline = started + CRITICAL_DEADLINE_MS / 1000
+    pending = {_critical_pool.submit(_critical_invoke, critical_clients[0], message)}
+    hedged = False
+
+    while pending:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        wake = deadline if hedged else min(deadline, started + CRITICAL_HEDGE_AFTER_MS / 1000)
+        done, pending = wait(pending, timeout=max(wake - now, 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                return future.result(), {"Hedged": int(hedged), "SafeFallback": 0}
+            except Exception as e:
+                print(f"⚠️ Critical fast path attempt failed: {e}")
+        if not hedged and (not pending or time.monotonic() >= started + CRITICAL_HEDGE_AFTER_MS / 1000):
+            hedged = True
+            pending.add(_critical_pool.submit(_critical_invoke, critical_clients[1], message))
 
+    # Abandoned requests finish (or time out) on the pool; nothing waits for them
+    print("🛟 Critical deadline reached; returning the safe response")
+    return SAFE_CRITICAL_RESPONSE, {"Hedged": int(hedged), "SafeFallback": 1}
+
+
+def warm_up():
+    """Scheduled ping: open TLS connections on the fast-path clients with a 1-token call."""
+    for client in critical_clients:
+        try:
+            client.invoke_model(
+                modelId=CRITICAL_MODEL_ID,
+                body=json.dumps({"anthropic_version": "bedrock-2023-05-31", "max_tokens": 1,
+                                 "messages": [{"role": "user", "content": "hi"}]}),
+                contentType="application/json",
+                accept="application/json",
+            )
+        except Exception as e:
+            print(f"⚠️ Warm-up failed: {e}")
+    return {"statusCode": 200, "body": json.dumps({"warmed": len(critical_clients)})}
+
+
+def handle_critical(user_id: str, message: str, started: float):
+    reflection, stats = critical_reflection(message, started)
+    tone = "grounding"
+    try:
+        table.put_item(Item={
+            "user_id": user_id,
+            "timestamp": datetime.utcnow().isoformat(),
+            "message": message,
+            "tier": "Critical",
+            "response": reflection,
+            "tone": tone,
+            "source": "Critical-FastPath" if not stats["SafeFallback"] else "Critical-SafeResponse",
+        })
+        print(f"✅ Stored critical check-in for {user_id}")
+    except Exception as db_err:
+        print(f"⚠️ DynamoDB write failed: {db_err}")
+
+    emit_metrics("Critical", "fast", (time.monotonic() - started) * 1000, **stats)
+    return {
+        "statusCode": 200,
+        "body": json.dumps({
+            "user_id": user_id,
+            "tier": "Critical",
+            "nudge": reflection,
+            "tone": tone
+        }),
+    }
+
+
+def request_reflection(user_id: str, tier: str, message: str, checkin_timestamp: str = None):
+    """
+    Cross-region invoke of the conversational Lambda (us-east-1) → (reflection, tone).
+    checkin_timestamp is the key this turn's row is stored under (by us, not the responder);
+    it is kept out of the model's context and seeds the responder's context cache.
+    """
+    request = {"user_id": user_id, "tier": tier, "message": message}
+    if checkin_timestamp:
+        request["checkin_timestamp"] = checkin_timestamp
+    payload = {"body": json.dumps(request)}
+    invoke_response = lambda_client.invoke(
+        FunctionName="respond_nudge_us_east_1",
+        InvocationType="RequestResponse",
+        Payload=json.dumps(payload)
+    )
+    result = json.loads(invoke_response["Payload"].read())
+    body_result = json.loads(result.get("body", "{}"))
+    reflection = body_result.get("response") or body_result.get("nudge", "")
+    tone = body_result.get("tone", "neutral")
+    print(f"[Claude Reflection] => {reflection} (tone={tone})")
+    return reflection, tone
+
+
+def encode_checkin_id(user_id: str, timestamp: str) -> str:
+    return base64.urlsafe_b64encode(f"{user_id}|{timestamp}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_checkin_id(checkin_id: str):
+    """checkin_id → (user_id, timestamp); ValueError if it isn't one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(checkin_id + "=" * (-len(checkin_id) % 4)).decode("utf-8")
+    except Exception:
+        raise ValueError("Malformed checkin_id")
+    user_id, sep, timestamp = raw.rpartition("|")
+    if not sep or not user_id or not timestamp:
+        raise ValueError("Malformed checkin_id")
+    return user_id, timestamp
 
+
+def _response(status: int, data: dict, headers: dict = None):
+    response = {"statusCode": status, "body": json.dumps(data)}
+    if headers:
+        response["headers"] = headers
+    return response
+
+
+def wants_async(event, body) -> bool:
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    return "respond-async" in headers.get("prefer", "").lower() or body.get("async") is True
+
+
+def submit_checkin(user_id: str, tier: str, message: str, context, started: float):
+    """Record the job as pending, start generation in the background, answer 202."""
+    timestamp = datetime.utcnow().isoformat()
+    jobs_table.put_item(Item={
+        "user_id": user_id,
+        "timestamp": timestamp,
+        "tier": tier,
+        # Kept so a lost background invocation doesn't lose what the user wrote
+        "message": message,
+        "status": "pending",
+        "expires_at": int(time.time()) + CHECKIN_JOB_TTL_S,
+    })
+    job = {"mode": "generate", "user_id": user_id, "timestamp": timestamp, "tier": tier, "message": message}
+    if context is None:
+        # Local run: no function to hand off to
+        generate_checkin(job)
+    else:
+        self_client.invoke(FunctionName=context.function_name, InvocationType="Event",
+                           Payload=json.dumps(job).encode("utf-8"))
+
+    checkin_id = encode_checkin_id(user_id, timestamp)
+    emit_metrics(tier, "async-accept", (time.monotonic() - started) * 1000)
+    return _response(202, {
+        "checkin_id": checkin_id,
+        "status": "pending",
+        "user_id": user_id,
+        "tier": tier,
+        "poll": f"/checkin/{checkin_id}",
+    }, {"Location": f"/checkin/{checkin_id}"})
+
+
+def generate_checkin(job: dict):
+    """Background half of an async check-in: generate, then write the finished row once."""
+    user_id, timestamp, tier = job["user_id"], job["timestamp"], job["tier"]
+    try:
+        reflection, tone = request_reflection(user_id, tier, job["message"], timestamp)
+        status, error = "done", None
+    except Exception as e:
+        print(f"❌ Async reflection failed for {user_id}: {e}")
+        reflection, tone, status, error = FALLBACK_REFLECTION, "neutral", "failed", str(e)[:200]
+
+    item = {
+        "user_id": user_id,
+        "timestamp": timestamp,
+        "message": job["message"],
+        "tier": tier,
+        "response": reflection or FALLBACK_REFLECTION,
+        "tone": tone,
+        "source": "Claude-via-us-east-1",
+        "status": status,
+        "completed_at": datetime.utcnow().isoformat(),
+    }
+    if error:
+        item["error"] = error
+    try:
+        # A retried async invocation must not replace the row the first attempt wrote
+        table.put_item(Item=item, ConditionExpression="attribute_not_exists(user_id)")
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+    waited_ms = (datetime.utcnow() - datetime.fromisoformat(timestamp)).total_seconds() * 1000
+    emit_metrics(tier, "async", waited_ms, Failed=int(status == "failed"))
+    return {"statusCode": 200, "body": json.dumps({"status": status})}
+
+
+def _checkin_state(user_id: str, timestamp: str):
+    """The finished row if it exists, else the pending job (None if neither does)."""
+    key = {"user_id": user_id, "timestamp": timestamp}
+    item = table.get_item(
+        Key=key,
+        ConsistentRead=True,
+        ProjectionExpression="#s, tier, #resp, tone, #e",
+        ExpressionAttributeNames={"#s": "status", "#resp": "response", "#e": "error"},
+    ).get("Item")
+    if item is not None:
+        # Rows written by the synchronous path carry no status: they are complete
+        item.setdefault("status", "done")
+        return item
+    return jobs_table.get_item(Key=key, ConsistentRead=True).get("Item")
+
+
+def get_checkin_result(checkin_id: str, wait_s: float):
+    """GET /checkin/{id}?wait=N — the check-in's status, holding the request until it's ready or N s pass."""
+    try:
+        user_id, timestamp = decode_checkin_id(checkin_id)
+    except ValueError as e:
+        return _response(400, {"error": str(e)})
+
+    deadline = time.monotonic() + max(0.0, min(wait_s, CHECKIN_MAX_WAIT_S))
+    delay = 0.25
+    while True:
+        item = _checkin_state(user_id, timestamp)
+        if item is None:
+            return _response(404, {"error": "Unknown checkin_id"})
+        status = item["status"]
+        age_s = (datetime.utcnow() - datetime.fromisoformat(timestamp)).total_seconds()
+        if status == "pending" and age_s > CHECKIN_PENDING_TIMEOUT_S:
+            status, item["error"] = "failed", "Reflection timed out"
+        if status != "pending" or time.monotonic() + delay > deadline:
+            break
+        time.sleep(delay)
+        delay = min(delay * 1.5, 1.0)
+
+    result = {"checkin_id": checkin_id, "status": status, "user_id": user_id, "tier": item.get("tier")}
+    if status == "pending":
+        return _response(202, result, {"Retry-After": "1"})
+    result.update({"nudge": item.get("response") or FALLBACK_REFLECTION, "tone": item.get("tone", "neutral")})
+    if status == "failed":
+        result["error"] = item.get("error", "")
+    return _response(200, result)
+
+
+@profiled
 def lambda_handler(event, context):
+    started = time.monotonic()
+    if event.get("warmup"):
+        return warm_up()
+    if event.get("mode") == "generate":
+        return generate_checkin(event)
     try:
+        # --- GET /checkin/{id}: async result (long poll with ?wait=N) ---
+        if event.get("httpMethod") == "GET":
+            checkin_id = (event.get("pathParameters") or {}).get("id") or event.get("path", "").rstrip("/").rsplit("/", 1)[-1]
+            params = event.get("queryStringParameters") or {}
+            try:
+                wait_s = float(params.get("wait", 0))
+            except ValueError:
+                return _response(400, {"error": "wait must be a number of seconds"})
+            return get_checkin_result(checkin_id, wait_s)
+
         # --- Parse event body ---
         if "body" in event and isinstance(event["body"], str):
             body = json.loads(event["body"])
@@ -31,34 +391,24 @@ def lambda_handler(event, context):
 
         print(f"[Check-In] Received from {user_id}: {message} (Tier={tier})")
 
-        # --- Build payload for Claude reflection ---
-        payload = {
-            "body": json.dumps({
-                "user_id": user_id,
-                "tier": tier,
-                "message": message
-            })
-        }
-
-        # --- Cross-region invoke of Claude reflection (us-east-1) ---
-        invoke_response = lambda_client.invoke(
-            FunctionName="respond_nudge_us_east_1",
-            InvocationType="RequestResponse",
-            Payload=json.dumps(payload)
-        )
+        # --- Critical check-ins take the deadline-bound fast path (synchronous even when async is asked) ---
+        tier = effective_tier(tier, message)
+        if tier == "Critical":
+            return handle_critical(user_id, message, started)
 
-        result = json.loads(invoke_response["Payload"].read())
-        body_result = json.loads(result.get("body", "{}"))
-        reflection = body_result.get("response") or body_result.get("nudge", "")
-        tone = body_result.get("tone", "neutral")
+        # --- Async mode: persist now, reply later via /checkin/{id} ---
+        if wants_async(event, body):
+            return submit_checkin(user_id, tier, message, context, started)
 
-        print(f"[Claude Reflection] => {reflection} (tone={tone})")
+        # The row's key is fixed up front so the responder can cache this turn under it
+        timestamp = datetime.utcnow().isoformat()
+        reflection, tone = request_reflection(user_id, tier, message, timestamp)
 
         # --- Store to DynamoDB ---
         try:
             item = {
                 "user_id": user_id,
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": timestamp,
                 "message": message,
                 "tier": tier,
                 "response": reflection,
@@ -70,13 +420,15 @@ def lambda_handler(event, context):
         except Exception as db_err:
             print(f"⚠️ DynamoDB write failed: {db_err}")
 
+        emit_metrics(tier, "standard", (time.monotonic() - started) * 1000)
+
         # --- Return to caller ---
         return {
             "statusCode": 200,
             "body": json.dumps({
                 "user_id": user_id,
                 "tier": tier,
-                "nudge": reflection or "No reflection generated.",
+                "nudge": reflection or FALLBACK_REFLECTION,
                 "tone": tone
             }),
         }
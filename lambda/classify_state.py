@@ -1,14 +1,40 @@
 # Basic NLP-style classifier (placeholder logic; can later use Bedrock)
+import re
+
+# Whole words / phrases only: "cant" must not fire on "significant", nor "hurt" on "hurt my ankle".
+# Critical escalates to the fast crisis path, so it needs a phrase about the person themselves;
+# lone distress words ("hurt", "can't") only mark the check-in At-Risk.
+CRITICAL_PHRASES = [
+    "suicidal", "suicide", "panic attack", "panicking",
+    "kill myself", "killing myself", "end my life", "end it all", "want to die", "wanna die",
+    "hurt myself", "hurting myself", "harm myself", "self harm", "self-harm",
+    "cant go on", "can't go on", "cant take it anymore", "can't take it anymore",
+    "cant breathe", "can't breathe",
+]
+AT_RISK_WORDS = ["panic", "cant", "can't", "hurt", "hurting", "missed", "late", "tired",
+                 "stressed", "stresed", "exhausted", "overwhelmed"]
+STIRRED_WORDS = ["okay", "fine", "meh"]
+
+
+def _pattern(terms):
+    return re.compile(r"(?<![\w'])(?:" + "|".join(re.escape(t) for t in terms) + r")(?![\w'])")
+
+
+_CRITICAL_RE = _pattern(CRITICAL_PHRASES)
+_AT_RISK_RE = _pattern(AT_RISK_WORDS)
+_STIRRED_RE = _pattern(STIRRED_WORDS)
+
 
 def classify_user_state(text:str) -> str:
-    text = text.lower()
-    if any(word in text for word in ["panic", "cant", "hurt", "suicidal"]):
+    # Curly apostrophes from phone keyboards count as straight ones; runs of spaces as one
+    text = " ".join(text.lower().replace("’", "'").split())
+    if _CRITICAL_RE.search(text):
         return "Critical"
-    
-    elif any(word in text for word in ["missed", "late", "tired", "stresed"]):
+
+    elif _AT_RISK_RE.search(text):
         return "At-Risk"
-    
-    elif any(word in text for word in ["okay", "fine", "meh"]):
+
+    elif _STIRRED_RE.search(text):
         return "Stirred"
-    
-    return "Stable"
\ No newline at end of file
+
+    return "Stable"
@@ -0,0 +1,164 @@
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import ddb_jobs
+import lexical_index
+from profiling import profiled
+
+# ===== AWS CONFIGURATION =====
+VECTORS_TABLE = os.getenv("VECTOR_TABLE", "SainiUserVectors")
+
+# ===== COMPACTION POLICY =====
+# Memories at or above this cosine similarity are merged into the newest one
+MERGE_THRESHOLD = float(os.getenv("MERGE_THRESHOLD", "0.95"))
+# Per-user cap; beyond it the lowest recency-weighted memories are evicted
+MAX_MEMORIES_PER_USER = int(os.getenv("MAX_MEMORIES_PER_USER", "500"))
+# Age at which a memory's retention score halves
+RECENCY_HALF_LIFE_DAYS = float(os.getenv("RECENCY_HALF_LIFE_DAYS", "30"))
+COMPACTION_WORKERS = int(os.getenv("COMPACTION_WORKERS", "8"))
+
+
+def _tables():
+    return ddb_jobs.table(VECTORS_TABLE), ddb_jobs.table(lexical_index.TERM_INDEX_TABLE)
+
+
+# ===== POLICY =====
+def retention_score(item, now: datetime) -> float:
+    """Recency decay weighted by how often the memory recurred."""
+    try:
+        last_seen = datetime.fromisoformat(str(item.get("last_seen") or item["timestamp"]))
+        age_days = max((now - last_seen).total_seconds() / 86400, 0.0)
+    except Exception:
+        age_days = float("inf")
+    recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    return recency * (1 + math.log(int(item.get("hit_count", 1))))
+
+
+def plan_merges(items, threshold: float):
+    """
+    Greedy near-duplicate clustering, newest first.
+    Returns (survivors, merged) where merged maps each duplicate's timestamp to its survivor.
+    """
+    items = sorted(items, key=lambda i: i["timestamp"], reverse=True)
+    by_dim = {}
+    for item in items:
+        by_dim.setdefault(len(item.get("embedding", [])), []).append(item)
+
+    survivors, merged = [], {}
+    for dim, group in by_dim.items():
+        if dim == 0:
+            survivors.extend(group)
+            continue
+        vecs = np.asarray([[float(x) for x in i["embedding"]] for i in group], dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vecs /= norms
+
+        kept_rows = []
+        for row, item in enumerate(group):
+            if kept_rows:
+                sims = vecs[kept_rows] @ vecs[row]
+                best = int(np.argmax(sims))
+                if sims[best] >= threshold:
+                    merged[item["timestamp"]] = group[kept_rows[best]]
+                    continue
+            kept_rows.append(row)
+            survivors.append(item)
+    return survivors, merged
+
+
+# ===== PER-USER COMPACTION =====
+def _delete_memory(item, survivor=None):
+    """Remove a memory plus its postings; re-point or release its dedup marker."""
+    vectors, terms = _tables()
+    user_id, doc_key = item["user_id"], item["timestamp"]
+    vectors.delete_item(Key={"user_id": user_id, "timestamp": doc_key})
+    lexical_index.remove_memory(terms, user_id, doc_key, item.get("message", ""), item.get("response", ""))
+    if item.get("content_hash"):
+        if survivor is not None:
+            lexical_index.point_content_hash(terms, user_id, item["content_hash"], survivor["timestamp"])
+        else:
+            lexical_index.release_content_hash(terms, user_id, item["content_hash"])
+
+
+def compact_user(user_id: str, now: datetime) -> dict:
+    vectors, _ = _tables()
+    items = ddb_jobs.load_memories(VECTORS_TABLE, user_id)
+    survivors, merged = plan_merges(items, MERGE_THRESHOLD)
+    by_ts = {i["timestamp"]: i for i in items}
+
+    # 1️⃣ Merge near-duplicates into their (newer) survivor
+    absorbed = {}
+    for ts, survivor in merged.items():
+        dup = by_ts[ts]
+        acc = absorbed.setdefault(survivor["timestamp"], {"hits": 0, "last_seen": ""})
+        acc["hits"] += int(dup.get("hit_count", 1))
+        acc["last_seen"] = max(acc["last_seen"], str(dup.get("last_seen") or ts))
+        _delete_memory(dup, survivor)
+
+    for ts, acc in absorbed.items():
+        survivor = by_ts[ts]
+        survivor["hit_count"] = int(survivor.get("hit_count", 1)) + acc["hits"]
+        survivor["last_seen"] = max(str(survivor.get("last_seen") or ts), acc["last_seen"])
+        vectors.update_item(
+            Key={"user_id": user_id, "timestamp": ts},
+            UpdateExpression="SET hit_count = :h, last_seen = :l",
+            ExpressionAttributeValues={":h": survivor["hit_count"], ":l": survivor["last_seen"]},
+        )
+
+    # 2️⃣ Cap the user's memory count by recency-weighted retention score
+    evicted = 0
+    if len(survivors) > MAX_MEMORIES_PER_USER:
+        survivors.sort(key=lambda i: retention_score(i, now), reverse=True)
+        for item in survivors[MAX_MEMORIES_PER_USER:]:
+            _delete_memory(item)
+            evicted += 1
+
+    print(f"[Compact] {user_id}: {len(items)} memories, merged={len(merged)}, evicted={evicted}")
+    return {"memories": len(items), "merged": len(merged), "evicted": evicted}
+
+
+# ===== MAIN LAMBDA HANDLER =====
+@profiled
+def lambda_handler(event, context):
+    """
+    Periodic job (e.g. nightly EventBridge rule): merge near-duplicate memories and
+    enforce MAX_MEMORIES_PER_USER. Optional event: {"user_ids": [...]}.
+    """
+    try:
+        event = event or {}
+        user_ids = event.get("user_ids") or ddb_jobs.list_users(VECTORS_TABLE)
+        now = datetime.utcnow()
+
+        def run(uid):
+            # One user's failure (throttling, a bad item) must not abort everyone else's run
+            try:
+                return compact_user(uid, now)
+            except Exception as e:
+                print(f"⚠️ Compaction failed for {uid}: {e}")
+                return {"memories": 0, "merged": 0, "evicted": 0, "failed": 1}
+
+        with ThreadPoolExecutor(max_workers=COMPACTION_WORKERS) as pool:
+            results = list(pool.map(run, user_ids))
+
+        totals = {key: sum(r.get(key, 0) for r in results) for key in ("memories", "merged", "evicted", "failed")}
+        print(f"✅ Compaction complete for {len(user_ids)} users: {totals}")
+        return {
+            "statusCode": 200 if not totals["failed"] else 207,
+            "body": json.dumps({"users": len(user_ids), **totals})
+        }
+
+    except Exception as e:
+        print(f"❌ Error in compact_memory: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }
+
+
+if __name__ == "__main__":
+    print(lambda_handler({}, None))
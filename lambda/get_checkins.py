@@ -1,22 +1,84 @@
+import base64
 import boto3
+import gzip
 import json
 import os
 
+import cold_archive
+from profiling import profiled
+from row_encoding import ARROW_STREAM, NDJSON, encode_arrow, plain
+
 dynamodb = boto3.resource("dynamodb")
 TABLE_NAME = os.environ.get("TABLE_NAME", "SainiCheckins")
 table = dynamodb.Table(TABLE_NAME)
 
+
+def scan_all():
+    """Read every page of the table (a single scan call stops at 1 MB)."""
+    items, scan = [], {}
+    while True:
+        resp = table.scan(**scan)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            return items
+        scan["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def read_all():
+    """
+    Hot table plus the cold Parquet archive (when ARCHIVE_URI is set). Rows already copied
+    to the archive but not yet removed by TTL are served from the archive only.
+    """
+    items = scan_all()
+    if not cold_archive.ARCHIVE_URI:
+        return items
+    items = [i for i in items if "archived_at" not in i]
+    items.extend(cold_archive.iter_archive())
+    return items
+
+
+@profiled
 def lambda_handler(event, context):
     try:
-        response = table.scan()
-        items = response.get("Items", [])
+        headers_in = {k.lower(): v for k, v in ((event or {}).get("headers") or {}).items()}
+        accept = headers_in.get("accept", "")
+        items = read_all()
+
+        # --- Content negotiation: Arrow IPC → NDJSON → JSON ---
+        content_type, payload = "application/json", None
+        if ARROW_STREAM in accept:
+            try:
+                payload, content_type = encode_arrow(items), ARROW_STREAM
+            except Exception as e:
+                print(f"⚠️ Arrow encoding unavailable ({e}); falling back")
+        if payload is None and NDJSON in accept:
+            payload = "".join(json.dumps(i, default=plain) + "\n" for i in items).encode("utf-8")
+            content_type = NDJSON
+        if payload is None:
+            payload = json.dumps(items, default=plain).encode("utf-8")
+
+        headers = {
+            "Access-Control-Allow-Origin": "*",
+            "Content-Type": content_type
+        }
+        binary = content_type == ARROW_STREAM
+        # Only the binary media types in api_gateway_config.yaml survive base64 bodies
+        if content_type != "application/json" and "gzip" in headers_in.get("accept-encoding", ""):
+            payload = gzip.compress(payload, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+            binary = True
+
+        if binary:
+            return {
+                "statusCode": 200,
+                "headers": headers,
+                "isBase64Encoded": True,
+                "body": base64.b64encode(payload).decode("ascii")
+            }
         return {
             "statusCode": 200,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Content-Type": "application/json"
-            },
-            "body": json.dumps(items)
+            "headers": headers,
+            "body": payload.decode("utf-8")
         }
     except Exception as e:
         return {
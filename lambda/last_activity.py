@@ -0,0 +1 @@
+../shared/last_activity.py
\ No newline at end of file
@@ -0,0 +1,265 @@
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+# ===== PER-USER INVERTED INDEX (SainiTermIndex) =====
+# HASH user_id, RANGE entry:
+#   "t#<term>#<doc_key>"  posting  → tf (term frequency), dl (document length)
+#   "#stats"              counters → doc_count, total_len (for BM25 avgdl)
+#   "h#<content_hash>"    dedup marker → doc_key of the memory holding that content
+# doc_key is the memory's timestamp, i.e. its sort key in SainiUserVectors.
+TERM_INDEX_TABLE = os.getenv("TERM_INDEX_TABLE", "SainiTermIndex")
+STATS_ENTRY = "#stats"
+
+# BM25 parameters
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'\-]*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "had", "has",
+    "have", "i", "i'm", "im", "in", "is", "it", "it's", "its", "me", "my", "of", "on", "or",
+    "so", "that", "the", "this", "to", "was", "we", "were", "with", "you", "your",
+}
+
+
+def tokenize(text: str):
+    """Lowercase word tokens without stopwords (medication names, places, etc. survive)."""
+    return [t.strip("'-") for t in TOKEN_RE.findall((text or "").lower())
+            if t.strip("'-") and t not in STOPWORDS]
+
+
+def memory_tokens(message: str, response: str):
+    return tokenize(f"{message or ''} {response or ''}")
+
+
+# ===== CONTENT HASH DEDUP =====
+def content_hash(message: str, response: str) -> str:
+    """Hash of case/whitespace-normalized message + response."""
+    normalized = " ".join(f"{message or ''} \x1f {response or ''}".lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def claim_content_hash(table, user_id: str, digest: str, doc_key: str):
+    """
+    Atomically register content for a new memory.
+    Returns None if the content is new, else the doc_key of the existing memory.
+    """
+    try:
+        table.put_item(
+            Item={"user_id": user_id, "entry": f"h#{digest}", "doc_key": doc_key},
+            ConditionExpression="attribute_not_exists(entry)",
+        )
+        return None
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+    existing = table.get_item(
+        Key={"user_id": user_id, "entry": f"h#{digest}"}, ConsistentRead=True
+    ).get("Item") or {}
+    return existing.get("doc_key", doc_key)
+
+
+def point_content_hash(table, user_id: str, digest: str, doc_key: str, expected: str = None):
+    """
+    Re-point a dedup marker at a surviving memory (after a merge). With `expected`, only
+    if the marker still points there; returns False when another writer moved it first.
+    """
+    item = {"user_id": user_id, "entry": f"h#{digest}", "doc_key": doc_key}
+    if expected is None:
+        table.put_item(Item=item)
+        return True
+    try:
+        table.put_item(Item=item, ConditionExpression="doc_key = :expected",
+                       ExpressionAttributeValues={":expected": expected})
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+
+
+def release_content_hash(table, user_id: str, digest: str):
+    table.delete_item(Key={"user_id": user_id, "entry": f"h#{digest}"})
+
+
+# ===== WRITE PATH =====
+def _put_postings(batch, user_id: str, doc_key: str, tokens):
+    for term, tf in Counter(tokens).items():
+        batch.put_item(Item={
+            "user_id": user_id,
+            "entry": f"t#{term}#{doc_key}",
+            "tf": tf,
+            "dl": len(tokens),
+        })
+
+
+def index_memory(table, user_id: str, doc_key: str, message: str, response: str):
+    """Add one memory's postings and bump the user's BM25 counters."""
+    tokens = memory_tokens(message, response)
+    if not tokens:
+        return 0
+
+    with table.batch_writer() as batch:
+        _put_postings(batch, user_id, doc_key, tokens)
+    table.update_item(
+        Key={"user_id": user_id, "entry": STATS_ENTRY},
+        UpdateExpression="ADD doc_count :one, total_len :len",
+        ExpressionAttributeValues={":one": 1, ":len": len(tokens)},
+    )
+    return len(tokens)
+
+
+def read_stats(table, user_id: str):
+    """The user's #stats item ({} before the first memory), strongly consistent."""
+    return table.get_item(Key={"user_id": user_id, "entry": STATS_ENTRY}, ConsistentRead=True).get("Item") or {}
+
+
+def _posting_keys(table, user_id: str):
+    keys = set()
+    query = {
+        "KeyConditionExpression": Key("user_id").eq(user_id) & Key("entry").begins_with("t#"),
+        "ProjectionExpression": "entry",
+    }
+    while True:
+        resp = table.query(**query)
+        keys.update(i["entry"] for i in resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            return keys
+        query["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def reindex_user(table, user_id: str, memories, stats=None):
+    """
+    Rebuild one user's postings and counters from their memories (items with timestamp,
+    message, response). Postings of memories no longer in the list are deleted, so reruns
+    are idempotent. Returns the number of memories indexed, or None when index_memory /
+    remove_memory moved the counters meanwhile: reload the memories and call again.
+
+    Pass `stats` (read_stats) read *before* loading the memories; a concurrent write after
+    that point then always shows up as a conflict instead of being counted twice or lost.
+    """
+    if stats is None:
+        stats = read_stats(table, user_id)
+    elif read_stats(table, user_id) != stats:
+        return None
+
+    fresh, doc_count, total_len = {}, 0, 0
+    for item in memories:
+        tokens = memory_tokens(item.get("message", ""), item.get("response", ""))
+        if not tokens:
+            continue
+        for term, tf in Counter(tokens).items():
+            fresh[f"t#{term}#{item['timestamp']}"] = {"tf": tf, "dl": len(tokens)}
+        doc_count += 1
+        total_len += len(tokens)
+
+    with table.batch_writer(overwrite_by_pkeys=["user_id", "entry"]) as batch:
+        for entry in _posting_keys(table, user_id) - set(fresh):
+            batch.delete_item(Key={"user_id": user_id, "entry": entry})
+        for entry, counts in fresh.items():
+            batch.put_item(Item={"user_id": user_id, "entry": entry, **counts})
+
+    # Set, not add, but only over the counters this rebuild started from
+    if stats:
+        condition = "doc_count = :old_count AND total_len = :old_len"
+        values = {":old_count": stats.get("doc_count", 0), ":old_len": stats.get("total_len", 0)}
+    else:
+        condition, values = "attribute_not_exists(entry)", {}
+    try:
+        table.update_item(
+            Key={"user_id": user_id, "entry": STATS_ENTRY},
+            UpdateExpression="SET doc_count = :count, total_len = :len",
+            ConditionExpression=condition,
+            ExpressionAttributeValues={":count": doc_count, ":len": total_len, **values},
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return None
+    return doc_count
+
+
+def remove_memory(table, user_id: str, doc_key: str, message: str, response: str):
+    """Drop one memory's postings (inverse of index_memory)."""
+    tokens = memory_tokens(message, response)
+    if not tokens:
+        return
+
+    with table.batch_writer() as batch:
+        for term in set(tokens):
+            batch.delete_item(Key={"user_id": user_id, "entry": f"t#{term}#{doc_key}"})
+    table.update_item(
+        Key={"user_id": user_id, "entry": STATS_ENTRY},
+        UpdateExpression="ADD doc_count :neg, total_len :len",
+        ExpressionAttributeValues={":neg": -1, ":len": -len(tokens)},
+    )
+
+
+# ===== READ PATH =====
+def _postings(table, user_id: str, term: str):
+    items = []
+    query = {"KeyConditionExpression": Key("user_id").eq(user_id) & Key("entry").begins_with(f"t#{term}#")}
+    while True:
+        resp = table.query(**query)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        query["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    return items
+
+
+def search(table, user_id: str, query_text: str, limit: int = 50):
+    """
+    BM25-ranked memories for one user.
+    Returns [{"user_id", "timestamp", "score", "coverage"}] best first, where coverage
+    is the fraction of distinct query terms the memory contains.
+    """
+    terms = sorted(set(tokenize(query_text)))
+    if not terms:
+        return []
+
+    stats = table.get_item(Key={"user_id": user_id, "entry": STATS_ENTRY}).get("Item") or {}
+    doc_count = int(stats.get("doc_count", 0))
+    if doc_count <= 0:
+        return []
+    avgdl = float(stats.get("total_len", 0)) / doc_count or 1.0
+
+    scores, matched = Counter(), Counter()
+    for term in terms:
+        postings = _postings(table, user_id, term)
+        if not postings:
+            continue
+        df = len(postings)
+        idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        prefix_len = len(f"t#{term}#")
+        for p in postings:
+            doc_key = p["entry"][prefix_len:]
+            tf, dl = float(p["tf"]), float(p["dl"])
+            scores[doc_key] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl))
+            matched[doc_key] += 1
+
+    hits = [
+        {"user_id": user_id, "timestamp": doc_key, "score": score, "coverage": matched[doc_key] / len(terms)}
+        for doc_key, score in scores.items()
+    ]
+    hits.sort(key=lambda h: h["score"], reverse=True)
+    return hits[:limit]
+
+
+def is_confident(hits, min_score: float, margin: float) -> bool:
+    """
+    A lexical match is trusted on its own when the best memory contains every query
+    term, clears min_score, and beats the runner-up by the given ratio.
+    """
+    if not hits:
+        return False
+    best = hits[0]
+    if best["coverage"] < 1.0 or best["score"] < min_score:
+        return False
+    return len(hits) == 1 or best["score"] >= margin * hits[1]["score"]
@@ -0,0 +1,138 @@
+import boto3
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from ddb_jobs import scan_items, table
+from profiling import profiled
+
+# ===== AWS CONFIGURATION =====
+REGION = os.getenv("AWS_REGION", "us-east-2")
+
+# ===== TABLE REFERENCES =====
+# Legacy layout: HASH vector_id only → every lookup is a full-table scan.
+SOURCE_TABLE = os.getenv("LEGACY_VECTOR_TABLE", "SainiVectors")
+# New layout: HASH user_id + RANGE timestamp → one Query per user.
+TARGET_TABLE = os.getenv("VECTOR_TABLE", "SainiUserVectors")
+
+TOTAL_SEGMENTS = int(os.getenv("MIGRATION_SEGMENTS", "8"))
+
+# ===== TARGET TABLE =====
+def ensure_target_table():
+    """Create the user-partitioned vectors table if it does not exist yet."""
+    dynamodb = boto3.resource("dynamodb", region_name=REGION)
+    existing_tables = dynamodb.meta.client.list_tables()["TableNames"]
+    if TARGET_TABLE in existing_tables:
+        return
+
+    table = dynamodb.create_table(
+        TableName=TARGET_TABLE,
+        KeySchema=[
+            {"AttributeName": "user_id", "KeyType": "HASH"},
+            {"AttributeName": "timestamp", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "user_id", "AttributeType": "S"},
+            {"AttributeName": "timestamp", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    table.wait_until_exists()
+    print(f"✅ Created table {TARGET_TABLE}")
+
+
+# ===== SEGMENT COPY =====
+def _put_new(target, item) -> bool:
+    """Write item unless its (user_id, timestamp) key is already taken."""
+    try:
+        target.put_item(Item=item, ConditionExpression="attribute_not_exists(user_id)")
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+
+
+def copy_item(target, item) -> str:
+    """
+    Copy one legacy record; returns "copied", "existing" (a rerun) or "renamed".
+    Legacy records are keyed by vector_id, so two of them can share a user_id and timestamp.
+    The later one is stored under "<timestamp>#<vector_id>" instead of overwriting the first.
+    """
+    if _put_new(target, item):
+        return "copied"
+    key = {"user_id": item["user_id"], "timestamp": item["timestamp"]}
+    holder = target.get_item(Key=key, ProjectionExpression="vector_id").get("Item", {})
+    if holder.get("vector_id") == item.get("vector_id"):
+        return "existing"
+
+    renamed = dict(item, timestamp=f"{item['timestamp']}#{item.get('vector_id', '')}",
+                   legacy_timestamp=item["timestamp"])
+    # Readers that age memories by timestamp fall back to last_seen
+    renamed.setdefault("last_seen", item["timestamp"])
+    print(f"⚠️ [Migrate] {item['user_id']} @ {item['timestamp']} already holds "
+          f"{holder.get('vector_id')}; storing {item.get('vector_id')} as {renamed['timestamp']}")
+    return "renamed" if _put_new(target, renamed) else "existing"
+
+
+def migrate_segment(segment: int, total_segments: int) -> dict:
+    """Copy one parallel-scan segment of the legacy table into the new layout."""
+    target = table(TARGET_TABLE)
+    counts = {"copied": 0, "existing": 0, "renamed": 0, "skipped": 0}
+
+    # Conditional puts rather than batch_writer: a batch would silently keep only one
+    # of two legacy records that map to the same key
+    for item in scan_items(SOURCE_TABLE, Segment=segment, TotalSegments=total_segments):
+        if not item.get("user_id") or not item.get("timestamp"):
+            counts["skipped"] += 1
+            continue
+        counts[copy_item(target, item)] += 1
+
+    print(f"[Migrate] Segment {segment}/{total_segments}: {counts}")
+    return counts
+
+
+# ===== MAIN LAMBDA HANDLER =====
+@profiled
+def lambda_handler(event, context):
+    """
+    One-off migration: SainiVectors (vector_id) → SainiUserVectors (user_id + timestamp).
+    Runs a parallel scan with one worker per segment. Safe to rerun: records already copied
+    are counted as existing, and key collisions are renamed rather than overwritten.
+    """
+    try:
+        event = event or {}
+        total_segments = int(event.get("segments", TOTAL_SEGMENTS))
+
+        ensure_target_table()
+
+        with ThreadPoolExecutor(max_workers=total_segments) as pool:
+            results = list(pool.map(
+                lambda seg: migrate_segment(seg, total_segments),
+                range(total_segments)
+            ))
+
+        totals = {key: sum(r[key] for r in results) for key in ("copied", "existing", "renamed", "skipped")}
+        print(f"✅ Migration complete: {totals}")
+        return {
+            "statusCode": 200,
+            "body": json.dumps({
+                "source": SOURCE_TABLE,
+                "target": TARGET_TABLE,
+                "segments": total_segments,
+                **totals
+            })
+        }
+
+    except Exception as e:
+        print(f"❌ Error in migrate_vectors: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }
+
+
+if __name__ == "__main__":
+    print(lambda_handler({}, None))
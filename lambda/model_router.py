@@ -0,0 +1,248 @@
+"""
+Per-request Bedrock model routing by tier, message length and live model health.
+
+    router = ModelRouter(bedrock, caller="respond_nudge")
+    text, model_id = router.generate([{"role": "user", "content": prompt}], tier="Stable", text=message)
+
+A policy is an ordered list of rules; the first rule whose tiers/length bounds match picks the
+candidate models (in preference order). Latency and errors of recent calls are kept per model
+in the warm container, so a model that is slow or failing is skipped until it recovers.
+MODEL_ROUTING_POLICY (JSON list of rules) replaces DEFAULT_POLICY.
+
+Every call logs one CloudWatch Embedded Metric Format line (namespace Sainte/ModelRouter,
+dimensions Route and Route+Model) with latency, estimated cost and the routing reason.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+SONNET = "anthropic.claude-3-sonnet-20240229-v1:0"
+HAIKU = "anthropic.claude-3-haiku-20240307-v1:0"
+COMMAND_R_PLUS = "cohere.command-r-plus-v1:0"
+NOVA_PRO = "amazon.nova-pro-v1:0"
+NOVA_LITE = "amazon.nova-lite-v1:0"
+
+# On-demand USD per 1K input / output tokens, for cost estimates in the decision log
+MODEL_COSTS = {
+    SONNET: (0.003, 0.015),
+    HAIKU: (0.00025, 0.00125),
+    COMMAND_R_PLUS: (0.003, 0.015),
+    NOVA_PRO: (0.0008, 0.0032),
+    NOVA_LITE: (0.00006, 0.00024),
+}
+
+DEFAULT_POLICY = [
+    {"name": "crisis", "tiers": ["Critical", "At-Risk"], "models": [SONNET, HAIKU], "latency_budget_ms": 8000},
+    {"name": "short-stable", "tiers": ["Stable"], "max_chars": 280, "models": [HAIKU, NOVA_LITE],
+     "latency_budget_ms": 2500},
+    {"name": "auto", "tiers": ["Auto"], "models": [NOVA_LITE, NOVA_PRO], "latency_budget_ms": 5000},
+    {"name": "default", "models": [SONNET, COMMAND_R_PLUS], "latency_budget_ms": 8000},
+]
+
+METRICS_NAMESPACE = "Sainte/ModelRouter"
+# Health window: the last STATS_WINDOW calls per model, ignoring anything older than STATS_MAX_AGE_S
+STATS_WINDOW = int(os.getenv("ROUTER_STATS_WINDOW", "50"))
+STATS_MAX_AGE_S = int(os.getenv("ROUTER_STATS_MAX_AGE_S", "300"))
+MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))
+MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.25"))
+
+
+def load_policy():
+    raw = os.getenv("MODEL_ROUTING_POLICY", "")
+    return json.loads(raw) if raw else DEFAULT_POLICY
+
+
+# ===== LIVE MODEL STATS (per warm container) =====
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record(model_id, latency_ms, ok):
+    with _stats_lock:
+        _stats.setdefault(model_id, deque(maxlen=STATS_WINDOW)).append((time.time(), latency_ms, ok))
+
+
+def model_health(model_id):
+    """{"samples", "error_rate", "p95_ms"} over the recent window (p95 of successful calls)."""
+    cutoff = time.time() - STATS_MAX_AGE_S
+    with _stats_lock:
+        recent = [s for s in _stats.get(model_id, ()) if s[0] >= cutoff]
+    if not recent:
+        return {"samples": 0, "error_rate": 0.0, "p95_ms": None}
+    latencies = sorted(lat for _, lat, ok in recent if ok)
+    p95 = latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)] if latencies else None
+    errors = sum(1 for _, _, ok in recent if not ok)
+    return {"samples": len(recent), "error_rate": errors / len(recent), "p95_ms": p95}
+
+
+def _unhealthy_reason(model_id, budget_ms):
+    health = model_health(model_id)
+    if health["samples"] < MIN_SAMPLES:
+        return None
+    if health["error_rate"] > MAX_ERROR_RATE:
+        return f"errors {health['error_rate']:.0%}"
+    if budget_ms and health["p95_ms"] is not None and health["p95_ms"] > budget_ms:
+        return f"p95 {health['p95_ms']:.0f}ms > {budget_ms}ms"
+    return None
+
+
+# ===== REQUEST / RESPONSE SCHEMAS =====
+def _family(model_id):
+    return model_id.split(".", 1)[0]
+
+
+def request_body(model_id, messages, max_tokens=200, temperature=0.7, system=None):
+    """Native Bedrock body for `messages` ([{"role": "user"|"assistant", "content": str}])."""
+    family = _family(model_id)
+    if family == "anthropic":
+        body = {"anthropic_version": "bedrock-2023-05-31", "max_tokens": max_tokens,
+                "temperature": temperature, "messages": messages}
+        if system:
+            body["system"] = system
+        return body
+    if family == "amazon":
+        body = {"messages": [{"role": m["role"], "content": [{"text": m["content"]}]} for m in messages],
+                "inferenceConfig": {"maxTokens": max_tokens, "temperature": temperature}}
+        if system:
+            body["system"] = [{"text": system}]
+        return body
+    if family == "cohere":
+        history = [{"role": "USER" if m["role"] == "user" else "CHATBOT", "message": m["content"]}
+                   for m in messages[:-1]]
+        body = {"message": messages[-1]["content"], "chat_history": history,
+                "max_tokens": max_tokens, "temperature": temperature}
+        if system:
+            body["preamble"] = system
+        return body
+    raise ValueError(f"No request schema for model {model_id}")
+
+
+def parse_text(model_id, result):
+    family = _family(model_id)
+    if family == "anthropic":
+        content = result.get("content") or [{}]
+        return (content[0].get("text") or result.get("completion", "")).strip()
+    if family == "amazon":
+        content = result.get("output", {}).get("message", {}).get("content") or [{}]
+        return (content[0].get("text") or result.get("outputText", "")).strip()
+    return (result.get("text") or "").strip()
+
+
+def estimate_cost(model_id, input_tokens, output_tokens):
+    price_in, price_out = MODEL_COSTS.get(model_id, (0.0, 0.0))
+    return round(input_tokens / 1000 * price_in + output_tokens / 1000 * price_out, 6)
+
+
+def _token_counts(response, messages, text):
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    # Bedrock reports exact counts in headers; fall back to ~4 characters per token
+    input_tokens = headers.get("x-amzn-bedrock-input-token-count")
+    output_tokens = headers.get("x-amzn-bedrock-output-token-count")
+    if input_tokens is None:
+        input_tokens = sum(len(m["content"]) for m in messages) // 4
+    if output_tokens is None:
+        output_tokens = len(text) // 4
+    return int(input_tokens), int(output_tokens)
+
+
+# ===== ROUTER =====
+class ModelRouter:
+    def __init__(self, client, policy=None, caller=""):
+        self.client = client
+        self.policy = policy or load_policy()
+        self.caller = caller
+
+    def match(self, tier, text=""):
+        length = len(text or "")
+        for rule in self.policy:
+            if rule.get("tiers") and tier not in rule["tiers"]:
+                continue
+            if length > rule.get("max_chars", math.inf) or length < rule.get("min_chars", 0):
+                continue
+            return rule
+        return self.policy[-1]
+
+    def route(self, tier, text=""):
+        """(rule, ordered candidates, reason): healthy candidates keep policy order, degraded ones go last."""
+        rule = self.match(tier, text)
+        budget = rule.get("latency_budget_ms")
+        healthy, degraded, skipped = [], [], []
+        for model_id in rule["models"]:
+            why = _unhealthy_reason(model_id, budget)
+            if why:
+                degraded.append(model_id)
+                skipped.append(f"{model_id}: {why}")
+            else:
+                healthy.append(model_id)
+        if not healthy:
+            reason = "all candidates degraded"
+        elif skipped:
+            reason = "skipped " + "; ".join(skipped)
+        else:
+            reason = "preferred"
+        return rule, healthy + degraded, reason
+
+    def generate(self, messages, tier="Stable", text="", max_tokens=200, temperature=0.7, system=None):
+        """
+        Invoke the routed model, falling through the remaining candidates on errors.
+        Returns (text, model_id); raises the last error when every candidate fails.
+        """
+        rule, candidates, reason = self.route(tier, text)
+        last_error = None
+        for attempt, model_id in enumerate(candidates):
+            started = time.time()
+            try:
+                response = self.client.invoke_model(
+                    modelId=model_id,
+                    body=json.dumps(request_body(model_id, messages, max_tokens, temperature, system)),
+                    contentType="application/json",
+                    accept="application/json"
+                )
+                output = parse_text(model_id, json.loads(response["body"].read()))
+            except Exception as e:
+                latency_ms = (time.time() - started) * 1000
+                record(model_id, latency_ms, False)
+                self._log(rule, model_id, tier, text, reason, attempt, latency_ms, error=str(e)[:200])
+                last_error = e
+                continue
+            latency_ms = (time.time() - started) * 1000
+            record(model_id, latency_ms, True)
+            input_tokens, output_tokens = _token_counts(response, messages, output)
+            self._log(rule, model_id, tier, text, reason, attempt, latency_ms,
+                      input_tokens=input_tokens, output_tokens=output_tokens)
+            return output, model_id
+        raise last_error or RuntimeError("No candidate models in routing rule")
+
+    def _log(self, rule, model_id, tier, text, reason, attempt, latency_ms,
+             input_tokens=0, output_tokens=0, error=None):
+        """One EMF line per attempt: p95 latency and cost per Route/Model straight from CloudWatch."""
+        print(json.dumps({
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Route"], ["Route", "Model"]],
+                    "Metrics": [{"Name": "LatencyMs", "Unit": "Milliseconds"},
+                                {"Name": "EstimatedCostUSD", "Unit": "None"},
+                                {"Name": "Errors", "Unit": "Count"},
+                                {"Name": "Fallbacks", "Unit": "Count"}],
+                }],
+            },
+            "Route": rule.get("name", "unnamed"),
+            "Model": model_id,
+            "Caller": self.caller,
+            "Tier": tier,
+            "Chars": len(text or ""),
+            "Reason": reason,
+            "Attempt": attempt,
+            "LatencyMs": round(latency_ms, 1),
+            "EstimatedCostUSD": estimate_cost(model_id, input_tokens, output_tokens),
+            "InputTokens": input_tokens,
+            "OutputTokens": output_tokens,
+            "Errors": int(error is not None),
+            "Fallbacks": int(attempt > 0),
+            **({"Error": error} if error else {}),
+        }))
@@ -0,0 +1,115 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from ddb_jobs import table
+from update_memory import EMBED_DIMENSIONS, float_to_decimal, get_embedding, memory_text
+from profiling import profiled
+
+# ===== AWS CONFIGURATION =====
+VECTORS_TABLE = os.getenv("VECTOR_TABLE", "SainiUserVectors")
+TOTAL_SEGMENTS = int(os.getenv("REEMBED_SEGMENTS", "4"))
+# Parallel Titan calls per segment; keep modest to stay under Bedrock throttling limits
+EMBED_WORKERS = int(os.getenv("REEMBED_WORKERS", "4"))
+
+def needs_reembed(item, dimensions: int) -> bool:
+    """Items written before dimensions/normalization were recorded, or at another size."""
+    return int(item.get("embedding_dim", 0)) != dimensions or not item.get("normalized")
+
+
+def reembed_item(item, dimensions: int) -> bool:
+    """Re-embed one memory in place; False if it was deleted (e.g. compacted) meanwhile."""
+    text = memory_text(
+        item["user_id"], item.get("tier", "Unknown"),
+        item.get("message", ""), item.get("response", "")
+    )
+    embedding = get_embedding(text, dimensions)
+    try:
+        table(VECTORS_TABLE).update_item(
+            Key={"user_id": item["user_id"], "timestamp": item["timestamp"]},
+            UpdateExpression="SET embedding = :e, embedding_dim = :d, normalized = :n",
+            # Without it a memory deleted since the scan comes back as an embedding-only stub
+            ConditionExpression="attribute_exists(user_id)",
+            ExpressionAttributeValues={
+                ":e": float_to_decimal(embedding),
+                ":d": len(embedding),
+                ":n": True,
+            },
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+
+
+# ===== SEGMENT WORKER =====
+def reembed_segment(segment: int, total_segments: int, dimensions: int) -> dict:
+    """Scan one segment and re-embed stale items with a small thread pool."""
+    updated, skipped, failed = 0, 0, 0
+    scan = {
+        "Segment": segment,
+        "TotalSegments": total_segments,
+        "ProjectionExpression": "user_id, #ts, tier, message, #resp, embedding_dim, normalized",
+        "ExpressionAttributeNames": {"#ts": "timestamp", "#resp": "response"},
+    }
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as pool:
+        while True:
+            resp = table(VECTORS_TABLE).scan(**scan)
+            stale = [i for i in resp.get("Items", []) if needs_reembed(i, dimensions)]
+            skipped += len(resp.get("Items", [])) - len(stale)
+            futures = [pool.submit(reembed_item, item, dimensions) for item in stale]
+            for future in futures:
+                try:
+                    if future.result():
+                        updated += 1
+                    else:
+                        skipped += 1
+                except Exception as e:
+                    print(f"⚠️ Re-embed failed: {e}")
+                    failed += 1
+            if "LastEvaluatedKey" not in resp:
+                break
+            scan["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+    print(f"[Reembed] Segment {segment}/{total_segments}: updated={updated}, skipped={skipped}, failed={failed}")
+    return {"updated": updated, "skipped": skipped, "failed": failed}
+
+
+# ===== MAIN LAMBDA HANDLER =====
+@profiled
+def lambda_handler(event, context):
+    """
+    Migrate existing memories to EMBED_DIMENSIONS-d unit-normalized Titan v2 vectors.
+    Idempotent: items already at the target dimension are skipped.
+    """
+    try:
+        event = event or {}
+        total_segments = int(event.get("segments", TOTAL_SEGMENTS))
+        dimensions = int(event.get("dimensions", EMBED_DIMENSIONS))
+
+        with ThreadPoolExecutor(max_workers=total_segments) as pool:
+            results = list(pool.map(
+                lambda seg: reembed_segment(seg, total_segments, dimensions),
+                range(total_segments)
+            ))
+
+        totals = {key: sum(r[key] for r in results) for key in ("updated", "skipped", "failed")}
+        print(f"✅ Re-embed complete ({dimensions}-d): {totals}")
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"dimensions": dimensions, **totals})
+        }
+
+    except Exception as e:
+        print(f"❌ Error in reembed_memory: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }
+
+
+if __name__ == "__main__":
+    print(lambda_handler({}, None))
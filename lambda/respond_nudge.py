@@ -2,12 +2,14 @@ import os
 import json
 import boto3
 
+from model_router import ModelRouter
+from profiling import profiled
+
 REGION = os.getenv("AWS_REGION", "us-east-2")
 bedrock = boto3.client("bedrock-runtime", region_name=REGION)
 
-# --- Models available in us-east-2 ---
-PRIMARY_MODEL = "anthropic.claude-3-sonnet-20240229-v1:0"
-FALLBACK_MODEL = "cohere.command-r-plus-v1:0"
+# Model choice per request (tier, length, live health) — see model_router.DEFAULT_POLICY
+router = ModelRouter(bedrock, caller="respond_nudge")
 
 def generate_reflective_nudge(user_id: str, tier: str, message: str) -> str:
     """Generate an empathetic trauma-informed reflection."""
@@ -23,47 +25,15 @@ validates the user's experience and encourages groundedness.
 Avoid generic advice or repetition.
 """
 
-    body = {
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "max_tokens": 200,
-        "temperature": 0.7
-    }
-
     try:
-        response = bedrock.invoke_model(
-            modelId=PRIMARY_MODEL,
-            body=json.dumps(body),
-            contentType="application/json",
-            accept="application/json"
-        )
-        result = json.loads(response["body"].read())
-        # Anthropic Claude format
-        text = result.get("content", [{}])[0].get("text", "")
-        if not text:
-            text = result.get("completion", "")
-        return text.strip()
-
+        text, _ = router.generate([{"role": "user", "content": prompt}], tier=tier, text=message,
+                                  max_tokens=200, temperature=0.7)
+        return text or "I'm here with you; take a slow breath and know you're safe."
     except Exception as e:
-        print(f"⚠️ Primary model failed ({e}), switching to fallback…")
-        try:
-            response = bedrock.invoke_model(
-                modelId=FALLBACK_MODEL,
-                body=json.dumps({
-                    "input": prompt,
-                    "temperature": 0.7,
-                    "max_tokens": 200
-                }),
-                contentType="application/json",
-                accept="application/json"
-            )
-            result = json.loads(response["body"].read())
-            return result.get("text", "").strip() or "I'm here with you; take a slow breath and know you're safe."
-        except Exception as inner_e:
-            print(f"❌ Fallback failed: {inner_e}")
-            return "I'm here with you; it's okay to pause—your feelings matter."
+        print(f"❌ All routed models failed: {e}")
+        return "I'm here with you; it's okay to pause—your feelings matter."
 
+@profiled
 def lambda_handler(event, context):
     body = json.loads(event.get("body", "{}"))
     user_id = body.get("user_id", "guest_user")
@@ -1,6 +1,12 @@
-import boto3, json, os
+import boto3, json, os, time
+from collections import OrderedDict
 from datetime import datetime
 
+from boto3.dynamodb.conditions import Key
+
+from model_router import ModelRouter
+from profiling import profiled
+
 # ===== REGIONS =====
 REGION_CLAUDE = "us-east-1"
 TABLE_REGION = "us-east-2"
@@ -9,23 +15,106 @@ bedrock = boto3.client("bedrock-runtime", region_name=REGION_CLAUDE)
 dynamodb = boto3.resource("dynamodb", region_name=TABLE_REGION)
 table = dynamodb.Table(os.getenv("TABLE_NAME", "SainiCheckins"))
 
-MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+# Model choice per request (tier, length, live health) — see model_router.DEFAULT_POLICY
+router = ModelRouter(bedrock, caller="respond_nudge_us_east_1")
+
+
+# ===== CONTEXT CACHE (per warm container) =====
+# user_id → {"turns": newest-first check-ins, "latest": newest timestamp, "cached_at", "written"}
+CONTEXT_LIMIT = 3
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "512"))
+# Entries this container wrote itself are trusted without any read for this long (a session's
+# back-to-back turns); older entries are checked against the table's newest timestamp, and
+# anything past the TTL is re-read.
+CONTEXT_TRUST_SECONDS = int(os.getenv("CONTEXT_TRUST_SECONDS", "120"))
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "900"))
+_context_cache = OrderedDict()
 
 
-def fetch_recent_context(user_id: str, limit: int = 3):
-    """Fetch last few check-ins for conversation context."""
+def _cache_put(user_id, turns, written=False):
+    _context_cache[user_id] = {
+        "turns": turns[:CONTEXT_LIMIT],
+        "latest": turns[0].get("timestamp", "") if turns else "",
+        "cached_at": time.time(),
+        "written": written,
+    }
+    _context_cache.move_to_end(user_id)
+    while len(_context_cache) > CONTEXT_CACHE_SIZE:
+        _context_cache.popitem(last=False)
+
+
+def _latest_timestamp(user_id: str, skip: str = None) -> str:
+    """
+    Newest check-in key for a user other than `skip` (the current turn's own row): a
+    one- or two-item, key-only read used as the version check.
+    """
+    resp = table.query(
+        KeyConditionExpression=Key("user_id").eq(user_id),
+        ScanIndexForward=False,
+        Limit=2 if skip else 1,
+        ProjectionExpression="#ts",
+        ExpressionAttributeNames={"#ts": "timestamp"},
+    )
+    keys = [i["timestamp"] for i in resp.get("Items", []) if i["timestamp"] != skip]
+    return keys[0] if keys else ""
+
+
+def _cached_context(user_id: str, skip: str = None):
+    entry = _context_cache.get(user_id)
+    if entry is None:
+        return None
+    age = time.time() - entry["cached_at"]
+    if age > CONTEXT_CACHE_TTL_SECONDS:
+        del _context_cache[user_id]
+        return None
+    if not (entry["written"] and age <= CONTEXT_TRUST_SECONDS):
+        if _latest_timestamp(user_id, skip) != entry["latest"]:
+            # Someone else wrote for this user since we cached (dashboard, auto nudge, other container)
+            del _context_cache[user_id]
+            return None
+    _context_cache.move_to_end(user_id)
+    return list(entry["turns"])
+
+
+def _completed_turns(items, exclude: str = None):
+    """Check-ins usable as context: answered, and not the turn being generated right now."""
+    return [i for i in items
+            if i.get("timestamp") != exclude and i.get("status") != "pending" and i.get("response")]
+
+
+def fetch_recent_context(user_id: str, limit: int = CONTEXT_LIMIT, exclude: str = None):
+    """
+    Fetch last few completed check-ins for conversation context (newest first). `exclude` is
+    the key of the caller's row for this very turn, which it writes after this reply.
+    """
     try:
-        resp = table.scan()
-        items = [i for i in resp.get("Items", []) if i.get("user_id") == user_id]
-        items.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        cached = _cached_context(user_id, exclude)
+        if cached is not None:
+            return _completed_turns(cached, exclude)[:limit]
+        # Read a little extra: the current turn and other unanswered rows are dropped
+        resp = table.query(
+            KeyConditionExpression=Key("user_id").eq(user_id),
+            ScanIndexForward=False,
+            Limit=limit + 2,
+        )
+        items = _completed_turns(resp.get("Items", []), exclude)
+        _cache_put(user_id, items)
         return items[:limit]
     except Exception as e:
         print(f"⚠️ Context fetch failed: {e}")
+        _context_cache.pop(user_id, None)
         return []
 
 
+def remember_turn(user_id: str, item: dict, context_msgs):
+    """Write-through: the turn just stored becomes the newest cached context for this user."""
+    # Only when this turn's context read succeeded; otherwise the entry would be missing history
+    if user_id in _context_cache:
+        _cache_put(user_id, [item] + list(context_msgs), written=True)
+
+
 def generate_conversation(message: str, tier: str, context_msgs):
-    """Generate empathetic conversational reply using Claude 3 Sonnet (native schema)."""
+    """Generate empathetic conversational reply with the routed model."""
     messages = []
 
     # Append short context (conversation memory)
@@ -39,68 +128,60 @@ def generate_conversation(message: str, tier: str, context_msgs):
         "content": f"User emotional tier: {tier}\nUser says: {message}"
     })
 
-    # ✅ Native Anthropic request structure per AWS docs
-    payload = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 400,
-        "temperature": 0.7,
-        "messages": messages
-    }
-
     try:
-        response = bedrock.invoke_model(
-            modelId=MODEL_ID,
-            body=json.dumps(payload),
-            contentType="application/json",
-            accept="application/json"
-        )
-
-        raw = json.loads(response["body"].read())
-        content_list = raw.get("content", [])
-        text = content_list[0].get("text", "") if content_list else ""
-
-        return {"response": text.strip(), "tone": "gentle"}
+        text, model_id = router.generate(messages, tier=tier, text=message, max_tokens=400, temperature=0.7)
+        return {"response": text, "tone": "gentle", "model_id": model_id}
 
     except Exception as e:
-        print(f"❌ Claude generation failed: {e}")
+        print(f"❌ Conversation generation failed: {e}")
         return {
             "response": "I’m here with you. Tell me more about how you’re feeling today.",
             "tone": "gentle"
         }
 
 
+@profiled
 def lambda_handler(event, context):
     try:
         body = json.loads(event["body"]) if "body" in event and isinstance(event["body"], str) else event
         user_id = body.get("user_id", "guest_user")
         tier = body.get("tier", "Stable")
         message = body.get("message", "No message provided.")
+        # Key of the caller's own row for this turn (already written when the check-in is async)
+        checkin_timestamp = body.get("checkin_timestamp")
 
-        print(f"[Claude Conversation] user={user_id}, tier={tier}")
+        print(f"[Conversation] user={user_id}, tier={tier}")
 
-        context_msgs = fetch_recent_context(user_id)
+        context_msgs = fetch_recent_context(user_id, exclude=checkin_timestamp)
         reflection = generate_conversation(message, tier, context_msgs)
         response_text = reflection.get("response", "")
         tone = reflection.get("tone", "gentle")
 
-        # Save reflection to DynamoDB
         item = {
             "user_id": user_id,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": checkin_timestamp or datetime.utcnow().isoformat(),
             "message": message,
             "tier": tier,
             "response": response_text,
             "tone": tone,
-            "source": "Claude3-Sonnet-Native"
+            "source": reflection.get("model_id", "fallback")
         }
-        table.put_item(Item=item)
-        print(f"✅ Conversational reply stored for {user_id} ({tone})")
+        if checkin_timestamp:
+            # The caller stores this turn's row under that key; caching it here
+            # keeps the next turn's version check matching instead of seeing a stranger's write
+            print(f"✅ Conversational reply generated for {user_id} ({tone}); row owned by caller")
+        else:
+            # Save reflection to DynamoDB
+            table.put_item(Item=item)
+            print(f"✅ Conversational reply stored for {user_id} ({tone})")
+        remember_turn(user_id, item, context_msgs)
 
         return {
             "statusCode": 200,
             "body": json.dumps({
                 "response": response_text,
-                "tone": tone
+                "tone": tone,
+                "model_id": reflection.get("model_id", "fallback")
             })
         }
 
@@ -2,21 +2,37 @@ import boto3
 import json
 import os
 import math
+import time
 from decimal import Decimal
 from boto3.dynamodb.conditions import Key
 
+import lexical_index
+from profiling import profiled
+
 # ===== AWS CONFIGURATION =====
 REGION = os.getenv("AWS_REGION", "us-east-2")
 bedrock = boto3.client("bedrock-runtime", region_name=REGION)
 dynamodb = boto3.resource("dynamodb", region_name=REGION)
-VECTORS_TABLE = os.getenv("VECTOR_TABLE", "SainiVectors")
+# Partitioned by user_id (HASH) + timestamp (RANGE); see migrate_vectors.py
+VECTORS_TABLE = os.getenv("VECTOR_TABLE", "SainiUserVectors")
 vectors_table = dynamodb.Table(VECTORS_TABLE)
+# Must match the dimension update_memory stored (Titan v2: 256, 512 or 1024)
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", "1024"))
+# Optional IVF snapshot built by build_ann_index.py (local path or s3://bucket/key)
+ANN_INDEX_URI = os.getenv("ANN_INDEX_URI", "")
+
+# ===== HYBRID RETRIEVAL =====
+term_table = dynamodb.Table(lexical_index.TERM_INDEX_TABLE)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")       # vector | lexical | hybrid
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.7"))        # weight of vector similarity
+LEXICAL_MIN_SCORE = float(os.getenv("LEXICAL_MIN_SCORE", "2.0"))
+LEXICAL_MARGIN = float(os.getenv("LEXICAL_MARGIN", "1.5"))    # best / runner-up BM25 ratio
 
 
 # ===== Titan v2 EMBEDDING =====
-def get_embedding(text: str):
-    """Generate Titan v2 embedding (correct schema for us-east-2)."""
-    payload = {"inputText": text}
+def get_embedding(text: str, dimensions: int = EMBED_DIMENSIONS):
+    """Generate a unit-normalized Titan v2 embedding (correct schema for us-east-2)."""
+    payload = {"inputText": text, "dimensions": dimensions, "normalize": True}
 
     response = bedrock.invoke_model(
         modelId="amazon.titan-embed-text-v2:0",
@@ -28,16 +44,24 @@ def get_embedding(text: str):
 
     # Titan sometimes returns either “embeddings” or “embedding”
     if "embeddings" in result and isinstance(result["embeddings"], list):
-        return result["embeddings"][0]
+        embedding = result["embeddings"][0]
     elif "embedding" in result:
-        return result["embedding"]
+        embedding = result["embedding"]
     else:
         raise ValueError(f"Unexpected Titan response format: {json.dumps(result)[:300]}")
 
+    norm = math.sqrt(sum(x * x for x in embedding))
+    return [x / norm for x in embedding] if norm else embedding
+
+
+# ===== SIMILARITY =====
+def dot_product(vec1, vec2):
+    """Cosine similarity for unit-normalized vectors."""
+    return sum(a * b for a, b in zip(vec1, vec2))
+
 
-# ===== COSINE SIMILARITY =====
 def cosine_similarity(vec1, vec2):
-    """Compute cosine similarity between two numeric vectors."""
+    """Compute cosine similarity between two numeric vectors (legacy, unnormalized items)."""
     dot = sum(a * b for a, b in zip(vec1, vec2))
     norm1 = math.sqrt(sum(a * a for a in vec1))
     norm2 = math.sqrt(sum(b * b for b in vec2))
@@ -46,9 +70,198 @@ def cosine_similarity(vec1, vec2):
     return dot / (norm1 * norm2 + 1e-9)
 
 
+# ===== USER MEMORY QUERY =====
+def fetch_user_memories(user_id: str, since: str = None):
+    """Query every memory in a single user's partition (all pages), or only those after `since`."""
+    items = []
+    condition = Key("user_id").eq(user_id)
+    if since:
+        condition = condition & Key("timestamp").gt(since)
+    query = {"KeyConditionExpression": condition}
+    while True:
+        resp = vectors_table.query(**query)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        query["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    return items
+
+
+# ===== ANN INDEX SNAPSHOT =====
+# Seconds between checks for a republished snapshot (one HEAD / stat per check)
+ANN_REFRESH_SECONDS = int(os.getenv("ANN_REFRESH_SECONDS", "300"))
+# search="auto" only goes through the snapshot for cohorts of at least this many users;
+# a single partition is cheap to score exactly and always current
+ANN_MIN_USERS = int(os.getenv("ANN_MIN_USERS", "2"))
+_ann_index = None
+_ann_checked_at = 0.0
+
+
+def load_ann_index():
+    """
+    Memory-map the ANN snapshot once per warm container, reopening it when the published
+    snapshot changes (S3 ETag / file mtime). None if unavailable.
+    """
+    global _ann_index, _ann_checked_at
+    if not ANN_INDEX_URI or time.time() - _ann_checked_at < ANN_REFRESH_SECONDS:
+        return _ann_index or None
+    _ann_checked_at = time.time()
+    try:
+        from ann_index import open_index, snapshot_version
+        version = snapshot_version(ANN_INDEX_URI)
+        if not _ann_index or _ann_index.version != version:
+            _ann_index = open_index(ANN_INDEX_URI, version=version)
+            print(f"[ANN] Loaded index {ANN_INDEX_URI} (rows={_ann_index.count}, built={_ann_index.built_at})")
+    except Exception as e:
+        # Keep serving the snapshot already mapped, if any
+        print(f"⚠️ ANN index refresh failed{'' if _ann_index else ', using exact search'}: {e}")
+        _ann_index = _ann_index or False
+    return _ann_index or None
+
+
+def hydrate_memories(hits):
+    """
+    Attach vector_id/message/response/tier to (user_id, timestamp) hits via BatchGetItem.
+    Hits whose memory no longer exists (compacted since the snapshot was built) are dropped.
+    """
+    by_key = {}
+    keys = list({(h["user_id"], h["timestamp"]): None for h in hits})
+    for start in range(0, len(keys), 100):
+        request = {VECTORS_TABLE: {
+            "Keys": [{"user_id": u, "timestamp": t} for u, t in keys[start:start + 100]],
+            "ProjectionExpression": "user_id, #ts, vector_id, message, #resp, tier",
+            "ExpressionAttributeNames": {"#ts": "timestamp", "#resp": "response"},
+        }}
+        while request:
+            resp = dynamodb.batch_get_item(RequestItems=request)
+            for item in resp.get("Responses", {}).get(VECTORS_TABLE, []):
+                by_key[(item["user_id"], item["timestamp"])] = item
+            request = resp.get("UnprocessedKeys") or None
+
+    results = []
+    for h in hits:
+        item = by_key.get((h["user_id"], h["timestamp"]))
+        if item is None:
+            continue
+        results.append({
+            "user_id": h["user_id"],
+            "vector_id": h.get("vector_id") or item.get("vector_id"),
+            "timestamp": h["timestamp"],
+            "message": item.get("message"),
+            "response": item.get("response"),
+            "tier": item.get("tier"),
+            **{k: round(h[k], 4) for k in ("similarity", "lexical_score", "score") if h.get(k) is not None}
+        })
+    return results
+
+
+def score_memories(uid, items, query_embedding):
+    """Cosine-score one user's memory items against the query (skips other dimensions)."""
+    results = []
+    for item in items:
+        emb = [float(x) for x in item.get("embedding", [])]
+        if len(emb) != len(query_embedding):
+            # Not yet re-embedded at the configured dimension (see reembed_memory.py)
+            continue
+        if item.get("normalized"):
+            sim = dot_product(query_embedding, emb)
+        else:
+            sim = cosine_similarity(query_embedding, emb)
+        results.append({
+            "user_id": uid,
+            "vector_id": item.get("vector_id"),
+            "timestamp": item.get("timestamp"),
+            "message": item.get("message"),
+            "response": item.get("response"),
+            "tier": item.get("tier"),
+            "similarity": round(sim, 4)
+        })
+    return results
+
+
+def exact_search(user_ids, query_embedding, top_k):
+    """Brute-force cosine scoring over each user's partition."""
+    results = []
+    for uid in user_ids:
+        results.extend(score_memories(uid, fetch_user_memories(uid), query_embedding))
+    results.sort(key=lambda x: x["similarity"], reverse=True)
+    return results[:top_k]
+
+
+def ann_search(index, user_ids, query_embedding, limit):
+    """Snapshot hits plus exact scores for memories written after the snapshot was built."""
+    merged = {(r["user_id"], r["timestamp"]): r
+              for r in hydrate_memories(index.search(query_embedding, limit, user_ids))}
+    for uid in user_ids:
+        fresh = fetch_user_memories(uid, since=index.built_at)
+        merged.update({(r["user_id"], r["timestamp"]): r for r in score_memories(uid, fresh, query_embedding)})
+    return sorted(merged.values(), key=lambda x: x["similarity"], reverse=True)[:limit]
+
+
+def vector_search(user_ids, query_embedding, limit, search_mode, min_hits=1):
+    """
+    ANN snapshot for cohort requests it covers, exact scoring otherwise. Falls back to
+    exact scoring when the snapshot yields fewer than min_hits. Returns (used, results).
+    """
+    index = load_ann_index() if search_mode != "exact" else None
+    if index and index.dim != len(query_embedding):
+        print(f"⚠️ ANN index dim {index.dim} != query dim {len(query_embedding)}, using exact search")
+        index = None
+    if index and (search_mode == "ann" or (len(user_ids) >= ANN_MIN_USERS and index.covers(user_ids))):
+        results = ann_search(index, user_ids, query_embedding, limit)
+        if len(results) >= min_hits:
+            return "ann", results
+        print(f"[ANN] {len(results)} hits < {min_hits}, falling back to exact search")
+    return "exact", exact_search(user_ids, query_embedding, limit)
+
+
+# ===== LEXICAL (BM25) RETRIEVAL =====
+def lexical_search(user_ids, query_text, limit):
+    """BM25 hits across the requested users, best first."""
+    hits = []
+    for uid in user_ids:
+        hits.extend(lexical_index.search(term_table, uid, query_text, limit))
+    hits.sort(key=lambda h: h["score"], reverse=True)
+    return hits[:limit]
+
+
+def fuse_results(vector_results, lexical_hits, alpha, top_k):
+    """Weighted fusion: alpha * cosine + (1 - alpha) * BM25 scaled to the best lexical hit."""
+    best_lexical = max((h["score"] for h in lexical_hits), default=0.0) or 1.0
+    fused = {}
+    for r in vector_results:
+        fused[(r["user_id"], r["timestamp"])] = dict(r, lexical_score=0.0)
+    for h in lexical_hits:
+        entry = fused.setdefault((h["user_id"], h["timestamp"]), {
+            "user_id": h["user_id"], "timestamp": h["timestamp"], "similarity": 0.0
+        })
+        entry["lexical_score"] = h["score"]
+
+    for entry in fused.values():
+        entry["score"] = alpha * entry["similarity"] + (1 - alpha) * entry["lexical_score"] / best_lexical
+    ranked = sorted(fused.values(), key=lambda x: x["score"], reverse=True)[:top_k]
+
+    # Lexical-only hits still need their stored text
+    missing = [r for r in ranked if "message" not in r]
+    hydrated = {(h["user_id"], h["timestamp"]): h for h in hydrate_memories(missing)} if missing else {}
+    return [
+        hydrated.get((r["user_id"], r["timestamp"]), r) if "message" not in r
+        else dict(r, **{k: round(r[k], 4) for k in ("similarity", "lexical_score", "score")})
+        for r in ranked
+    ]
+
+
 # ===== MAIN LAMBDA HANDLER =====
+@profiled
 def lambda_handler(event, context):
-    """Retrieve top-K most semantically related memories for a given user query."""
+    """
+    Retrieve top-K related memories for a user (user_id) or a cohort (user_ids).
+      mode   = "vector" | "lexical" | "hybrid" (default RETRIEVAL_MODE):
+               hybrid answers from BM25 alone when the lexical match is confident,
+               otherwise fuses BM25 with vector similarity.
+      search = "exact" | "ann" | "auto" (default): auto uses the ANN snapshot for
+               cohorts (ANN_MIN_USERS+) it covers; a single user is scored exactly.
+    """
     try:
         # Parse event safely
         if "body" in event and isinstance(event["body"], str):
@@ -57,57 +270,65 @@ def lambda_handler(event, context):
             body = event
 
         user_id = body.get("user_id")
+        user_ids = body.get("user_ids") or ([user_id] if user_id else [])
         query_text = body.get("query", "").strip()
         top_k = int(body.get("top_k", 3))
+        mode = body.get("mode", RETRIEVAL_MODE)
+        search_mode = body.get("search", "auto")
 
-        if not user_id or not query_text:
+        if not user_ids or not query_text:
             return {
                 "statusCode": 400,
                 "body": json.dumps({"error": "Missing user_id or query"})
             }
 
-        print(f"[RetrieveMemory] User={user_id}, Query='{query_text}', TopK={top_k}")
+        print(f"[RetrieveMemory] Users={user_ids}, Query='{query_text}', TopK={top_k}, Mode={mode}, Search={search_mode}")
+
+        # --- 1️⃣ Lexical pass (no Titan call) ---
+        lexical_hits = []
+        if mode in ("lexical", "hybrid"):
+            try:
+                lexical_hits = lexical_search(user_ids, query_text, max(top_k * 4, 20))
+            except Exception as lex_err:
+                # Term index missing or throttled: vector similarity alone still answers
+                print(f"⚠️ Lexical search unavailable, using vector search only: {lex_err}")
+                mode = "vector"
 
-        # --- 1️⃣ Generate query embedding ---
-        query_embedding = get_embedding(query_text)
-        print(f"[Titan] Query embedding length: {len(query_embedding)}")
+        if mode == "lexical" or (mode == "hybrid" and lexical_index.is_confident(
+                lexical_hits, LEXICAL_MIN_SCORE, LEXICAL_MARGIN)):
+            used = "lexical"
+            top_items = hydrate_memories(lexical_hits[:top_k])
+        else:
+            # --- 2️⃣ Generate query embedding ---
+            query_embedding = get_embedding(query_text)
+            print(f"[Titan] Query embedding length: {len(query_embedding)}")
 
-        # --- 2️⃣ Retrieve user’s memory items ---
-        resp = vectors_table.scan()
-        items = [item for item in resp.get("Items", []) if item.get("user_id") == user_id]
+            # --- 3️⃣ Vector search, fused with BM25 in hybrid mode ---
+            limit = top_k if mode == "vector" else max(top_k * 4, 20)
+            used, vector_results = vector_search(user_ids, query_embedding, limit, search_mode, top_k)
+            if mode == "hybrid":
+                used = f"hybrid+{used}"
+                top_items = fuse_results(vector_results, lexical_hits, HYBRID_ALPHA, top_k)
+            else:
+                top_items = vector_results[:top_k]
 
-        if not items:
-            print(f"[RetrieveMemory] No records found for user {user_id}")
+        if not top_items:
+            print(f"[RetrieveMemory] No records found for users {user_ids}")
             return {
                 "statusCode": 404,
                 "body": json.dumps({"message": "No memories found for this user."})
             }
 
-        # --- 3️⃣ Compute cosine similarity ---
-        results = []
-        for item in items:
-            emb = [float(x) for x in item.get("embedding", [])]
-            sim = cosine_similarity(query_embedding, emb)
-            results.append({
-                "vector_id": item.get("vector_id"),
-                "timestamp": item.get("timestamp"),
-                "message": item.get("message"),
-                "response": item.get("response"),
-                "tier": item.get("tier"),
-                "similarity": round(sim, 4)
-            })
-
-        # --- 4️⃣ Sort & select top-K ---
-        results.sort(key=lambda x: x["similarity"], reverse=True)
-        top_items = results[:top_k]
-
-        # --- 5️⃣ Return formatted response ---
+        # --- 4️⃣ Return formatted response ---
         return {
             "statusCode": 200,
             "body": json.dumps({
                 "user_id": user_id,
+                "user_ids": user_ids,
                 "query": query_text,
                 "top_k": top_k,
+                "mode": mode,
+                "search": used,
                 "related_memories": top_items
             }, indent=2)
         }
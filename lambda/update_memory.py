@@ -1,10 +1,16 @@
 import boto3
 import json
 import os
+import math
 import uuid
 from datetime import datetime
 from decimal import Decimal
 
+from botocore.exceptions import ClientError
+
+import lexical_index
+from profiling import profiled
+
 # ===== AWS CONFIGURATION =====
 REGION = os.getenv("AWS_REGION", "us-east-2")
 bedrock = boto3.client("bedrock-runtime", region_name=REGION)
@@ -12,10 +18,19 @@ dynamodb = boto3.resource("dynamodb", region_name=REGION)
 
 # ===== TABLE REFERENCES =====
 CHECKINS_TABLE = os.getenv("TABLE_NAME", "SainiCheckins")
-VECTORS_TABLE = os.getenv("VECTOR_TABLE", "SainiVectors")
+# Partitioned by user_id (HASH) + timestamp (RANGE); see migrate_vectors.py
+VECTORS_TABLE = os.getenv("VECTOR_TABLE", "SainiUserVectors")
 
 checkins_table = dynamodb.Table(CHECKINS_TABLE)
 vectors_table = dynamodb.Table(VECTORS_TABLE)
+term_table = dynamodb.Table(lexical_index.TERM_INDEX_TABLE)
+
+# ===== EMBEDDING CONFIGURATION =====
+# Titan v2 supports 256, 512 or 1024 output dimensions
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", "1024"))
+SUPPORTED_DIMENSIONS = (256, 512, 1024)
+# A dedup marker younger than this with no memory behind it belongs to a writer still in flight
+DEDUP_CLAIM_GRACE_SECONDS = int(os.getenv("DEDUP_CLAIM_GRACE_SECONDS", "120"))
 
 
 # ===== UTIL: FLOAT → DECIMAL =====
@@ -31,14 +46,26 @@ def float_to_decimal(obj):
         return obj
 
 
+# ===== UTIL: UNIT NORMALIZATION =====
+def normalize_vector(vec):
+    """Scale a vector to unit length so similarity is a plain dot product."""
+    norm = math.sqrt(sum(x * x for x in vec))
+    if norm == 0:
+        return list(vec)
+    return [x / norm for x in vec]
+
+
 # ===== EMBEDDING GENERATOR =====
-def get_embedding(text: str):
+def get_embedding(text: str, dimensions: int = EMBED_DIMENSIONS):
     """
-    Generate text embedding using Amazon Titan v2 (Bedrock, us-east-2).
-    Payload schema must be minimal: {"inputText": "..."}.
+    Generate a unit-normalized text embedding using Amazon Titan v2 (Bedrock, us-east-2).
+    Payload: {"inputText": "...", "dimensions": 256|512|1024, "normalize": true}.
     """
+    if dimensions not in SUPPORTED_DIMENSIONS:
+        raise ValueError(f"Unsupported embedding dimensions: {dimensions}")
+
     try:
-        payload = {"inputText": text}
+        payload = {"inputText": text, "dimensions": dimensions, "normalize": True}
 
         response = bedrock.invoke_model(
             modelId="amazon.titan-embed-text-v2:0",
@@ -51,7 +78,8 @@ def get_embedding(text: str):
 
         # Titan v2 always returns: {"embedding": [float, float, ...]}
         if "embedding" in result:
-            return result["embedding"]
+            # Re-normalize locally so stored vectors are unit length regardless of rounding
+            return normalize_vector(result["embedding"])
         else:
             raise KeyError(f"Unexpected Titan response format: {result}")
 
@@ -60,11 +88,59 @@ def get_embedding(text: str):
         raise
 
 
+def memory_text(user_id: str, tier: str, message: str, response_text: str) -> str:
+    """Combined text that gets embedded for one memory."""
+    return (
+        f"User: {user_id} | Tier: {tier} | "
+        f"Message: {message} | Response: {response_text}"
+    )
+
+
+# ===== DEDUP =====
+def merge_duplicate(user_id: str, digest: str, existing_key: str, timestamp: str):
+    """
+    Fold a duplicate into the memory its content-hash marker points at. Returns the
+    handler response, or None when this memory should be stored (and now owns the marker).
+    """
+    try:
+        vectors_table.update_item(
+            Key={"user_id": user_id, "timestamp": existing_key},
+            UpdateExpression="ADD hit_count :one SET last_seen = :now",
+            ConditionExpression="attribute_exists(user_id)",
+            ExpressionAttributeValues={":one": 1, ":now": timestamp},
+        )
+        print(f"♻️ Duplicate memory for user {user_id} merged into {existing_key}")
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"message": "Duplicate memory merged", "duplicate_of": existing_key}),
+        }
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+    # No memory behind the marker: either its writer is still embedding (concurrent
+    # duplicate) or the memory was evicted and the marker outlived it
+    try:
+        claim_age = (datetime.fromisoformat(timestamp) - datetime.fromisoformat(existing_key)).total_seconds()
+    except ValueError:
+        claim_age = DEDUP_CLAIM_GRACE_SECONDS
+    if claim_age < DEDUP_CLAIM_GRACE_SECONDS or not lexical_index.point_content_hash(
+            term_table, user_id, digest, timestamp, expected=existing_key):
+        print(f"♻️ Duplicate memory for user {user_id} is already being stored as {existing_key}")
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"message": "Duplicate memory pending", "duplicate_of": existing_key}),
+        }
+    return None
+
+
 # ===== MAIN LAMBDA HANDLER =====
+@profiled
 def lambda_handler(event, context):
     """
     Triggered asynchronously from check_in_handler to persist semantic memory.
-    Stores [user_id, timestamp, message, tier, response, embedding] in SainiVectors.
+    Stores [user_id, timestamp, message, tier, response, embedding] in SainiUserVectors;
+    content already stored for the user is merged into the existing memory instead.
     """
     try:
         # Handle both API Gateway & direct Lambda invokes
@@ -85,39 +161,74 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "Missing user_id or message"})
             }
 
-        # Combine text context for embedding
-        combined_text = (
-            f"User: {user_id} | Tier: {tier} | "
-            f"Message: {message} | Response: {response_text}"
-        )
-
-        # Generate Titan embedding
-        embedding = get_embedding(combined_text)
-        print(f"[Titan] Embedding length: {len(embedding)}")
-
-        # Convert floats → Decimal for DynamoDB
-        embedding_decimal = float_to_decimal(embedding)
-
-        # Write record to DynamoDB
+        # Content-hash dedup: identical check-ins/auto nudges bump the existing memory.
+        # Best-effort: if SainiTermIndex is unavailable the memory is stored without it.
         record_id = str(uuid.uuid4())
-        vectors_table.put_item(
-            Item={
-                "vector_id": record_id,
-                "user_id": user_id,
-                "timestamp": datetime.utcnow().isoformat(),
-                "message": message,
-                "tier": tier,
-                "response": response_text,
-                "embedding": embedding_decimal,
-            }
-        )
+        timestamp = datetime.utcnow().isoformat()
+        digest = lexical_index.content_hash(message, response_text)
+        claimed = False
+        try:
+            existing_key = lexical_index.claim_content_hash(term_table, user_id, digest, timestamp)
+            claimed = existing_key is None
+            if existing_key:
+                duplicate = merge_duplicate(user_id, digest, existing_key, timestamp)
+                if duplicate:
+                    return duplicate
+                claimed = True
+        except Exception as dedup_err:
+            print(f"⚠️ Dedup check failed, storing memory without it: {dedup_err}")
+
+        try:
+            # Combine text context for embedding
+            combined_text = memory_text(user_id, tier, message, response_text)
+
+            # Generate Titan embedding
+            embedding = get_embedding(combined_text)
+            print(f"[Titan] Embedding length: {len(embedding)}")
+
+            # Convert floats → Decimal for DynamoDB
+            embedding_decimal = float_to_decimal(embedding)
+
+            # Write record to DynamoDB (keyed by user_id + timestamp)
+            vectors_table.put_item(
+                Item={
+                    "user_id": user_id,
+                    "timestamp": timestamp,
+                    "vector_id": record_id,
+                    "message": message,
+                    "tier": tier,
+                    "response": response_text,
+                    "embedding": embedding_decimal,
+                    "embedding_dim": len(embedding),
+                    "normalized": True,
+                    "content_hash": digest,
+                    "hit_count": 1,
+                    "last_seen": timestamp,
+                }
+            )
+        except Exception:
+            # Free the hash so a retry of this memory is not treated as a duplicate
+            if claimed:
+                try:
+                    lexical_index.release_content_hash(term_table, user_id, digest)
+                except Exception as release_err:
+                    print(f"⚠️ Could not release content hash: {release_err}")
+            raise
 
         print(f"✅ Vector memory stored successfully for user {user_id} (ID={record_id})")
+
+        # Keep the user's BM25 index in step; vector memory is still usable if this fails
+        try:
+            terms = lexical_index.index_memory(term_table, user_id, timestamp, message, response_text)
+            print(f"[Lexical] Indexed {terms} tokens for user {user_id}")
+        except Exception as idx_err:
+            print(f"⚠️ Lexical index update failed: {idx_err}")
         return {
             "statusCode": 200,
             "body": json.dumps({
                 "message": "Vector stored successfully",
                 "vector_id": record_id,
+                "timestamp": timestamp,
                 "embedding_dim": len(embedding)
             }),
         }
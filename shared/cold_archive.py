@@ -0,0 +1,133 @@
+"""
+Cold storage for archived check-ins: zstd-compressed Parquet partitioned by user and month.
+
+    <ARCHIVE_URI>/user_id=<quoted user_id>/month=YYYY-MM/part-<run_id>.parquet
+
+ARCHIVE_URI is a local directory or s3://bucket/prefix (anything pyarrow.fs understands).
+Rows keep their DynamoDB attributes; every partition holds whole check-ins, so a reader can
+prune by user and month from the path alone.
+"""
+import json
+import os
+from urllib.parse import quote, unquote
+
+from row_encoding import to_builtin
+
+ARCHIVE_URI = os.getenv("ARCHIVE_URI", "")
+COMPRESSION = "zstd"
+
+
+# ===== LAYOUT =====
+def _filesystem(uri):
+    from pyarrow import fs
+    return fs.FileSystem.from_uri(uri)
+
+
+def month_of(timestamp) -> str:
+    return str(timestamp)[:7]
+
+
+def partition_dir(root, user_id, month):
+    return f"{root.rstrip('/')}/user_id={quote(str(user_id), safe='')}/month={month}"
+
+
+def _months_between(start, end):
+    """Inclusive YYYY-MM bounds for pruning (None = open-ended)."""
+    return (month_of(start) if start else None, month_of(end) if end else None)
+
+
+def _column(values):
+    """Arrow column for one attribute; mixed/irregular types fall back to JSON text."""
+    import pyarrow as pa
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else v if isinstance(v, str) else json.dumps(v) for v in values])
+
+
+# ===== WRITE =====
+def write_partition(rows, user_id, month, run_id, uri=None):
+    """Write one user-month of check-ins; returns the file path."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    filesystem, root = _filesystem(uri or ARCHIVE_URI)
+    rows = to_builtin(rows)
+    columns = list(dict.fromkeys(k for r in rows for k in r))
+    arrow_table = pa.table({c: _column([r.get(c) for r in rows]) for c in columns})
+
+    directory = partition_dir(root, user_id, month)
+    filesystem.create_dir(directory, recursive=True)
+    path = f"{directory}/part-{run_id}.parquet"
+    pq.write_table(arrow_table, path, filesystem=filesystem, compression=COMPRESSION)
+    return path
+
+
+def verify_partition(path, expected_keys, uri=None):
+    """True when the file reads back with exactly the expected (user_id, timestamp) keys."""
+    import pyarrow.parquet as pq
+
+    filesystem, _ = _filesystem(uri or ARCHIVE_URI)
+    written = pq.read_table(path, filesystem=filesystem, columns=["user_id", "timestamp"]).to_pylist()
+    return len(written) == len(expected_keys) and {(r["user_id"], r["timestamp"]) for r in written} == set(expected_keys)
+
+
+# ===== READ =====
+def _list_dirs(filesystem, path, prefix):
+    from pyarrow import fs
+    try:
+        infos = filesystem.get_file_info(fs.FileSelector(path, allow_not_found=True))
+    except FileNotFoundError:
+        return []
+    return [i.path for i in infos if i.type == fs.FileType.Directory and i.base_name.startswith(prefix)]
+
+
+def _list_files(filesystem, path):
+    from pyarrow import fs
+    infos = filesystem.get_file_info(fs.FileSelector(path, allow_not_found=True))
+    return sorted(i.path for i in infos if i.type == fs.FileType.File and i.path.endswith(".parquet"))
+
+
+def list_archived_users(uri=None):
+    """User ids with at least one archived partition (from the directory names alone)."""
+    uri = uri or ARCHIVE_URI
+    if not uri:
+        return []
+    filesystem, root = _filesystem(uri)
+    return sorted(unquote(d.rsplit("user_id=", 1)[-1]) for d in _list_dirs(filesystem, root.rstrip("/"), "user_id="))
+
+
+def iter_archive(user_ids=None, start=None, end=None, uri=None):
+    """
+    Yield archived check-ins (dicts), pruned by user and month from the partition paths and
+    then filtered to [start, end] on timestamp. user_ids=None reads every user.
+    """
+    uri = uri or ARCHIVE_URI
+    if not uri:
+        return
+    import pyarrow.parquet as pq
+
+    filesystem, root = _filesystem(uri)
+    root = root.rstrip("/")
+    if user_ids:
+        user_dirs = [f"{root}/user_id={quote(str(u), safe='')}" for u in user_ids]
+    else:
+        user_dirs = _list_dirs(filesystem, root, "user_id=")
+
+    lo, hi = _months_between(start, end)
+    for user_dir in user_dirs:
+        for month_dir in sorted(_list_dirs(filesystem, user_dir, "month=")):
+            month = month_dir.rsplit("month=", 1)[-1]
+            if (lo and month < lo) or (hi and month > hi):
+                continue
+            # A run that died between writing and marking leaves rows that a later run archives
+            # again, so keys are de-duplicated within the (bounded) user-month
+            seen = set()
+            for path in _list_files(filesystem, month_dir):
+                for row in pq.read_table(path, filesystem=filesystem).to_pylist():
+                    ts = str(row.get("timestamp", ""))
+                    if ts in seen or (start and ts < start) or (end and ts > end):
+                        continue
+                    seen.add(ts)
+                    row.setdefault("user_id", unquote(user_dir.rsplit("user_id=", 1)[-1]))
+                    yield row
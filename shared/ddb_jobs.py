@@ -0,0 +1,57 @@
+"""
+DynamoDB plumbing for the batch jobs (migrate_vectors, reembed_memory, compact_memory,
+backfill_lexical_index, build_ann_index, archive_checkins, auto_nudge_runner).
+
+    table(name)                              # this thread's Table; boto3 resources aren't thread-safe
+    scan_items(name, Segment=0, TotalSegments=8, ProjectionExpression=...)
+    list_users(name)                         # distinct user_ids (keys-only scan)
+    load_memories(name, user_id, ProjectionExpression=...)
+"""
+import os
+import threading
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+REGION = os.getenv("AWS_REGION", "us-east-2")
+
+_local = threading.local()
+
+
+def table(name: str):
+    """boto3 resources are not thread-safe, so each worker thread gets its own session."""
+    if not hasattr(_local, "dynamodb"):
+        _local.dynamodb = boto3.session.Session().resource("dynamodb", region_name=REGION)
+        _local.tables = {}
+    if name not in _local.tables:
+        _local.tables[name] = _local.dynamodb.Table(name)
+    return _local.tables[name]
+
+
+def scan_items(name: str, **scan):
+    """Every item a (segmented, filtered, projected) scan returns, page by page."""
+    while True:
+        resp = table(name).scan(**scan)
+        yield from resp.get("Items", [])
+        if "LastEvaluatedKey" not in resp:
+            return
+        scan["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def query_items(name: str, **query):
+    while True:
+        resp = table(name).query(**query)
+        yield from resp.get("Items", [])
+        if "LastEvaluatedKey" not in resp:
+            return
+        query["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def list_users(name: str):
+    """Distinct user_ids in a user-partitioned table (keys-only scan)."""
+    return sorted({i["user_id"] for i in scan_items(name, ProjectionExpression="user_id") if "user_id" in i})
+
+
+def load_memories(name: str, user_id: str, **query):
+    """All of one user's items; pass ProjectionExpression to skip the embeddings."""
+    return list(query_items(name, KeyConditionExpression=Key("user_id").eq(user_id), **query))
@@ -0,0 +1,103 @@
+"""
+Each user's latest check-in, kept on their SainiChangeVersions item ("user#<id>") by the
+check-ins stream handler (ui/lambda_function.py) and indexed by the sparse last-activity GSI
+(HASH kind = "user", RANGE last_activity). Readers query the index instead of scanning
+every check-in:
+
+    record(versions_table, {user_id: timestamp})    # one stream batch's newest rows
+    user_ids(versions_table)                         # every user, most recently active first
+    user_ids(versions_table, before=cutoff)          # users inactive since cutoff
+    newest(versions_table)                           # (user_id, timestamp) of the latest check-in
+
+Seed it once for the existing history (after infra/dynamodb_setup.py adds the index):
+
+    python shared/last_activity.py
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+import ddb_jobs
+
+LAST_ACTIVITY_INDEX = os.getenv("LAST_ACTIVITY_INDEX", "last-activity-index")
+KIND = "user"
+USER_PREFIX = "user#"
+BACKFILL_SEGMENTS = int(os.getenv("LAST_ACTIVITY_SEGMENTS", "4"))
+
+
+def record(table, latest):
+    """Move each user's last_activity forward to the given timestamp (never back)."""
+    for user_id, ts in latest.items():
+        try:
+            table.update_item(
+                Key={"scope": f"{USER_PREFIX}{user_id}"},
+                UpdateExpression="SET #kind = :kind, last_activity = :ts",
+                ConditionExpression="attribute_not_exists(last_activity) OR last_activity < :ts",
+                ExpressionAttributeNames={"#kind": "kind"},
+                ExpressionAttributeValues={":kind": KIND, ":ts": ts},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+
+def _query(table, **query):
+    query = {"IndexName": LAST_ACTIVITY_INDEX, "ScanIndexForward": False, **query}
+    while True:
+        resp = table.query(**query)
+        yield from resp.get("Items", [])
+        if "LastEvaluatedKey" not in resp:
+            return
+        query["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def user_ids(table, before=None):
+    """Users by last check-in, newest first; with `before`, only those idle since then."""
+    cond = Key("kind").eq(KIND)
+    if before:
+        cond &= Key("last_activity").lt(before)
+    return [i["scope"][len(USER_PREFIX):] for i in _query(table, KeyConditionExpression=cond)]
+
+
+def newest(table):
+    """(user_id, timestamp) of the most recent check-in, or None on an empty table."""
+    resp = table.query(IndexName=LAST_ACTIVITY_INDEX, KeyConditionExpression=Key("kind").eq(KIND),
+                       ScanIndexForward=False, Limit=1)
+    items = resp.get("Items", [])
+    return (items[0]["scope"][len(USER_PREFIX):], items[0]["last_activity"]) if items else None
+
+
+# ===== BACKFILL =====
+def _latest_in_segment(checkins_table_name, segment, total_segments):
+    latest = {}
+    for item in ddb_jobs.scan_items(checkins_table_name, Segment=segment, TotalSegments=total_segments,
+                                    ProjectionExpression="user_id, #ts",
+                                    ExpressionAttributeNames={"#ts": "timestamp"}):
+        uid, ts = item.get("user_id"), item.get("timestamp", "")
+        if uid and ts > latest.get(uid, ""):
+            latest[uid] = ts
+    return latest
+
+
+def backfill(checkins_table_name, versions_table, segments=BACKFILL_SEGMENTS):
+    """Seed last_activity from a parallel scan of the check-ins; safe to rerun at any time."""
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        parts = list(pool.map(lambda seg: _latest_in_segment(checkins_table_name, seg, segments),
+                              range(segments)))
+    latest = {}
+    for part in parts:
+        for uid, ts in part.items():
+            if ts > latest.get(uid, ""):
+                latest[uid] = ts
+    record(versions_table, latest)
+    print(f"✅ Recorded last activity for {len(latest)} users")
+    return len(latest)
+
+
+if __name__ == "__main__":
+    import boto3
+    dynamodb = boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION", "us-east-2"))
+    backfill(os.getenv("TABLE_NAME", "SainiCheckins"),
+             dynamodb.Table(os.getenv("VERSION_TABLE", "SainiChangeVersions")))
@@ -0,0 +1,148 @@
+"""
+Opt-in cProfile + tracemalloc for Lambda handlers.
+
+    @profiled
+    def lambda_handler(event, context): ...
+
+PROFILE=1 profiles every invocation; PROFILE_SAMPLE_RATE=0.05 profiles ~5% of them. A profiled
+invocation logs its wall time, peak traced memory, the top PROFILE_TOP_N functions by cumulative
+time and the top allocation sites, and saves <function>-<request id>.prof (pstats / snakeviz)
+and the near-peak .tracemalloc snapshot (tracemalloc.Snapshot.load) under PROFILE_DIR, uploading them to
+PROFILE_S3_URI when set. With both unset the handler is returned undecorated, so there is no overhead.
+Lives in shared/ and is packaged into both the lambda/ functions and the dashboard API.
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+
+PROFILE_ALWAYS = os.getenv("PROFILE", "").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "20"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+PROFILE_S3_URI = os.getenv("PROFILE_S3_URI", "")
+# Stack depth recorded per allocation; deeper is more useful and slower
+PROFILE_TRACE_FRAMES = int(os.getenv("PROFILE_TRACE_FRAMES", "5"))
+# How often the sampler checks traced memory to keep a snapshot from near the peak
+PROFILE_SNAPSHOT_INTERVAL_S = float(os.getenv("PROFILE_SNAPSHOT_INTERVAL_MS", "100")) / 1000
+
+_ENABLED = PROFILE_ALWAYS or PROFILE_SAMPLE_RATE > 0
+_active = False
+
+
+def _should_profile():
+    return PROFILE_ALWAYS or random.random() < PROFILE_SAMPLE_RATE
+
+
+def _top_functions(profiler):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+    return out.getvalue()
+
+
+def _top_allocations(snapshot):
+    stats = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ]).statistics("lineno")
+    return "\n".join(f"  {s.size / 1024:10.1f} KiB  {s.count:8d} blocks  {s.traceback}"
+                     for s in stats[:PROFILE_TOP_N])
+
+
+class _PeakSampler(threading.Thread):
+    """Keeps the tracemalloc snapshot taken closest to peak traced memory (transient blow-ups
+    like json.dumps of a whole table are gone by the time the handler returns)."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.snapshot, self.size = None, 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(PROFILE_SNAPSHOT_INTERVAL_S):
+            self.check()
+
+    def check(self):
+        current = tracemalloc.get_traced_memory()[0]
+        # Re-snapshot only on ~10% growth: each snapshot walks every live trace
+        if current > self.size * 1.1:
+            self.snapshot, self.size = tracemalloc.take_snapshot(), current
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.check()
+
+
+def _upload(paths):
+    import boto3
+    bucket, _, prefix = PROFILE_S3_URI[len("s3://"):].partition("/")
+    s3 = boto3.client("s3")
+    for path in paths:
+        s3.upload_file(path, bucket, f"{prefix.rstrip('/')}/{os.path.basename(path)}".lstrip("/"))
+
+
+def _save(name, request_id, profiler, snapshot):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{name}-{request_id}")
+    profiler.dump_stats(f"{stem}.prof")
+    snapshot.dump(f"{stem}.tracemalloc")
+    paths = [f"{stem}.prof", f"{stem}.tracemalloc"]
+    if PROFILE_S3_URI:
+        _upload(paths)
+    return paths
+
+
+def _run_profiled(handler, event, context):
+    global _active
+    name = f"{handler.__module__}.{handler.__name__}"
+    request_id = getattr(context, "aws_request_id", None) or f"local-{int(time.time() * 1000)}"
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(PROFILE_TRACE_FRAMES)
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    sampler = _PeakSampler()
+    _active = True
+    started = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        return handler(event, context)
+    finally:
+        profiler.disable()
+        wall_ms = (time.perf_counter() - started) * 1000
+        _active = False
+        sampler.stop()
+        snapshot = sampler.snapshot or tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            paths = _save(handler.__module__, request_id, profiler, snapshot)
+        except Exception as e:
+            paths = [f"not saved: {e}"]
+        print(f"🔬 [Profile] {name} {request_id}: {wall_ms:.0f} ms, peak traced {peak / 1048576:.1f} MiB, "
+              f"snapshot at {sampler.size / 1048576:.1f} MiB, files: {', '.join(paths)}")
+        print(f"🔬 [Profile] top {PROFILE_TOP_N} functions by cumulative time:\n{_top_functions(profiler)}")
+        print(f"🔬 [Profile] top {PROFILE_TOP_N} allocation sites near peak:\n{_top_allocations(snapshot)}")
+
+
+def profiled(handler):
+    """Profile sampled invocations of a Lambda handler (see module docstring)."""
+    if not _ENABLED:
+        return handler
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        # Nested handlers (one Lambda calling another in-process) are covered by the outer profile
+        if _active or not _should_profile():
+            return handler(event, context)
+        return _run_profiled(handler, event, context)
+
+    return wrapper
@@ -0,0 +1,45 @@
+"""
+Check-in rows → wire formats, shared by lambda/get_checkins.py, the dashboard API
+(ui/lambda_function.py) and the Parquet archive (cold_archive.py).
+
+    json.dumps(rows, default=plain)   # Decimal / set → int, float, list
+    encode_arrow(rows)                # Arrow IPC stream; needs pyarrow in the deployment
+"""
+from decimal import Decimal
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+NDJSON = "application/x-ndjson"
+
+
+def plain(value):
+    """json.dumps default: DynamoDB returns numbers as Decimal; JSON and Arrow want int/float."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, set):
+        # String sets hold str, number sets Decimal
+        return sorted(plain(v) if isinstance(v, Decimal) else v for v in value)
+    raise TypeError(f"Not serializable: {type(value).__name__}")
+
+
+def to_builtin(obj):
+    """Recursive plain(): a DynamoDB item (or list of them) as builtin Python types."""
+    if isinstance(obj, list):
+        return [to_builtin(v) for v in obj]
+    if isinstance(obj, dict):
+        return {k: to_builtin(v) for k, v in obj.items()}
+    if isinstance(obj, (Decimal, set)):
+        return plain(obj)
+    return obj
+
+
+def encode_arrow(rows):
+    """Arrow IPC stream of the rows; requires pyarrow in the deployment package/layer."""
+    import pyarrow as pa
+    rows = to_builtin(rows)
+    # Union of keys: DynamoDB items are schemaless, and from_pylist only looks at the first row
+    columns = list(dict.fromkeys(k for r in rows for k in r))
+    table = pa.table({c: [r.get(c) for r in rows] for c in columns})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,52 @@
+"""
+Shared fixtures. Lambda and dashboard modules are flat scripts, so their directories go on
+sys.path. Tests that need DynamoDB run against DynamoDB Local (never AWS):
+
+    docker run -d -p 8000:8000 amazon/dynamodb-local
+    python -m pytest tests                        # DYNAMODB_LOCAL_ENDPOINT overrides the URL
+
+and are skipped when boto3 or the endpoint isn't available.
+"""
+import os
+import sys
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("lambda", "ui", "infra"):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+
+LOCAL_ENDPOINT = os.getenv("DYNAMODB_LOCAL_ENDPOINT", "http://localhost:8000")
+# Module-level boto3 clients in the Lambdas follow these, so nothing can reach real AWS
+os.environ["AWS_ENDPOINT_URL_DYNAMODB"] = LOCAL_ENDPOINT
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-2")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "local")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "local")
+
+
+@pytest.fixture(scope="session")
+def dynamodb_local():
+    """(client, resource) for DynamoDB Local with every declared table created."""
+    boto3 = pytest.importorskip("boto3")
+    from botocore.config import Config
+    from botocore.exceptions import BotoCoreError, ClientError
+    import dynamodb_setup
+
+    # Short timeouts and no retries, so a missing endpoint skips instead of hanging
+    probe = boto3.client("dynamodb", endpoint_url=LOCAL_ENDPOINT,
+                         config=Config(connect_timeout=1, read_timeout=2, retries={"max_attempts": 0}))
+    try:
+        probe.list_tables(Limit=1)
+    except (BotoCoreError, ClientError) as e:
+        pytest.skip(f"DynamoDB Local not reachable at {LOCAL_ENDPOINT}: {e}")
+
+    client, resource = dynamodb_setup.connect(LOCAL_ENDPOINT)
+    dynamodb_setup.apply(client)
+    return client, resource
+
+
+@pytest.fixture
+def run_id():
+    """A run key no other test uses, so tests share the tables without resetting them."""
+    return f"test-{uuid.uuid4().hex[:12]}"
@@ -0,0 +1,67 @@
+"""IVF snapshot build and search in lambda/ann_index.py."""
+import pytest
+
+np = pytest.importorskip("numpy")
+import ann_index  # noqa: E402
+
+DIM = 16
+
+
+def _records(users=8, per_user=40, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(4, DIM))
+    records = []
+    for u in range(users):
+        for i in range(per_user):
+            vec = centers[(u + i) % 4] + 0.1 * rng.normal(size=DIM)
+            records.append({"user_id": f"user{u}", "timestamp": f"2025-01-01T00:{i:02d}:00",
+                            "vector_id": f"v{u}-{i}", "embedding": vec.tolist()})
+    return records
+
+
+@pytest.fixture
+def index(tmp_path):
+    records = _records()
+    path = ann_index.build_index(records, str(tmp_path / "vectors.ivf"), nlist=8, built_at="2025-01-02T00:00:00")
+    return ann_index.AnnIndex(path), records
+
+
+def test_snapshot_round_trips_rows_and_build_time(index):
+    idx, records = index
+    assert idx.count == len(records) and idx.dim == DIM
+    assert idx.built_at == "2025-01-02T00:00:00"
+    assert idx.covers(["user0", "user7"]) and not idx.covers(["user0", "nobody"])
+
+
+def test_own_vector_is_the_top_hit(index):
+    idx, records = index
+    for r in records[::37]:
+        hit = idx.search(r["embedding"], k=1, nprobe=2)[0]
+        assert (hit["user_id"], hit["timestamp"]) == (r["user_id"], r["timestamp"])
+
+
+def test_user_filter_returns_k_results_from_that_user_only(index):
+    idx, records = index
+    query = records[0]["embedding"]
+    # One probed list rarely holds k rows of one user; search must fill up from exact scoring
+    hits = idx.search(query, k=10, user_ids=["user5"], nprobe=1)
+    assert len(hits) == 10
+    assert {h["user_id"] for h in hits} == {"user5"}
+    assert {h["vector_id"] for h in hits} == {h["vector_id"] for h in idx.exact_search(query, k=10, user_ids=["user5"])}
+
+
+def test_recall_against_exact_search(index):
+    idx, records = index
+    rng = np.random.default_rng(1)
+    found = total = 0
+    for _ in range(20):
+        query = rng.normal(size=DIM)
+        exact = {h["vector_id"] for h in idx.exact_search(query, k=5)}
+        found += len(exact & {h["vector_id"] for h in idx.search(query, k=5, nprobe=4)})
+        total += len(exact)
+    assert found / total >= 0.9
+
+
+def test_unknown_user_has_no_results(index):
+    idx, records = index
+    assert idx.search(records[0]["embedding"], k=3, user_ids=["nobody"]) == []
@@ -0,0 +1,115 @@
+"""Shard planning, leases, per-user claims and resume for lambda/auto_nudge_runner.py."""
+import datetime
+
+import pytest
+
+
+@pytest.fixture
+def runner(dynamodb_local, monkeypatch):
+    import auto_nudge_runner
+    monkeypatch.setattr(auto_nudge_runner, "NUDGE_INTERVAL_SECONDS", 0)
+    return auto_nudge_runner
+
+
+def _plan(runner, run_id, monkeypatch, users):
+    # The inactive-user scan covers the whole (shared) check-ins table; pin its answer
+    monkeypatch.setattr(runner, "find_inactive_users", lambda now: sorted(users))
+    return runner.plan_run(run_id, datetime.datetime.utcnow())
+
+
+def _shard(runner, run_id, shard):
+    return runner.runs_table.get_item(Key=runner._shard_key(run_id, shard), ConsistentRead=True)["Item"]
+
+
+def _users_in_one_shard(runner, n):
+    users, shard = [], None
+    i = 0
+    while len(users) < n:
+        uid = f"user-{i}"
+        if shard is None or runner.shard_of(uid) == shard:
+            shard = runner.shard_of(uid)
+            users.append(uid)
+        i += 1
+    # Shards keep the planned (sorted) order
+    return shard, sorted(users)
+
+
+def test_plan_run_writes_checkpoints_once(runner, run_id, monkeypatch):
+    users = [f"user-{i}" for i in range(40)]
+    assert _plan(runner, run_id, monkeypatch, users) is True
+    assert _plan(runner, run_id, monkeypatch, ["someone-else"]) is False
+
+    planned = []
+    for shard in range(runner.NUDGE_SHARDS):
+        item = _shard(runner, run_id, shard)
+        assert all(runner.shard_of(uid) == shard for uid in item["users"])
+        assert item["status"] == ("pending" if item["users"] else "done")
+        planned.extend(item["users"])
+    assert sorted(planned) == sorted(users)
+
+
+def test_lease_blocks_second_worker_until_it_expires(runner, run_id, monkeypatch):
+    shard, users = _users_in_one_shard(runner, 2)
+    _plan(runner, run_id, monkeypatch, users)
+    now = 1_700_000_000
+
+    assert runner.lease_shard(run_id, shard, now)
+    assert not runner.lease_shard(run_id, shard, now + 10)
+    # The first worker died: once its lease lapses another tick takes the shard over
+    assert runner.lease_shard(run_id, shard, now + runner.SHARD_LEASE_SECONDS + 1)
+
+
+def test_done_shard_is_never_leased(runner, run_id, monkeypatch):
+    shard, users = _users_in_one_shard(runner, 1)
+    _plan(runner, run_id, monkeypatch, users)
+    runner.save_cursor(run_id, shard, 1, "done")
+    assert not runner.lease_shard(run_id, shard, 1_700_000_000 + 10 * runner.SHARD_LEASE_SECONDS)
+
+
+def test_claim_user_once_and_stale_claim_reclaimed(runner, run_id):
+    now = 1_700_000_000
+    assert runner.claim_user(run_id, "u1", now)
+    assert not runner.claim_user(run_id, "u1", now + 5)
+    # A claim older than the lease belongs to a worker that died mid-send
+    stale = now + runner.SHARD_LEASE_SECONDS + 1
+    assert runner.claim_user(run_id, "u1", stale)
+
+    runner.mark_sent(run_id, "u1")
+    assert not runner.claim_user(run_id, "u1", stale + 10 * runner.SHARD_LEASE_SECONDS)
+
+
+def test_run_shard_pauses_and_resumes_from_cursor(runner, run_id, monkeypatch):
+    shard, users = _users_in_one_shard(runner, 3)
+    _plan(runner, run_id, monkeypatch, users)
+    sent = []
+    monkeypatch.setattr(runner, "send_nudge", sent.append)
+
+    class Context:
+        # Plenty of time for the first user, then under TIMEOUT_MARGIN_MS
+        remaining = iter([60_000, 1_000])
+
+        def get_remaining_time_in_millis(self):
+            return next(self.remaining)
+
+    first = runner.run_shard(run_id, shard, Context(), force=True)
+    assert first["done"] is False and first["sent"] == 1
+    item = _shard(runner, run_id, shard)
+    assert item["status"] == "pending" and int(item["cursor"]) == 1
+
+    second = runner.run_shard(run_id, shard, force=True)
+    assert second["done"] is True and second["sent"] == 2
+    assert sent == users
+    assert _shard(runner, run_id, shard)["status"] == "done"
+
+
+def test_rerun_after_crash_skips_users_already_claimed(runner, run_id, monkeypatch):
+    shard, users = _users_in_one_shard(runner, 2)
+    _plan(runner, run_id, monkeypatch, users)
+    # A previous worker claimed the first user, then died before saving its cursor
+    runner.claim_user(run_id, users[0], int(runner.time.time()))
+    sent = []
+    monkeypatch.setattr(runner, "send_nudge", sent.append)
+
+    result = runner.run_shard(run_id, shard, force=True)
+    assert sent == users[1:]
+    assert result["skipped"] == 1
@@ -0,0 +1,38 @@
+"""How ui/lambda_function.py merges hot rows with the cold archive."""
+import pytest
+
+pytest.importorskip("boto3")
+import cold_archive  # noqa: E402
+import lambda_function  # noqa: E402
+
+HOT = [
+    {"user_id": "u1", "timestamp": "2025-01-01T09:00:00", "archived_at": "2025-07-01"},
+    {"user_id": "u1", "timestamp": "2025-01-02T09:00:00", "archived_at": "2025-07-01"},
+    {"user_id": "u1", "timestamp": "2025-07-02T09:00:00"},
+]
+
+
+@pytest.fixture
+def archive(monkeypatch):
+    monkeypatch.setattr(cold_archive, "ARCHIVE_URI", "/tmp/unused-archive")
+    return monkeypatch
+
+
+def _stamps(rows):
+    return sorted(r["timestamp"] for r in rows)
+
+
+def test_archived_hot_rows_are_replaced_by_the_archive(archive):
+    archive.setattr(cold_archive, "iter_archive", lambda users, lo, hi: iter([dict(HOT[0]), dict(HOT[1])]))
+    rows = list(lambda_function._with_archive(iter(HOT), {}))
+    assert _stamps(rows) == _stamps(HOT) and len(rows) == 3
+
+
+def test_unreadable_archive_falls_back_to_archived_hot_rows(archive):
+    def broken(users, lo, hi):
+        yield dict(HOT[0])
+        raise OSError("bucket unreachable")
+
+    archive.setattr(cold_archive, "iter_archive", broken)
+    # The row the archive served isn't repeated; the one it never reached still comes back
+    assert _stamps(lambda_function._with_archive(iter(HOT), {})) == _stamps(HOT)
@@ -0,0 +1,40 @@
+"""HyperLogLog distinct counts in ui/hll.py."""
+import pytest
+
+from hll import M, HyperLogLog
+
+
+def _sketch(values):
+    sketch = HyperLogLog()
+    for v in values:
+        sketch.add(v)
+    return sketch
+
+
+def test_empty_and_small_counts_are_exact_enough():
+    assert HyperLogLog().count() == 0
+    assert _sketch(["a", "b", "c", "a"]).count() == 3
+
+
+@pytest.mark.parametrize("n", [1_000, 50_000])
+def test_estimate_within_error_bound(n):
+    # Standard error is ~1.6% at P=12; allow 4 sigma
+    assert abs(_sketch(f"user{i}" for i in range(n)).count() - n) <= 0.065 * n
+
+
+def test_duplicates_do_not_count():
+    assert _sketch(f"user{i % 100}" for i in range(10_000)).count() == _sketch(f"user{i}" for i in range(100)).count()
+
+
+def test_merge_is_the_union():
+    left = _sketch(f"user{i}" for i in range(0, 6_000))
+    right = _sketch(f"user{i}" for i in range(4_000, 10_000))
+    union = _sketch(f"user{i}" for i in range(10_000))
+    assert left.merge(right).to_bytes() == union.to_bytes()
+
+
+def test_registers_round_trip_and_are_validated():
+    sketch = _sketch(["x", "y"])
+    assert HyperLogLog(sketch.to_bytes()).count() == sketch.count()
+    with pytest.raises(ValueError):
+        HyperLogLog(bytes(M - 1))
@@ -0,0 +1,27 @@
+"""Per-user last activity and its GSI (shared/last_activity.py, DynamoDB Local)."""
+import pytest
+
+pytest.importorskip("boto3")
+import last_activity  # noqa: E402
+
+
+@pytest.fixture
+def versions(dynamodb_local):
+    return dynamodb_local[1].Table("SainiChangeVersions")
+
+
+def test_record_only_moves_forward(versions, run_id):
+    last_activity.record(versions, {run_id: "2025-05-02T10:00:00"})
+    last_activity.record(versions, {run_id: "2025-05-01T10:00:00"})  # a late, older stream record
+    item = versions.get_item(Key={"scope": f"user#{run_id}"}, ConsistentRead=True)["Item"]
+    assert item["last_activity"] == "2025-05-02T10:00:00"
+
+
+def test_user_ids_splits_on_the_cutoff(versions, run_id):
+    idle, active = f"{run_id}-idle", f"{run_id}-active"
+    last_activity.record(versions, {idle: "2001-01-01T00:00:00", active: "2001-06-01T00:00:00"})
+    inactive = last_activity.user_ids(versions, before="2001-03-01T00:00:00")
+    assert idle in inactive and active not in inactive
+    everyone = last_activity.user_ids(versions)
+    # Most recently active first
+    assert everyone.index(active) < everyone.index(idle)
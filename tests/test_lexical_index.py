@@ -0,0 +1,87 @@
+"""BM25 postings, ranking and content-hash dedup in lambda/lexical_index.py (DynamoDB Local)."""
+import pytest
+
+pytest.importorskip("boto3")
+import lexical_index  # noqa: E402
+
+MEMORIES = [
+    ("2025-01-01T09:00:00", "Missed my bus to court again", "That sounds stressful."),
+    ("2025-01-02T09:00:00", "Court date moved, felt calm about it", "Good to hear you stayed calm."),
+    ("2025-01-03T09:00:00", "Slept badly, tired at work", "Rest matters."),
+]
+
+
+@pytest.fixture
+def terms(dynamodb_local):
+    return dynamodb_local[1].Table(lexical_index.TERM_INDEX_TABLE)
+
+
+def _index(terms, user_id):
+    for ts, message, response in MEMORIES:
+        lexical_index.index_memory(terms, user_id, ts, message, response)
+
+
+def test_tokenize_drops_stopwords_and_keeps_names():
+    assert lexical_index.tokenize("I took my Sertraline at the clinic") == ["took", "sertraline", "clinic"]
+
+
+def test_search_ranks_full_match_first(terms, run_id):
+    _index(terms, run_id)
+    hits = lexical_index.search(terms, run_id, "bus court")
+    assert [h["timestamp"] for h in hits] == ["2025-01-01T09:00:00", "2025-01-02T09:00:00"]
+    assert hits[0]["coverage"] == 1.0 and hits[1]["coverage"] == 0.5
+    assert lexical_index.is_confident(hits, min_score=0.1, margin=1.2)
+
+
+def test_search_is_per_user(terms, run_id):
+    _index(terms, run_id)
+    assert lexical_index.search(terms, f"{run_id}-other", "court") == []
+
+
+def test_remove_memory_drops_postings_and_counts(terms, run_id):
+    _index(terms, run_id)
+    ts, message, response = MEMORIES[0]
+    lexical_index.remove_memory(terms, run_id, ts, message, response)
+    assert [h["timestamp"] for h in lexical_index.search(terms, run_id, "bus")] == []
+    stats = terms.get_item(Key={"user_id": run_id, "entry": lexical_index.STATS_ENTRY})["Item"]
+    assert int(stats["doc_count"]) == 2
+
+
+def test_reindex_user_is_idempotent(terms, run_id):
+    memories = [{"timestamp": ts, "message": m, "response": r} for ts, m, r in MEMORIES]
+    assert lexical_index.reindex_user(terms, run_id, memories) == 3
+    first = terms.get_item(Key={"user_id": run_id, "entry": lexical_index.STATS_ENTRY})["Item"]
+    lexical_index.reindex_user(terms, run_id, memories)
+    second = terms.get_item(Key={"user_id": run_id, "entry": lexical_index.STATS_ENTRY})["Item"]
+    assert first["doc_count"] == second["doc_count"] == 3
+    assert first["total_len"] == second["total_len"]
+
+
+def test_content_hash_claim_and_conditional_repoint(terms, run_id):
+    digest = lexical_index.content_hash("Same  words", "same REPLY")
+    assert digest == lexical_index.content_hash("same words", "same reply")
+    assert lexical_index.claim_content_hash(terms, run_id, digest, "t1") is None
+    assert lexical_index.claim_content_hash(terms, run_id, digest, "t2") == "t1"
+    # Only the writer that still sees "t1" may move the marker
+    assert lexical_index.point_content_hash(terms, run_id, digest, "t2", expected="t1")
+    assert not lexical_index.point_content_hash(terms, run_id, digest, "t3", expected="t1")
+
+
+def test_reindex_user_drops_postings_of_removed_memories(terms, run_id):
+    memories = [{"timestamp": ts, "message": m, "response": r} for ts, m, r in MEMORIES]
+    lexical_index.reindex_user(terms, run_id, memories)
+    # The bus memory was deleted from the vectors table without its postings
+    assert lexical_index.reindex_user(terms, run_id, memories[1:]) == 2
+    assert lexical_index.search(terms, run_id, "bus") == []
+    assert int(lexical_index.read_stats(terms, run_id)["doc_count"]) == 2
+
+
+def test_reindex_user_yields_to_concurrent_index_memory(terms, run_id):
+    memories = [{"timestamp": ts, "message": m, "response": r} for ts, m, r in MEMORIES]
+    stats = lexical_index.read_stats(terms, run_id)
+    # A new memory is indexed between the counter read and the rebuild
+    lexical_index.index_memory(terms, run_id, "2025-01-04T09:00:00", "New bus route", "Nice.")
+    assert lexical_index.reindex_user(terms, run_id, memories, stats) is None
+    assert int(lexical_index.read_stats(terms, run_id)["doc_count"]) == 1
+    # Nothing was rebuilt, so the new memory is still searchable
+    assert [h["timestamp"] for h in lexical_index.search(terms, run_id, "route")] == ["2025-01-04T09:00:00"]
@@ -0,0 +1,29 @@
+"""Legacy SainiVectors → SainiUserVectors copy in lambda/migrate_vectors.py (DynamoDB Local)."""
+import pytest
+
+pytest.importorskip("boto3")
+import ddb_jobs  # noqa: E402
+import migrate_vectors  # noqa: E402
+
+
+@pytest.fixture
+def target(dynamodb_local):
+    return migrate_vectors.table(migrate_vectors.TARGET_TABLE)
+
+
+def test_shared_timestamp_is_renamed_not_overwritten(target, run_id):
+    first = {"vector_id": "v1", "user_id": run_id, "timestamp": "2025-01-01T09:00:00", "message": "a"}
+    second = dict(first, vector_id="v2", message="b")
+    assert migrate_vectors.copy_item(target, first) == "copied"
+    assert migrate_vectors.copy_item(target, second) == "renamed"
+
+    items = ddb_jobs.load_memories(migrate_vectors.TARGET_TABLE, run_id)
+    assert {(i["timestamp"], i["message"]) for i in items} == {
+        ("2025-01-01T09:00:00", "a"), ("2025-01-01T09:00:00#v2", "b")}
+    renamed = next(i for i in items if i["vector_id"] == "v2")
+    assert renamed["legacy_timestamp"] == renamed["last_seen"] == "2025-01-01T09:00:00"
+
+    # A rerun finds both records where the first run put them
+    assert migrate_vectors.copy_item(target, first) == "existing"
+    assert migrate_vectors.copy_item(target, second) == "existing"
+    assert len(ddb_jobs.load_memories(migrate_vectors.TARGET_TABLE, run_id)) == 2
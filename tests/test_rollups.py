@@ -0,0 +1,122 @@
+"""Period bucketing and stream deltas in ui/rollups.py."""
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("boto3")
+import rollups  # noqa: E402
+
+
+def test_periods_floor_to_hour_day_and_monday():
+    dt = datetime(2025, 3, 6, 17, 45, 12)  # a Thursday
+    assert rollups.period_key(dt, "h") == "2025-03-06T17"
+    assert rollups.period_key(dt, "d") == "2025-03-06"
+    assert rollups.period_key(dt, "w") == "2025-03-03"
+
+
+@pytest.mark.parametrize("bucket, expected", [("day", (1, "d")), ("hourly", (1, "h")), ("6h", (6, "h")), ("2w", (2, "w"))])
+def test_parse_bucket(bucket, expected):
+    assert rollups.parse_bucket(bucket) == expected
+
+
+@pytest.mark.parametrize("bucket", ["0d", "month", "3x"])
+def test_parse_bucket_rejects_unknown(bucket):
+    with pytest.raises(ValueError):
+        rollups.parse_bucket(bucket)
+
+
+def _row(**kw):
+    return {"user_id": "u1", "timestamp": "2025-03-06T17:45:12", "tier": "Stable", "tone": "calm", **kw}
+
+
+def test_insert_counts_every_scope_and_unit():
+    deltas = rollups.new_deltas()
+    rollups.add_change(None, _row(), deltas)
+    assert deltas["counts"][("all#d", "2025-03-06")] == {"n": 1, "tier#Stable": 1, "tone#calm": 1}
+    assert deltas["counts"][("user#u1#w", "2025-03-03")]["n"] == 1
+    assert len(deltas["counts"]) == 6
+    assert deltas["users"]["2025-03-06"] == {"u1"}
+
+
+def test_tier_change_moves_the_count_and_text_edit_cancels_out():
+    deltas = rollups.new_deltas()
+    rollups.add_change(_row(), _row(tier="At-Risk"), deltas)
+    day = deltas["counts"][("all#d", "2025-03-06")]
+    assert day["n"] == 0 and day["tier#Stable"] == -1 and day["tier#At-Risk"] == 1
+
+    edit = rollups.new_deltas()
+    rollups.add_change(_row(message="a"), _row(message="b"), edit)
+    assert all(not any(attrs.values()) for attrs in edit["counts"].values())
+
+
+def test_remove_subtracts_but_keeps_the_user_sketch():
+    deltas = rollups.new_deltas()
+    rollups.add_change(_row(), None, deltas)
+    assert deltas["counts"][("all#h", "2025-03-06T17")]["n"] == -1
+    assert not deltas["users"]
+
+
+# ===== STREAM FLUSH (DynamoDB Local) =====
+def _record(seq, user_id, ts, tier="Stable"):
+    image = {"user_id": {"S": user_id}, "timestamp": {"S": ts}, "tier": {"S": tier}, "tone": {"S": "calm"}}
+    return {"eventID": f"evt-{user_id}-{seq}", "eventName": "INSERT",
+            "dynamodb": {"Keys": {k: image[k] for k in ("user_id", "timestamp")},
+                         "NewImage": image, "SequenceNumber": str(seq)}}
+
+
+def _day_count(user_id, day):
+    item = rollups.rollup_table.get_item(Key={"series": f"user#{user_id}#d", "period": day},
+                                         ConsistentRead=True).get("Item") or {}
+    return int(item.get("n", 0))
+
+
+@pytest.fixture
+def stream(dynamodb_local, monkeypatch):
+    import lambda_function
+    # Several chunks for a handful of records: each record touches 6 rollup items
+    monkeypatch.setattr(rollups, "FLUSH_CHUNK", 4)
+    return lambda_function
+
+
+def test_flush_failing_midway_is_not_applied_twice_on_redelivery(stream, run_id, monkeypatch):
+    batch = {"Records": [_record(100 + i, run_id, f"2025-03-0{i + 1}T09:00:00") for i in range(3)]}
+    client = rollups.dynamodb.meta.client
+    real, failed = client.transact_write_items, []
+
+    def weekly_chunk_fails(TransactItems):
+        # Chunks go in key order, so the user's weekly rollups come after the daily ones
+        if not failed and any(a["Update"]["Key"]["series"] == f"user#{run_id}#w" for a in TransactItems):
+            failed.append(1)
+            raise RuntimeError("throttled")
+        return real(TransactItems=TransactItems)
+
+    monkeypatch.setattr(client, "transact_write_items", weekly_chunk_fails)
+    result = stream.handle_stream(batch)
+    assert result["batchItemFailures"] == [{"itemIdentifier": "100"}]
+    assert failed and [_day_count(run_id, f"2025-03-0{d}") for d in (1, 2, 3)] == [1, 1, 1]
+
+    # Lambda redelivers the batch, now with one more record behind it
+    batch["Records"].append(_record(200, run_id, "2025-03-01T18:00:00"))
+    result = stream.handle_stream(batch)
+    assert result["batchItemFailures"] == [{"itemIdentifier": "200"}]
+    assert [_day_count(run_id, f"2025-03-0{d}") for d in (1, 2, 3)] == [1, 1, 1]
+
+    # ...and the record past the first batch's range as a batch of its own
+    assert stream.handle_stream({"Records": batch["Records"][3:]})["batchItemFailures"] == []
+    assert _day_count(run_id, "2025-03-01") == 2
+
+
+def test_sketch_merge_giving_up_leaves_the_counters_untouched(stream, run_id, monkeypatch):
+    batch = {"Records": [_record(300, run_id, "2025-04-01T09:00:00")]}
+    real = rollups._merge_day_sketch
+
+    def contended(day, users, last_ts):
+        raise RuntimeError(f"Sketch for {day} kept changing underneath us; retry the batch")
+
+    monkeypatch.setattr(rollups, "_merge_day_sketch", contended)
+    assert stream.handle_stream(batch)["batchItemFailures"] == [{"itemIdentifier": "300"}]
+    assert _day_count(run_id, "2025-04-01") == 0
+
+    monkeypatch.setattr(rollups, "_merge_day_sketch", real)
+    assert stream.handle_stream(batch)["batchItemFailures"] == []
+    assert _day_count(run_id, "2025-04-01") == 1
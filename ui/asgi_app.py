@@ -0,0 +1,151 @@
+"""
+Long-running service mode for the dashboard API: a plain ASGI app over the same route code as
+the Lambda (lambda_function.dispatch), for container deployments with sustained traffic.
+
+    pip install uvicorn
+    uvicorn asgi_app:app --app-dir ui --host 0.0.0.0 --port 8080
+
+One process keeps the boto3 connection pool, the concurrent-read pool and an in-memory
+response cache warm across requests. Route handlers are blocking (boto3), so each request
+runs on a worker thread and the event loop keeps accepting connections meanwhile.
+The DynamoDB Streams consumer stays a Lambda (lambda_function.handle_stream); it is what
+moves the change versions this cache is keyed on.
+"""
+import asyncio
+import base64
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import lambda_function
+
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "32"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# Entries alone don't bound memory: one unfiltered /checkins body can be tens of MB
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ITEM_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ITEM_BYTES", str(16 * 1024 * 1024)))
+MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", str(1024 * 1024)))
+
+
+class ResponseCache:
+    """
+    LRU of full responses keyed by (ETag, gzip). A write bumps the change version, which
+    changes the ETag, so stale entries are never served — they just age out.
+    Bounded by entry count and by total body size; bodies over max_item_bytes aren't kept.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                 max_item_bytes=RESPONSE_CACHE_MAX_ITEM_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_item_bytes = min(max_item_bytes, max_bytes)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.skipped = 0
+        self.bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    @staticmethod
+    def _size(response):
+        return len(response.get("body") or "")
+
+    def put(self, key, response):
+        size = self._size(response)
+        with self._lock:
+            if size > self.max_item_bytes:
+                self.skipped += 1
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= self._size(old)
+            self._entries[key] = response
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= self._size(evicted)
+
+
+cache = ResponseCache()
+_executor = ThreadPoolExecutor(max_workers=SERVICE_WORKERS, thread_name_prefix="route")
+
+
+# ===== ASGI PLUMBING =====
+async def _read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get("body", b""))
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError("Request body too large.")
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def _send(send, response):
+    """Write an API Gateway-style response dict ({"statusCode", "headers", "body"}) to ASGI."""
+    body = response.get("body") or ""
+    payload = base64.b64decode(body) if response.get("isBase64Encoded") else body.encode("utf-8")
+    headers = [(k.lower().encode("latin-1"), str(v).encode("latin-1"))
+               for k, v in (response.get("headers") or {}).items()]
+    if not any(k == b"content-type" for k, _ in headers) and payload:
+        headers.append((b"content-type", b"application/json"))
+    headers.append((b"content-length", str(len(payload)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": response["statusCode"], "headers": headers})
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            _executor.shutdown(wait=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    if method == "OPTIONS":
+        # CORS preflight (API Gateway answers these in the Lambda deployment)
+        return await _send(send, {"statusCode": 204, "headers": lambda_function._base_headers(), "body": ""})
+    if path == "/healthz":
+        return await _send(send, lambda_function.json_response(
+            200, {"status": "ok", "cache_hits": cache.hits, "cache_misses": cache.misses,
+                  "cache_bytes": cache.bytes, "cache_skipped": cache.skipped}))
+
+    # Last value wins for repeated keys, like API Gateway's queryStringParameters
+    params = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+    try:
+        raw = await _read_body(receive)
+        body = json.loads(raw) if raw else {}
+    except ValueError as e:
+        return await _send(send, lambda_function.json_response(400, {"error": f"Invalid body: {e}"}))
+
+    loop = asyncio.get_running_loop()
+    try:
+        response = await loop.run_in_executor(
+            _executor, lambda_function.dispatch, method, path, params, headers, body, cache)
+    except Exception as e:
+        print(f"❌ {method} {path} failed: {e}")
+        response = lambda_function.json_response(500, {"error": str(e)})
+    await _send(send, response)
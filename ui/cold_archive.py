@@ -0,0 +1 @@
+../shared/cold_archive.py
\ No newline at end of file
@@ -1,66 +1,85 @@
 import streamlit as st
-import requests, json
 import time
 
-def render_checkin_form(API_BASE: str):
-    st.markdown("<h3 style='color:#00FFA3;'>🌿 Daily Emotional Check-In</h3>", unsafe_allow_html=True)
-    st.caption("Your space to reflect, without judgment.")
+from utils.api import poll_checkin, submit_checkin
 
-    user_id = st.text_input("User ID", "demo_user")
-    message = st.text_area("How are you feeling today?", placeholder="Be honest — what's on your mind right now?", height=120)
+# Give up on a reflection after this long (each poll is a ≤20 s long poll)
+REFLECTION_TIMEOUT_S = 90
+
+COLOR_MAP = {
+    "Gentle": "#00FFA3",
+    "Reassuring": "#13E3C8",
+    "Reflective": "#FFD166",
+    "Empowering": "#BB86FC",
+    "Neutral": "#B0B0B0"
+}
 
-    if st.button("💬 Share with Saini"):
-        with st.spinner("Saini is reflecting..."):
-            try:
-                r = requests.post(f"{API_BASE}/checkin", json={"user_id": user_id, "message": message}, timeout=25)
 
-                # --- STEP 1: Parse top-level response ---
-                if r.status_code != 200:
-                    st.error(f"⚠️ Error {r.status_code}: {r.text[:200]}")
-                    return
+def _render_reflection(body: dict):
+    tone = (body.get("tone") or "gentle").capitalize()
+    reflection = body.get("response") or body.get("nudge") or "No reflection available."
 
-                # --- STEP 2: Extract response safely ---
-                try:
-                    outer = r.json()
-                except Exception:
-                    st.error("Response is not valid JSON.")
-                    return
+    st.success("✅ Reflection Recorded")
+    time.sleep(0.2)
 
-                # Extract body safely
-                body = outer.get("body", outer)
-                if isinstance(body, str):
-                    try:
-                        body = json.loads(body)
-                    except Exception:
-                        st.warning("Body is string but not valid JSON.")
-                        body = {"response": body}
+    st.markdown(f"""
+    <div style='background-color:#111;padding:1em;border-radius:10px;'>
+        <p style='color:{COLOR_MAP.get(tone,"#00FFA3")};font-weight:bold;'>Saini Reflection ({tone})</p>
+        <p style='color:white;font-size:16px;'>{reflection}</p>
+    </div>
+    """, unsafe_allow_html=True)
 
-                if not isinstance(body, dict):
-                    st.error("Unexpected response format from API.")
-                    st.write(outer)
-                    return
 
-                # --- STEP 3: Access keys safely ---
-                tone = body.get("tone", "gentle").capitalize()
-                reflection = body.get("response") or body.get("nudge") or "No reflection available."
+def _await_reflection(API_BASE: str, checkin_id: str):
+    """Long-poll /checkin/{id} until the reflection is ready → (body, error)."""
+    deadline = time.monotonic() + REFLECTION_TIMEOUT_S
+    while time.monotonic() < deadline:
+        status, body = poll_checkin(API_BASE, checkin_id)
+        if status == 202:
+            continue
+        if status != 200:
+            return None, f"⚠️ Error {status}: {body.get('error', body)}"
+        if body.get("status") == "failed":
+            return body, "Saini couldn't finish this reflection; a fallback was recorded."
+        return body, None
+    return None, "Saini is taking longer than usual — your check-in is saved and the reflection will appear in your history."
 
-                color_map = {
-                    "Gentle": "#00FFA3",
-                    "Reassuring": "#13E3C8",
-                    "Reflective": "#FFD166",
-                    "Empowering": "#BB86FC",
-                    "Neutral": "#B0B0B0"
-                }
 
-                st.success("✅ Reflection Recorded")
-                time.sleep(0.2)
+def render_checkin_form(API_BASE: str):
+    st.markdown("<h3 style='color:#00FFA3;'>🌿 Daily Emotional Check-In</h3>", unsafe_allow_html=True)
+    st.caption("Your space to reflect, without judgment.")
 
-                st.markdown(f"""
-                <div style='background-color:#111;padding:1em;border-radius:10px;'>
-                    <p style='color:{color_map.get(tone,"#00FFA3")};font-weight:bold;'>Saini Reflection ({tone})</p>
-                    <p style='color:white;font-size:16px;'>{reflection}</p>
-                </div>
-                """, unsafe_allow_html=True)
+    user_id = st.text_input("User ID", "demo_user")
+    message = st.text_area("How are you feeling today?", placeholder="Be honest — what's on your mind right now?", height=120)
+
+    if st.button("💬 Share with Saini"):
+        try:
+            status, body = submit_checkin(API_BASE, user_id, message)
+        except Exception as e:
+            st.error(f"Connection error: {e}")
+            return
+        if status == 200:
+            _render_reflection(body)
+            return
+        if status != 202 or "checkin_id" not in body:
+            st.error(f"⚠️ Error {status}: {str(body.get('error', body))[:200]}")
+            return
+        # Saved; the reflection is generated in the background. Kept across reruns so a
+        # widget interaction mid-wait resumes polling instead of losing the reply.
+        st.session_state["pending_checkin"] = body["checkin_id"]
 
-            except Exception as e:
-                st.error(f"Connection error: {e}")
+    checkin_id = st.session_state.get("pending_checkin")
+    if not checkin_id:
+        return
+    with st.spinner("Saini is reflecting..."):
+        try:
+            body, error = _await_reflection(API_BASE, checkin_id)
+        except Exception as e:
+            body, error = None, f"Connection error: {e}"
+    st.session_state.pop("pending_checkin", None)
+    if error and body:
+        st.warning(error)
+    elif error:
+        st.error(error)
+    if body:
+        _render_reflection(body)
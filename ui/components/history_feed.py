@@ -1,9 +1,11 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 from streamlit_autorefresh import st_autorefresh
-import requests
-from utils.api import fetch_checkins_via_api, fetch_checkins_via_dynamodb, fetch_user_list
+from utils.api import (SEARCH_COL, checkin_filter_params, sync_checkins_via_api, sync_checkins_via_dynamodb,
+                       search_checkins_via_api, fetch_user_list, fetch_user_analytics_batch, fetch_timeseries,
+                       fetch_metrics_summary, request_export, poll_export)
 
 TIER_LABELS = {
     "Stable":  "🟢 Stable",
@@ -22,11 +24,6 @@ def render_history_feed(API_BASE: str):
     with col_src:
         source = st.radio("Data Source", ["API Gateway", "Direct AWS (DynamoDB)"], help="Direct AWS requires local AWS creds.")
 
-    df = fetch_checkins_via_api(API_BASE) if source == "API Gateway" else fetch_checkins_via_dynamodb()
-    if df is None or df.empty:
-        st.info("No emotional check-ins yet — your first reflection will appear here 🌱.")
-        return
-
     # --- controls
     users = fetch_user_list(API_BASE)
     with col_user:
@@ -40,51 +37,142 @@ def render_history_feed(API_BASE: str):
         end = datetime.now(timezone.utc).date()
         date_range = st.date_input("Date Range", value=(start, end))
     with col_search:
-        query = st.text_input("Search reflections or messages")
+        query = st.text_input("Search reflections or messages", help='Terms, prefix* or "exact phrase"')
     with col_auto:
         include_auto = st.toggle("Include Auto Nudges", value=True)
 
-    view = _apply_filters(df, user_filter, tier_filter, include_auto, date_range, query)
-    if view.empty:
+    # Filters run server-side for the API; delta sync then only downloads new matching rows,
+    # and searches go to the token index (/search) instead of scanning rows
+    ranked = source == "API Gateway" and bool(query.strip())
+    if ranked:
+        params = checkin_filter_params(user_filter, tier_filter, include_auto, date_range, query)
+        view = search_checkins_via_api(API_BASE, params)
+    elif source == "API Gateway":
+        params = checkin_filter_params(user_filter, tier_filter, include_auto, date_range)
+        view = sync_checkins_via_api(API_BASE, params)
+    else:
+        df = sync_checkins_via_dynamodb()
+        if df is None or df.empty:
+            st.info("No emotional check-ins yet — your first reflection will appear here 🌱.")
+            return
+        view = _apply_filters(df, user_filter, tier_filter, include_auto, date_range, query)
+
+    if view is None or view.empty:
         st.warning("No results match the filters.")
         return
 
-    _render_global_metrics(view)
+    # Unfiltered API views take their KPIs from the server's streaming aggregates
+    summary = {}
+    if source == "API Gateway" and not user_filter and not query.strip() and set(tier_filter) >= set(TIER_LABELS):
+        start, end = (date_range[0].isoformat(), date_range[1].isoformat()) if len(date_range) == 2 else (None, None)
+        summary = fetch_metrics_summary(API_BASE, start, end)
+    _render_global_metrics(view, summary, include_auto)
 
     # user analytics
     if user_filter:
-        _render_user_analytics(API_BASE, view, user_filter)
+        _render_user_analytics(API_BASE, view, user_filter, tier_filter, date_range)
 
-    # table
-    view = view.sort_values("timestamp", ascending=False).copy()
-    view["Tier"] = view["tier"].map(TIER_LABELS).fillna("⚫ Unknown")
-    view["Time (UTC)"] = view["timestamp"].dt.strftime("%Y-%m-%d %H:%M")
-    cols = ["Time (UTC)", "user_id", "Tier", "message", "response"]
-    st.dataframe(view[cols], use_container_width=True, hide_index=True)
+    # table (normalize_df/sync already sort newest-first; only re-sort if that was lost;
+    # search results stay in rank order)
+    if not ranked and not view["timestamp"].is_monotonic_decreasing:
+        view = view.sort_values("timestamp", ascending=False)
+    st.dataframe(_table_view(view), use_container_width=True, hide_index=True)
 
-    # export
-    csv = view.drop(columns=["embedding"], errors="ignore").to_csv(index=False)
-    st.download_button("⬇️ Download Reflections CSV", csv, "sainte_reflections.csv", "text/csv")
+    # export: the DynamoDB view is already local; the API builds its CSV server-side, on demand
+    if source == "API Gateway":
+        _render_export(API_BASE, checkin_filter_params(user_filter, tier_filter, include_auto, date_range, query))
+    else:
+        csv = view.drop(columns=["embedding", SEARCH_COL, "score"], errors="ignore").to_csv(index=False)
+        st.download_button("⬇️ Download Reflections CSV", csv, "sainte_reflections.csv", "text/csv")
 
 
 # ---------- helpers ----------
+def _render_export(API_BASE, params):
+    col_btn, col_gz = st.columns([1, 1])
+    with col_gz:
+        compress = st.toggle("gzip", value=False, help="Smaller download (.csv.gz)")
+    with col_btn:
+        clicked = st.button("⬇️ Export Reflections CSV")
+    if clicked:
+        try:
+            st.session_state["history_export"] = request_export(API_BASE, params, compress)
+        except Exception as e:
+            st.error(f"❌ Export failed: {e}")
+
+    export = st.session_state.get("history_export")
+    if not export:
+        return
+    if export["status"] == "pending":
+        # Large exports outlive one request; unfinished ones are picked up again on the next rerun
+        try:
+            with st.spinner("Exporting…"):
+                export = poll_export(API_BASE, export["export_id"])
+        except Exception as e:
+            st.warning(f"⚠️ Could not check export status: {e}")
+            return
+        st.session_state["history_export"] = {**st.session_state["history_export"], **export}
+    if export["status"] == "pending":
+        st.info("⏳ Still exporting — the download link will appear here when it's ready.")
+    elif export["status"] == "failed":
+        st.error(f"❌ Export failed: {export.get('error', 'unknown error')}")
+        del st.session_state["history_export"]
+    else:
+        st.link_button(f"📥 {export['filename']} ({export['rows']:,} rows)", export["url"])
+        st.caption(f"Link expires in {export.get('expires_in', 900) // 60} min.")
+
+
 def _apply_filters(df, users, tiers, include_auto, date_range, query):
-    v = df.copy()
+    """AND together boolean masks over the cached frame; rows are materialized once at the end."""
+    mask = np.ones(len(df), dtype=bool)
     if len(date_range) == 2:
         s = datetime.combine(date_range[0], datetime.min.time(), tzinfo=timezone.utc)
         e = datetime.combine(date_range[1], datetime.max.time(), tzinfo=timezone.utc)
-        v = v[(v["timestamp"] >= s) & (v["timestamp"] <= e)]
-    if users: v = v[v["user_id"].isin(users)]
-    if tiers: v = v[v["tier"].isin(tiers)]
-    if not include_auto: v = v[v["tier"] != "Auto"]
+        mask &= ((df["timestamp"] >= s) & (df["timestamp"] <= e)).to_numpy()
+    if users: mask &= df["user_id"].isin(users).to_numpy()
+    if tiers: mask &= df["tier"].isin(tiers).to_numpy()
+    if not include_auto: mask &= (df["tier"] != "Auto").to_numpy()
     if query.strip():
         q = query.lower()
-        v = v[v["message"].str.lower().str.contains(q, na=False) | v["response"].str.lower().str.contains(q, na=False)]
-    return v
-
-def _render_global_metrics(view):
+        if SEARCH_COL in df.columns:
+            hits = df[SEARCH_COL].str.contains(q, regex=False)
+        else:
+            hits = df["message"].str.lower().str.contains(q, regex=False) | df["response"].str.lower().str.contains(q, regex=False)
+        mask &= hits.fillna(False).to_numpy(dtype=bool)
+    return df if mask.all() else df[mask]
+
+def _table_view(view):
+    """Only the displayed columns; tier labels are mapped per category, not per row."""
+    tiers = view["tier"]
+    if isinstance(tiers.dtype, pd.CategoricalDtype):
+        labels = tiers.cat.rename_categories(
+            {c: TIER_LABELS.get(c, f"⚫ {c}") for c in tiers.cat.categories}
+        )
+    else:
+        labels = tiers.map(TIER_LABELS).fillna("⚫ Unknown")
+    return pd.DataFrame({
+        "Time (UTC)": view["timestamp"].dt.strftime("%Y-%m-%d %H:%M"),
+        "user_id": view["user_id"],
+        "Tier": labels,
+        "message": view["message"],
+        "response": view["response"],
+    })
+
+def _render_global_metrics(view, summary=None, include_auto=True):
+    """KPIs from /metrics/summary when given, otherwise computed over the filtered frame."""
     st.markdown("<hr style='border-color:#222;'>", unsafe_allow_html=True)
     k1, k2, k3, k4, k5 = st.columns(5)
+    if summary:
+        auto = summary.get("auto_nudges", 0) if include_auto else 0
+        total = summary.get("total_reflections", 0) - (0 if include_auto else summary.get("auto_nudges", 0))
+        with k1: st.metric("Total Reflections", f"{total:,}")
+        with k2: st.metric("Unique Users", f"≈{summary.get('unique_users', 0):,}")
+        with k3: st.metric("Auto Nudges", f"{auto:,}")
+        with k4: st.metric("Most Common Tone", str(summary.get("most_common_tone") or "—").capitalize())
+        with k5:
+            last_ts = summary.get("last_activity")
+            st.metric("Last Activity", f"{last_ts[:16].replace('T', ' ')} UTC" if last_ts else "—")
+        return
+
     with k1: st.metric("Total Reflections", f"{len(view):,}")
     with k2: st.metric("Unique Users", f"{view['user_id'].nunique():,}")
     with k3: st.metric("Auto Nudges", f"{(view['tier'] == 'Auto').sum():,}")
@@ -101,20 +189,34 @@ def _render_global_metrics(view):
         except: pass
         st.metric("Last Activity", last_ts)
 
-def _render_user_analytics(API_BASE, view, users):
+def _series_frames(points, tiers):
+    """Rollup points → (tier totals, tone totals, count per period) for the selected tiers."""
+    tier_totals, tone_totals, freq = {}, {}, {}
+    for p in points:
+        counts = {t: n for t, n in p.get("tiers", {}).items() if not tiers or t in tiers}
+        for t, n in counts.items():
+            tier_totals[t] = tier_totals.get(t, 0) + n
+        for t, n in p.get("tones", {}).items():
+            tone_totals[t] = tone_totals.get(t, 0) + n
+        freq[p["period"]] = sum(counts.values()) if tiers else p.get("count", 0)
+    by_day = pd.Series(freq, dtype="int64")
+    by_day.index = pd.to_datetime(by_day.index).date
+    return pd.Series(tier_totals, dtype="int64"), pd.Series(tone_totals, dtype="int64"), by_day
+
+def _render_user_analytics(API_BASE, view, users, tiers=(), date_range=()):
     st.markdown("### 🧩 User Analytics")
+    # One batched, cached request for every selected user (not one blocking call per user)
+    key = tuple(sorted(users))
+    summaries = fetch_user_analytics_batch(API_BASE, key)
+    start, end = (date_range[0].isoformat(), date_range[1].isoformat()) if len(date_range) == 2 else (None, None)
+    series = fetch_timeseries(API_BASE, key, "day", start, end)
     for uid in users:
         user_df = view[view["user_id"] == uid]
         if user_df.empty: continue
 
         st.markdown(f"<h5 style='color:#00FFA3;'>👤 {uid}</h5>", unsafe_allow_html=True)
 
-        # Optional server-side summary (fast and lightweight)
-        summary = {}
-        try:
-            r = requests.get(f"{API_BASE}/analytics", params={"user_id": uid}, timeout=8)
-            if r.status_code == 200: summary = r.json()
-        except: pass
+        summary = summaries.get(uid) or {}
 
         c1, c2, c3, c4 = st.columns(4)
         with c1: st.metric("Total Reflections", len(user_df))
@@ -122,14 +224,21 @@ def _render_user_analytics(API_BASE, view, users):
         with c3: st.metric("Latest Tone", summary.get("latest_tone","—"))
         with c4: st.metric("Last Check-in", summary.get("last_checkin","—"))
 
-        # Charts
+        if uid in series:
+            # Rollups from /timeseries: no per-row grouping in the browser session
+            tier_counts, tone_counts, by_day = _series_frames(series[uid], tiers)
+        else:
+            # Categorical value_counts lists unused categories too — drop the zeros
+            tier_counts = user_df["tier"].value_counts()
+            tone_counts = user_df["tone"].value_counts() if "tone" in user_df.columns else pd.Series(dtype="int64")
+            by_day = user_df.groupby(user_df["timestamp"].dt.date)["user_id"].count()
+
         st.caption("Tier distribution")
-        st.bar_chart(user_df["tier"].value_counts())
+        st.bar_chart(tier_counts[tier_counts > 0])
 
-        if "tone" in user_df.columns and not user_df["tone"].isna().all():
+        if not tone_counts.empty:
             st.caption("Tone distribution")
-            st.bar_chart(user_df["tone"].value_counts())
+            st.bar_chart(tone_counts[tone_counts > 0])
 
         st.caption("Reflection frequency (daily)")
-        by_day = user_df.groupby(user_df["timestamp"].dt.date)["user_id"].count()
         st.line_chart(by_day)
@@ -0,0 +1 @@
+../shared/ddb_jobs.py
\ No newline at end of file
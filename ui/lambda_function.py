@@ -1,58 +1,337 @@
-import boto3, json, os
+import boto3, json, os, base64, gzip, hashlib, time, csv, io, threading, uuid
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.config import Config
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+import cold_archive
+import last_activity
+import rollups
+import search_index
+from profiling import profiled
+from row_encoding import ARROW_STREAM, NDJSON, encode_arrow, plain, to_builtin
+from s3_stream import S3MultipartWriter
 
 REGION = "us-east-2"
 TABLE_NAME = os.getenv("TABLE_NAME", "SainiCheckins")
-dynamodb = boto3.resource("dynamodb", region_name=REGION)
+# GSI: HASH tier, RANGE timestamp — serves tier-filtered views without a scan
+TIER_INDEX = os.getenv("TIER_INDEX", "tier-timestamp-index")
+# One keep-alive HTTP pool per process; asgi_app.py serves many requests through it at once
+DDB_MAX_POOL_CONNECTIONS = int(os.getenv("DDB_MAX_POOL_CONNECTIONS", "32"))
+dynamodb = boto3.resource("dynamodb", region_name=REGION,
+                          config=Config(max_pool_connections=DDB_MAX_POOL_CONNECTIONS))
 table = dynamodb.Table(TABLE_NAME)
+# Per-user key-condition queries of one request run side by side on this pool
+READ_CONCURRENCY = int(os.getenv("READ_CONCURRENCY", "8"))
+_read_pool = ThreadPoolExecutor(max_workers=READ_CONCURRENCY)
+# HASH scope ("table" or "user#<id>") → version, updated_at; bumped from the check-ins stream
+VERSION_TABLE = os.getenv("VERSION_TABLE", "SainiChangeVersions")
+versions_table = dynamodb.Table(VERSION_TABLE)
+
+# Exports are written here and handed out as short-lived presigned URLs
+EXPORT_BUCKET = os.getenv("EXPORT_BUCKET", "")
+EXPORT_PREFIX = os.getenv("EXPORT_PREFIX", "exports/")
+EXPORT_URL_TTL = int(os.getenv("EXPORT_URL_TTL", "900"))
+# Exports run in the background (they can outlast API Gateway's 29 s timeout); a status
+# object per export is polled via GET /export/{id}. Pending longer than this = lost job.
+EXPORT_PENDING_TIMEOUT_S = int(os.getenv("EXPORT_PENDING_TIMEOUT_S", "960"))
+EXPORT_MAX_WAIT_S = float(os.getenv("EXPORT_MAX_WAIT_S", "20"))
+s3 = boto3.client("s3", region_name=REGION)
+lambda_client = boto3.client("lambda", region_name=REGION)
+
+FILTER_PARAMS = {"since", "start", "end", "user_ids", "tiers", "include_auto", "q", "fields"}
 
+@profiled
 def lambda_handler(event, context):
+    if "Records" in event:
+        return handle_stream(event)
+    if "export_job" in event:
+        return run_export(event["export_job"])
+
     print("📩 Incoming:", json.dumps(event))
-    path = event.get("path", "")
-    method = event.get("httpMethod", "")
-    params = event.get("queryStringParameters") or {}
-    body = json.loads(event.get("body", "{}")) if event.get("body") else {}
+    return dispatch(
+        event.get("httpMethod", ""),
+        event.get("path", ""),
+        event.get("queryStringParameters") or {},
+        {k.lower(): v for k, v in (event.get("headers") or {}).items()},
+        json.loads(event.get("body", "{}")) if event.get("body") else {},
+    )
+
+
+# === ROUTES (shared by the Lambda handler and asgi_app.py) ===
+def route_users(req):
+    return json_response(200, get_users(), req["validators"])
+
+def route_checkins(req):
+    params = req["params"]
+    if FILTER_PARAMS & set(params):
+        data = get_checkins_filtered(parse_filters(params))
+    else:
+        data = get_checkins(params.get("user_id"))
+    return rows_response(200, data, req["headers"], req["validators"])
+
+def route_search(req):
+    params = req["params"]
+    if not (params.get("q") or "").strip():
+        return json_response(400, {"error": "Missing q."})
+    result = search_index.search(TABLE_NAME, params["q"], parse_filters(params),
+                                 params.get("page_size"), params.get("cursor"))
+    return json_response(200, result, req["validators"])
+
+def route_timeseries(req):
+    try:
+        return json_response(200, get_timeseries(req["params"]), req["validators"])
+    except ValueError as e:
+        return json_response(400, {"error": str(e)})
+
+def route_metrics_summary(req):
+    try:
+        lo, hi = rollups.parse_range(req["params"].get("start"), req["params"].get("end"))
+    except ValueError as e:
+        return json_response(400, {"error": str(e)})
+    return json_response(200, rollups.summary(lo, hi), req["validators"])
+
+def route_export(req):
+    if not EXPORT_BUCKET:
+        return json_response(501, {"error": "EXPORT_BUCKET is not configured."})
+    return start_export(req["body"])
+
+def route_export_status(req):
+    if not EXPORT_BUCKET:
+        return json_response(501, {"error": "EXPORT_BUCKET is not configured."})
+    return export_status(req["path_id"], req["params"].get("wait"))
+
+def route_post_checkin(req):
+    return json_response(200, post_checkin(req["body"]))
+
+def route_analytics(req):
+    params = req["params"]
+    if params.get("user_ids"):
+        return json_response(200, compute_batch_analytics(_csv(params["user_ids"])), req["validators"])
+    return json_response(200, compute_user_analytics(params.get("user_id")), req["validators"])
+
+ROUTES = {
+    ("GET", "/users"): route_users,
+    ("GET", "/checkins"): route_checkins,
+    ("GET", "/search"): route_search,
+    ("GET", "/timeseries"): route_timeseries,
+    ("GET", "/metrics/summary"): route_metrics_summary,
+    ("POST", "/export"): route_export,
+    ("POST", "/checkin"): route_post_checkin,
+    ("GET", "/analytics"): route_analytics,
+}
+# "/export/<id>" → route with req["path_id"] = "<id>"
+PREFIX_ROUTES = {
+    ("GET", "/export/"): route_export_status,
+}
+
+def _find_route(method, path):
+    route = ROUTES.get((method, path))
+    if route is not None:
+        return route, None
+    for (m, prefix), route in PREFIX_ROUTES.items():
+        if m == method and path.startswith(prefix) and len(path) > len(prefix):
+            return route, path[len(prefix):]
+    return None, None
+
+def dispatch(method, path, params, headers, body, cache=None):
+    """
+    One request → one API Gateway-style response dict. `headers` are lower-cased.
+    `cache` (optional, see asgi_app.ResponseCache) holds full responses keyed by ETag, so a
+    long-lived process answers repeat reads from memory until the change version moves.
+    """
+    route, path_id = _find_route(method, path)
+    if route is None:
+        return json_response(404, {"error": f"Route not found: {path} {method}"})
+
+    # Conditional GET: answer 304 from the change version alone, before touching the table
+    validators = {}
+    if method == "GET" and path in CACHEABLE_PATHS:
+        validators = change_validators(path, params, headers)
+        if validators and is_not_modified(validators, headers):
+            return not_modified_response(validators)
+
+    cache_key = None
+    if cache is not None and validators:
+        # The ETag already covers path, params, Accept and versions; only encoding varies
+        cache_key = (validators["ETag"], "gzip" in headers.get("accept-encoding", ""))
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    response = route({"params": params, "headers": headers, "body": body, "validators": validators,
+                      "path_id": path_id})
+    if cache_key is not None and response["statusCode"] == 200:
+        cache.put(cache_key, response)
+    return response
+
+
+# === CHANGE VERSIONS (ETag / Last-Modified) ===
+CACHEABLE_PATHS = {"/users", "/checkins", "/analytics", "/search", "/timeseries", "/metrics/summary"}
+TABLE_SCOPE = "table"
+
+def _scopes(path, params):
+    """Per-user versions when the request is scoped to users, else the whole-table version."""
+    uids = _csv(params.get("user_ids") or params.get("user_id"))
+    if path != "/users" and uids:
+        return [f"user#{u}" for u in sorted(set(uids))]
+    return [TABLE_SCOPE]
+
+def get_versions(scopes):
+    keys = [{"scope": s} for s in scopes]
+    found = {}
+    for start in range(0, len(keys), 100):
+        request = {VERSION_TABLE: {"Keys": keys[start:start + 100]}}
+        while request:
+            resp = dynamodb.batch_get_item(RequestItems=request)
+            for item in resp.get("Responses", {}).get(VERSION_TABLE, []):
+                found[item["scope"]] = item
+            request = resp.get("UnprocessedKeys") or None
+    return found
 
-    if path == "/users" and method == "GET":
-        return json_response(200, get_users())
+def change_validators(path, params, request_headers):
+    """
+    ETag/Last-Modified for a GET, derived from the change versions of the scopes it reads.
+    Returns {} (no caching) if the versions are unavailable; a user with no version yet
+    counts as version 0, so their first write still changes the tag.
+    """
+    scopes = _scopes(path, params)
+    try:
+        found = get_versions(scopes)
+    except ClientError as e:
+        print(f"⚠️ {VERSION_TABLE} unavailable, skipping ETag: {e}")
+        return {}
+    if TABLE_SCOPE in scopes and TABLE_SCOPE not in found:
+        return {}
 
-    if path == "/checkins" and method == "GET":
-        return json_response(200, get_checkins(params.get("user_id")))
+    state = [[s, int(found.get(s, {}).get("version", 0))] for s in scopes]
+    fingerprint = json.dumps({
+        "path": path,
+        "params": sorted(params.items()),
+        "accept": request_headers.get("accept", ""),
+        "versions": state,
+    }, sort_keys=True)
+    validators = {"ETag": f'W/"{hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()}"'}
+    updated = [float(i["updated_at"]) for i in found.values() if "updated_at" in i]
+    if updated:
+        validators["Last-Modified"] = formatdate(max(updated), usegmt=True)
+    return validators
 
-    if path == "/checkin" and method == "POST":
-        return json_response(200, post_checkin(body))
+def is_not_modified(validators, request_headers):
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        tags = {t.strip() for t in if_none_match.split(",")}
+        return "*" in tags or validators["ETag"] in tags
+    since, modified = request_headers.get("if-modified-since"), validators.get("Last-Modified")
+    if since and modified:
+        try:
+            return parsedate_to_datetime(modified) <= parsedate_to_datetime(since)
+        except (TypeError, ValueError):
+            return False
+    return False
 
-    if path == "/analytics" and method == "GET":
-        uid = params.get("user_id")
-        return json_response(200, compute_user_analytics(uid))
+def bump_versions(counts):
+    now = int(time.time())
+    for scope, n in counts.items():
+        versions_table.update_item(
+            Key={"scope": scope},
+            UpdateExpression="ADD version :n SET updated_at = :now",
+            ExpressionAttributeValues={":n": n, ":now": now},
+        )
 
-    return json_response(404, {"error": f"Route not found: {path} {method}"})
+_deserializer = TypeDeserializer()
+
+def _image(record, name):
+    raw = record.get("dynamodb", {}).get(name)
+    return {k: _deserializer.deserialize(v) for k, v in raw.items()} if raw else None
+
+def _is_ttl_delete(record):
+    identity = record.get("userIdentity") or {}
+    return identity.get("type") == "Service" and identity.get("principalId") == "dynamodb.amazonaws.com"
+
+def handle_stream(event):
+    """
+    DynamoDB Streams trigger on SainiCheckins (NEW_AND_OLD_IMAGES), so every write counts
+    whichever Lambda made it:
+      • bumps the writer's user version and the table version (ETags), and moves the
+        user's last_activity (the last-activity GSI behind the user list and nudges)
+      • keeps the /search token index in step
+      • adds the change to the hourly/daily/weekly rollups behind /timeseries, and the
+        writer's user_id to that day's HyperLogLog sketch behind /metrics/summary
+    TTL deletes of archived rows (lambda/archive_checkins.py) leave the rollups alone: the
+    history still exists, just in the cold archive.
+    If a record's index update fails, processing stops there and that record is reported
+    (ReportBatchItemFailures): Lambda redelivers from it, so only the records before it are
+    counted in this invocation.
+    If the version bump or the rollup flush fails, the first record is reported and the whole
+    batch comes back. The flush ledger (rollups.flush) makes that replay skip the ADDs that
+    already landed; the replay is cut at the ledger's last record so it covers the same range.
+    """
+    records = event.get("Records", [])
+    counts, failures, deltas = Counter(), [], rollups.new_deltas()
+    token = _record_token(records[0]) if records else None
+    ledger = rollups.flush_ledger(token) if token else None
+    processed, last, latest = 0, None, {}
+    for record in records:
+        seq = record.get("dynamodb", {}).get("SequenceNumber")
+        if ledger and last == ledger.get("last"):
+            # Records past the interrupted flush's range come back as a batch of their own
+            failures.append({"itemIdentifier": seq})
+            break
+        keys = record.get("dynamodb", {}).get("Keys", {})
+        user_id = keys.get("user_id", {}).get("S")
+        old, new = _image(record, "OldImage"), _image(record, "NewImage")
+        try:
+            search_index.apply_change(old, new)
+        except Exception as e:
+            print(f"❌ Search index update failed for {user_id}: {e}")
+            failures.append({"itemIdentifier": seq})
+            break
+        if user_id:
+            counts[f"user#{user_id}"] += 1
+        counts[TABLE_SCOPE] += 1
+        if not _is_ttl_delete(record):
+            rollups.add_change(old, new, deltas)
+        if user_id and new and str(new.get("timestamp", "")) > latest.get(user_id, ""):
+            latest[user_id] = str(new["timestamp"])
+        processed += 1
+        last = seq
+    try:
+        # Version bumps and last activity are safe to repeat on a retry; the rollup ADDs go last
+        bump_versions(counts)
+        last_activity.record(versions_table, latest)
+        rollup_writes = rollups.flush(deltas, token, last)
+    except Exception as e:
+        print(f"❌ Rollup flush failed, redelivering the batch: {e}")
+        return {"batchItemFailures": [{"itemIdentifier": records[0].get("dynamodb", {}).get("SequenceNumber")}]}
+    print(f"🔁 Stream batch: {processed}/{len(records)} records, "
+          f"{len(counts)} versions bumped, {rollup_writes} rollups updated")
+    return {"batchItemFailures": failures}
+
+def _record_token(record):
+    """Stable id of a batch's first record; eventID is unique across the stream's shards."""
+    return record.get("eventID") or record.get("dynamodb", {}).get("SequenceNumber")
 
 
 # === HELPERS ===
 def get_users():
-    users = set()
-    scan = {"ProjectionExpression": "user_id"}
-    while True:
-        resp = table.scan(**scan)
-        for i in resp.get("Items", []):
-            if "user_id" in i:
-                users.add(i["user_id"])
-        if "LastEvaluatedKey" not in resp:
-            break
-        scan["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    # The last-activity GSI holds one small item per user, so no check-in is read
+    users = set(last_activity.user_ids(versions_table))
+    # Users whose check-ins have all aged out of the hot table live on in the archive
+    try:
+        users.update(cold_archive.list_archived_users())
+    except Exception as e:
+        print(f"⚠️ Archive user listing failed, hot users only: {e}")
     return sorted(users)
 
-def get_checkins(user_id=None):
-    items, scan = [], {}
-    while True:
-        resp = table.scan(**scan)
-        items.extend(resp.get("Items", []))
-        if "LastEvaluatedKey" not in resp:
-            break
-        scan["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+def _scan_checkins():
+    return list(_with_archive(_items(table.scan), {}))
 
+def _format_checkins(items, user_id=None):
     if user_id:
         items = [i for i in items if i.get("user_id") == user_id]
     for i in items:
@@ -63,6 +342,304 @@ def get_checkins(user_id=None):
                 pass
     return sorted(items, key=lambda x: x.get("timestamp", ""), reverse=True)
 
+def get_checkins(user_id=None):
+    return _format_checkins(_scan_checkins(), user_id)
+
+# === SERVER-SIDE FILTERS (/checkins?start=&end=&user_ids=&tiers=&include_auto=&q=&fields=&since=) ===
+def _csv(value):
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+def parse_filters(params):
+    start, end = params.get("start"), params.get("end")
+    return {
+        "user_ids": _csv(params.get("user_ids") or params.get("user_id")),
+        "tiers": _csv(params.get("tiers")),
+        # Bare dates cover the whole day; timestamps are ISO strings so they compare lexically
+        "start": f"{start}T00:00:00" if start and "T" not in start else start,
+        "end": f"{end}T23:59:59.999999" if end and "T" not in end else end,
+        "include_auto": (params.get("include_auto") or "true").lower() != "false",
+        "q": (params.get("q") or "").strip().lower(),
+        "fields": _csv(params.get("fields")),
+        "since": params.get("since"),
+    }
+
+def _time_condition(lo, hi, cond=Key):
+    """timestamp bounds as a key condition (Key) or a scan filter (Attr)."""
+    if lo and hi:
+        return cond("timestamp").between(lo, hi)
+    if lo:
+        return cond("timestamp").gte(lo)
+    if hi:
+        return cond("timestamp").lte(hi)
+    return None
+
+def _attr_filter(tiers, include_auto):
+    conditions = []
+    if tiers:
+        conditions.append(Attr("tier").is_in(tiers))
+    if not include_auto:
+        conditions.append(Attr("tier").ne("Auto"))
+    cond = None
+    for c in conditions:
+        cond = c if cond is None else cond & c
+    return cond
+
+def _items(op, **kwargs):
+    """Yield items page by page (one DynamoDB page in memory at a time)."""
+    while True:
+        resp = op(**kwargs)
+        yield from resp.get("Items", [])
+        if "LastEvaluatedKey" not in resp:
+            return
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+def _paginate(op, **kwargs):
+    return list(_items(op, **kwargs))
+
+# === HOT + COLD ===
+def _with_archive(hot_items, f):
+    """
+    Hot rows followed by matching archived rows, as one stream. Hot rows already copied to
+    the archive (archived_at set, waiting for TTL) are held back and only dropped once the
+    archive has served them, so an unreadable archive never loses rows.
+    """
+    if not cold_archive.ARCHIVE_URI:
+        yield from hot_items
+        return
+    held = {}
+    for item in hot_items:
+        if "archived_at" in item:
+            held[(item.get("user_id"), item.get("timestamp"))] = item
+        else:
+            yield item
+
+    lo = max(f.get("start") or "", f.get("since") or "") or None
+    try:
+        for row in cold_archive.iter_archive(f.get("user_ids") or None, lo, f.get("end")):
+            if f.get("since") and str(row.get("timestamp", "")) <= f["since"]:
+                continue
+            if f.get("tiers") and row.get("tier") not in f["tiers"]:
+                continue
+            if not f.get("include_auto", True) and row.get("tier") == "Auto":
+                continue
+            held.pop((row.get("user_id"), row.get("timestamp")), None)
+            yield row
+    except Exception as e:
+        print(f"⚠️ Cold archive unreadable ({cold_archive.ARCHIVE_URI}): {e}; "
+              f"serving {len(held)} archived rows from the hot table")
+        yield from held.values()
+
+def _iter_filtered(f, projection):
+    """Hot rows (see _iter_hot) plus the cold archive for the same filters."""
+    if cold_archive.ARCHIVE_URI and "ProjectionExpression" in projection:
+        # Projected reads still need archived_at to recognise rows the archive already holds
+        names = {**projection.get("ExpressionAttributeNames", {}), "#arch": "archived_at"}
+        projection = {**projection, "ProjectionExpression": projection["ProjectionExpression"] + ", #arch",
+                      "ExpressionAttributeNames": names}
+    return _with_archive(_iter_hot(f, projection), f)
+
+def _iter_hot(f, projection):
+    """Key conditions per user, the tier GSI per tier, or a filtered scan as a last resort."""
+    lo = max(f["start"] or "", f["since"] or "") or None
+    time_cond = _time_condition(lo, f["end"])
+    extra = dict(projection)
+
+    if f["user_ids"]:
+        attr = _attr_filter(f["tiers"], f["include_auto"])
+        if attr is not None:
+            extra["FilterExpression"] = attr
+        def query_user(uid):
+            key = Key("user_id").eq(uid) if time_cond is None else Key("user_id").eq(uid) & time_cond
+            return _items(table.query, KeyConditionExpression=key, **extra)
+
+        if len(f["user_ids"]) == 1:
+            yield from query_user(f["user_ids"][0])
+            return
+        # Several users: issue the queries concurrently, still yielding in request order
+        for rows in _read_pool.map(lambda uid: list(query_user(uid)), f["user_ids"]):
+            yield from rows
+        return
+
+    if f["tiers"]:
+        tiers = [t for t in f["tiers"] if f["include_auto"] or t != "Auto"]
+        started = False
+        try:
+            for tier in tiers:
+                key = Key("tier").eq(tier) if time_cond is None else Key("tier").eq(tier) & time_cond
+                for item in _items(table.query, IndexName=TIER_INDEX, KeyConditionExpression=key, **extra):
+                    started = True
+                    yield item
+            return
+        except ClientError as e:
+            if started:
+                raise
+            print(f"⚠️ {TIER_INDEX} unavailable, falling back to scan: {e}")
+
+    cond = _attr_filter(f["tiers"], f["include_auto"])
+    time_attr = _time_condition(lo, f["end"], Attr)
+    if time_attr is not None:
+        cond = time_attr if cond is None else cond & time_attr
+    if cond is not None:
+        extra["FilterExpression"] = cond
+    yield from _items(table.scan, **extra)
+
+def _read_filtered(f, projection):
+    return list(_iter_filtered(f, projection))
+
+def _projection(fields, q):
+    if not fields:
+        return {}
+    needed = set(fields) | {"user_id", "timestamp"} | ({"message", "response"} if q else set())
+    names = {f"#p{i}": name for i, name in enumerate(sorted(needed))}
+    return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
+
+def _matches_text(item, q):
+    # DynamoDB `contains` is case-sensitive, so the text match runs here on the narrowed rows
+    return q in str(item.get("message", "")).lower() or q in str(item.get("response", "")).lower()
+
+def get_checkins_filtered(f):
+    """
+    Only matching rows, only requested columns. With `since` (exclusive high-watermark)
+    the response is {"items": [...], "watermark": ...} for the dashboard's delta sync.
+    """
+    fields = set(f["fields"])
+    items = _read_filtered(f, _projection(fields, f["q"]))
+    if f["since"]:
+        items = [i for i in items if i.get("timestamp", "") > f["since"]]
+    if f["q"]:
+        items = [i for i in items if _matches_text(i, f["q"])]
+    if fields:
+        items = [{k: v for k, v in i.items() if k in fields or k in ("user_id", "timestamp")} for i in items]
+
+    # Taken before formatting: display timestamps are truncated to whole seconds
+    watermark = max((i.get("timestamp", "") for i in items), default=f["since"])
+    rows = _format_checkins(items)
+    if f["since"]:
+        return {"items": rows, "watermark": watermark}
+    return rows
+
+# === EXPORT (POST /export, body = /checkins filter params + "gzip") ===
+EXPORT_COLUMNS = ["timestamp", "user_id", "tier", "tone", "message", "response", "source", "is_auto"]
+# Encode CSV in slices this size before handing them to the S3 writer
+EXPORT_CHUNK_BYTES = 256 * 1024
+
+def export_checkins(params, export_id):
+    """
+    Stream every matching check-in as CSV (optionally gzip) into S3 and return where it went.
+    Rows go DynamoDB page → CSV slice → multipart part, so memory stays flat however
+    many rows match. Rows come in read order (per user / tier: oldest first), not re-sorted.
+    """
+    params = {k: str(v) for k, v in (params or {}).items()}
+    f = parse_filters(params)
+    compress = params.get("gzip", "false").lower() == "true"
+    columns = f["fields"] or EXPORT_COLUMNS
+    filename = "sainte_reflections.csv" + (".gz" if compress else "")
+    key = f"{EXPORT_PREFIX}{export_id}-{filename}"
+
+    writer = S3MultipartWriter(s3, EXPORT_BUCKET, key, compress=compress,
+                               content_type="application/gzip" if compress else "text/csv")
+    buffer = io.StringIO()
+    out = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    out.writeheader()
+    rows = 0
+    try:
+        for item in _iter_filtered(f, _projection(columns, f["q"])):
+            if f["since"] and item.get("timestamp", "") <= f["since"]:
+                continue
+            if f["q"] and not _matches_text(item, f["q"]):
+                continue
+            out.writerow(to_builtin(item))
+            rows += 1
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                writer.write(buffer.getvalue().encode("utf-8"))
+                buffer.seek(0)
+                buffer.truncate()
+        writer.write(buffer.getvalue().encode("utf-8"))
+        size = writer.close()
+    except Exception:
+        writer.abort()
+        raise
+
+    print(f"📤 Exported {rows} rows ({size} bytes) to s3://{EXPORT_BUCKET}/{key}")
+    return {"key": key, "rows": rows, "bytes": size, "filename": filename}
+
+def _status_key(export_id):
+    return f"{EXPORT_PREFIX}{export_id}.status.json"
+
+def _put_export_status(export_id, status):
+    s3.put_object(Bucket=EXPORT_BUCKET, Key=_status_key(export_id), ContentType="application/json",
+                  Body=json.dumps(status).encode("utf-8"))
+
+def start_export(params):
+    """Record a pending export, run it in the background and answer 202 with its id."""
+    export_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    _put_export_status(export_id, {"status": "pending", "created_at": time.time()})
+    job = {"export_id": export_id, "params": params or {}}
+    function_name = os.getenv("AWS_LAMBDA_FUNCTION_NAME")
+    if function_name:
+        lambda_client.invoke(FunctionName=function_name, InvocationType="Event",
+                             Payload=json.dumps({"export_job": job}).encode("utf-8"))
+    else:
+        # Service mode / local run: no function to hand off to
+        threading.Thread(target=run_export, args=(job,), daemon=True).start()
+    response = json_response(202, {"export_id": export_id, "status": "pending", "poll": f"/export/{export_id}"})
+    response["headers"]["Location"] = f"/export/{export_id}"
+    return response
+
+def run_export(job):
+    """Background half of POST /export: write the CSV, then the final status object."""
+    export_id = job["export_id"]
+    try:
+        result = export_checkins(job.get("params"), export_id)
+        status = {"status": "done", **result}
+    except Exception as e:
+        print(f"❌ Export {export_id} failed: {e}")
+        status = {"status": "failed", "error": str(e)[:200]}
+    _put_export_status(export_id, {**status, "completed_at": time.time()})
+    return status
+
+def _read_export_status(export_id):
+    try:
+        obj = s3.get_object(Bucket=EXPORT_BUCKET, Key=_status_key(export_id))
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(obj["Body"].read())
+
+def export_status(export_id, wait=None):
+    """
+    GET /export/{id}?wait=N: 200 with a fresh presigned URL once done (or the failure),
+    202 while running. Holds the request up to N s (max EXPORT_MAX_WAIT_S) for completion.
+    """
+    if not export_id or "/" in export_id:
+        return json_response(400, {"error": "Invalid export id."})
+    try:
+        deadline = time.monotonic() + min(max(float(wait or 0), 0), EXPORT_MAX_WAIT_S)
+    except ValueError:
+        return json_response(400, {"error": "wait must be a number of seconds."})
+    while True:
+        status = _read_export_status(export_id)
+        if status is None:
+            return json_response(404, {"error": f"Unknown export: {export_id}"})
+        if status["status"] != "pending" or time.monotonic() >= deadline:
+            break
+        time.sleep(1)
+
+    if status["status"] == "pending":
+        if time.time() - float(status.get("created_at", 0)) > EXPORT_PENDING_TIMEOUT_S:
+            return json_response(200, {"export_id": export_id, "status": "failed", "error": "Export timed out."})
+        return json_response(202, {"export_id": export_id, "status": "pending"})
+    if status["status"] == "done":
+        status["url"] = s3.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": EXPORT_BUCKET, "Key": status.pop("key"),
+                    "ResponseContentDisposition": f'attachment; filename="{status["filename"]}"'},
+            ExpiresIn=EXPORT_URL_TTL,
+        )
+        status["expires_in"] = EXPORT_URL_TTL
+    return json_response(200, {"export_id": export_id, **status})
+
 def post_checkin(body):
     user_id = body.get("user_id", "guest_user")
     message = body.get("message", "")
@@ -86,32 +663,152 @@ def post_checkin(body):
 
 
 # === ANALYTICS ===
+def get_timeseries(params):
+    """
+    /timeseries?bucket=day|hour|week|6h|2d&start=&end=&user_ids=
+    Served from the rollups: one series per requested user, or "all" for everyone.
+    """
+    bucket = params.get("bucket") or "day"
+    lo, hi = rollups.parse_range(params.get("start"), params.get("end"))
+    users = _csv(params.get("user_ids") or params.get("user_id"))
+    scopes = {uid: f"user#{uid}" for uid in users} or {"all": rollups.ALL_SCOPE}
+    return {
+        "bucket": bucket,
+        "start": lo.isoformat(),
+        "end": hi.isoformat(),
+        "series": {label: rollups.timeseries(scope, bucket, lo, hi) for label, scope in scopes.items()},
+    }
+
 def compute_user_analytics(user_id=None):
-    data = get_checkins(user_id)
-    if not data:
+    if user_id:
+        # One user's partition via a key-condition query, not a scan of everyone's rows
+        summary = compute_batch_analytics([user_id])["users"][user_id]
+        if summary.get("last_checkin"):
+            summary["last_checkin"] = summary["last_checkin"].split(".")[0]
+        return summary
+
+    # Everyone: all-time totals from the weekly rollups, the latest row via the last-activity GSI
+    totals = rollups.all_time()
+    newest = last_activity.newest(versions_table)
+    if not totals["count"] or not newest:
         return {"user_id": user_id, "error": "No data"}
 
-    tiers = [d.get("tier", "Unknown") for d in data]
-    tones = [d.get("tone", "Unknown") for d in data]
-    tier_counts = Counter(tiers)
-    tone_counts = Counter(tones)
+    latest = table.get_item(Key={"user_id": newest[0], "timestamp": newest[1]}).get("Item") or {}
     return {
         "user_id": user_id,
-        "total_reflections": len(data),
-        "tier_distribution": dict(tier_counts),
-        "tone_distribution": dict(tone_counts),
-        "latest_tier": data[0].get("tier"),
-        "latest_tone": data[0].get("tone"),
-        "last_checkin": data[0].get("timestamp"),
+        "total_reflections": totals["count"],
+        "tier_distribution": totals["tiers"],
+        "tone_distribution": totals["tones"],
+        "latest_tier": latest.get("tier"),
+        "latest_tone": latest.get("tone"),
+        "last_checkin": newest[1].split(".")[0],
     }
 
-def json_response(status, data):
+# === RESPONSES ===
+# Below this size gzip costs more CPU than it saves on the wire
+GZIP_MIN_BYTES = 1024
+
+def _base_headers():
+    return {
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type,If-None-Match,If-Modified-Since",
+        "Access-Control-Expose-Headers": "X-Watermark,ETag,Last-Modified",
+    }
+
+def compute_batch_analytics(user_ids):
+    """
+    Summaries for many users from one read (a key-condition query per user, projected to
+    the fields analytics needs) and a single pass over the rows.
+    """
+    f = parse_filters({"user_ids": ",".join(user_ids)})
+    names = {"#u": "user_id", "#ts": "timestamp", "#tier": "tier", "#tone": "tone"}
+    items = _read_filtered(f, {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names})
+
+    stats = {uid: {"total": 0, "tiers": Counter(), "tones": Counter(), "latest": None} for uid in user_ids}
+    for i in items:
+        s = stats.get(i.get("user_id"))
+        if s is None:
+            continue
+        s["total"] += 1
+        s["tiers"][i.get("tier", "Unknown")] += 1
+        s["tones"][i.get("tone", "Unknown")] += 1
+        if s["latest"] is None or i.get("timestamp", "") > s["latest"].get("timestamp", ""):
+            s["latest"] = i
+
+    users = {}
+    for uid, s in stats.items():
+        if not s["total"]:
+            users[uid] = {"user_id": uid, "error": "No data"}
+            continue
+        latest = s["latest"]
+        users[uid] = {
+            "user_id": uid,
+            "total_reflections": s["total"],
+            "tier_distribution": dict(s["tiers"]),
+            "tone_distribution": dict(s["tones"]),
+            "latest_tier": latest.get("tier"),
+            "latest_tone": latest.get("tone"),
+            "last_checkin": latest.get("timestamp"),
+        }
+    return {"users": users}
+
+def _cache_headers(validators):
+    # no-cache = "store it, but revalidate every time", which is exactly what the ETag is for
+    return {**validators, "Cache-Control": "no-cache"} if validators else {}
+
+def json_response(status, data, validators=None):
     return {
         "statusCode": status,
-        "headers": {
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type",
-        },
-        "body": json.dumps(data, ensure_ascii=False),
+        "headers": {**_base_headers(), **_cache_headers(validators)},
+        "body": json.dumps(data, ensure_ascii=False, default=plain),
     }
+
+def not_modified_response(validators):
+    return {"statusCode": 304, "headers": {**_base_headers(), **_cache_headers(validators)}, "body": ""}
+
+def rows_response(status, data, request_headers, validators=None):
+    """
+    Content negotiation for bulk row reads (/checkins):
+      Accept: application/vnd.apache.arrow.stream → Arrow IPC stream (columnar)
+      Accept: application/x-ndjson                → one JSON object per line
+      otherwise                                   → JSON (unchanged)
+    Accept-Encoding: gzip compresses Arrow/NDJSON (the binary media types API Gateway is
+    configured to decode; plain-JSON clients get text). Delta responses ({"items", "watermark"})
+    carry the watermark in an X-Watermark header for the row-only formats.
+    """
+    accept = request_headers.get("accept", "")
+    rows, watermark = data, None
+    if isinstance(data, dict) and "items" in data:
+        rows, watermark = data["items"], data.get("watermark")
+
+    headers = {**_base_headers(), **_cache_headers(validators)}
+    payload = None
+    if ARROW_STREAM in accept:
+        try:
+            payload = encode_arrow(rows)
+            headers["Content-Type"] = ARROW_STREAM
+        except Exception as e:
+            print(f"⚠️ Arrow encoding unavailable ({e}); falling back")
+    if payload is None and NDJSON in accept:
+        payload = "".join(json.dumps(r, ensure_ascii=False, default=plain) + "\n" for r in rows).encode("utf-8")
+        headers["Content-Type"] = NDJSON
+    if payload is None:
+        payload = json.dumps(data, ensure_ascii=False, default=plain).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+        watermark = None
+    if watermark:
+        headers["X-Watermark"] = watermark
+
+    binary = headers["Content-Type"] == ARROW_STREAM
+    if (headers["Content-Type"] != "application/json"
+            and "gzip" in request_headers.get("accept-encoding", "") and len(payload) >= GZIP_MIN_BYTES):
+        payload = gzip.compress(payload, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+        binary = True
+
+    if binary:
+        # API Gateway decodes base64 bodies for binary media types (see infra/api_gateway_config.yaml)
+        return {"statusCode": status, "headers": headers, "isBase64Encoded": True,
+                "body": base64.b64encode(payload).decode("ascii")}
+    return {"statusCode": status, "headers": headers, "body": payload.decode("utf-8")}
@@ -0,0 +1,331 @@
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from hll import HyperLogLog
+
+# ===== TIME-SERIES ROLLUPS (SainiRollups) =====
+# HASH series "<scope>#<unit>", RANGE period:
+#   scope  "all" or "user#<user_id>"
+#   unit   "h" (period "YYYY-MM-DDTHH"), "d" ("YYYY-MM-DD"), "w" (Monday, "YYYY-MM-DD")
+# Attributes: "n" (check-ins), "tier#<tier>" and "tone#<tone>" counts.
+# Updated with ADD from the check-ins stream, so a bucket costs one write per change and
+# /timeseries reads one small item per period instead of every raw check-in.
+# Series "hll#d" holds one item per day: "regs" (HyperLogLog registers of the user_ids
+# seen that day), "last_ts" (latest check-in) and "rev" (optimistic-concurrency counter).
+# Series "flush" holds one ledger item per stream batch (period = its first record's eventID):
+# "last" (SequenceNumber of the last record it covers) and "done" (chunks already applied).
+REGION = os.getenv("AWS_REGION", "us-east-2")
+ROLLUP_TABLE = os.getenv("ROLLUP_TABLE", "SainiRollups")
+ALL_SCOPE = "all"
+HLL_SERIES = "hll#d"
+HLL_RETRIES = 5
+FLUSH_SERIES = "flush"
+# TransactWriteItems takes 100 actions: 99 rollup ADDs plus the chunk's ledger entry
+FLUSH_CHUNK = 99
+FLUSH_LEDGER_TTL_S = 7 * 86400
+TTL_ATTRIBUTE = os.getenv("ROLLUP_TTL_ATTRIBUTE", "expires_at")
+UNITS = {"h": timedelta(hours=1), "d": timedelta(days=1), "w": timedelta(weeks=1)}
+UNIT_ALIASES = {"hour": "1h", "hourly": "1h", "day": "1d", "daily": "1d", "week": "1w", "weekly": "1w"}
+# Zero-filled base periods per series (a year of hours)
+MAX_POINTS = int(os.getenv("TIMESERIES_MAX_POINTS", "9000"))
+
+dynamodb = boto3.resource("dynamodb", region_name=REGION)
+rollup_table = dynamodb.Table(ROLLUP_TABLE)
+
+
+# ===== PERIODS =====
+def _parse_ts(ts):
+    try:
+        return datetime.fromisoformat(str(ts).replace("Z", ""))
+    except ValueError:
+        return None
+
+
+def floor_period(dt: datetime, unit: str) -> datetime:
+    if unit == "h":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=day.weekday()) if unit == "w" else day
+
+
+def period_key(dt: datetime, unit: str) -> str:
+    dt = floor_period(dt, unit)
+    return dt.strftime("%Y-%m-%dT%H") if unit == "h" else dt.strftime("%Y-%m-%d")
+
+
+def parse_bucket(bucket: str):
+    """'day' / '6h' / '2w' → (multiple, base unit)."""
+    bucket = UNIT_ALIASES.get((bucket or "day").lower(), (bucket or "").lower())
+    m = re.fullmatch(r"(\d*)([hdw])", bucket)
+    if not m or (m.group(1) and int(m.group(1)) < 1):
+        raise ValueError(f"Unsupported bucket: {bucket!r} (use e.g. hour, day, week, 6h, 2d)")
+    return int(m.group(1) or 1), m.group(2)
+
+
+# ===== WRITE PATH =====
+def _contributions(item, sign, deltas):
+    dt = _parse_ts(item.get("timestamp"))
+    if dt is None or not item.get("user_id"):
+        return
+    attrs = {"n": sign, f"tier#{item.get('tier') or 'Unknown'}": sign, f"tone#{item.get('tone') or 'Unknown'}": sign}
+    for scope in (ALL_SCOPE, f"user#{item['user_id']}"):
+        for unit in UNITS:
+            deltas["counts"][(f"{scope}#{unit}", period_key(dt, unit))].update(attrs)
+    if sign > 0:
+        # Sketches only grow: a deleted check-in's user stays counted for that day
+        day = period_key(dt, "d")
+        deltas["users"][day].add(item["user_id"])
+        deltas["last"][day] = max(deltas["last"].get(day, ""), str(item["timestamp"]))
+
+
+def add_change(old, new, deltas):
+    """Accumulate one stream record (INSERT, MODIFY or REMOVE) into `deltas`."""
+    if old:
+        _contributions(old, -1, deltas)
+    if new:
+        _contributions(new, 1, deltas)
+
+
+def _merge_day_sketch(day, users, last_ts):
+    """
+    Read-modify-write of one day's sketch, retried if another shard wrote it meanwhile.
+    Idempotent (re-adding a user leaves the registers as they are), which is why flush runs
+    it before any counter ADD: giving up here leaves nothing half-applied.
+    """
+    key = {"series": HLL_SERIES, "period": day}
+    for _ in range(HLL_RETRIES):
+        item = rollup_table.get_item(Key=key, ConsistentRead=True).get("Item")
+        sketch = HyperLogLog(item["regs"].value if item else None)
+        before = sketch.to_bytes()
+        for user_id in users:
+            sketch.add(user_id)
+        last = max(str(item.get("last_ts", "")) if item else "", last_ts)
+        if item and sketch.to_bytes() == before and last == item.get("last_ts"):
+            return False
+
+        rev = int(item.get("rev", 0)) if item else 0
+        try:
+            rollup_table.put_item(
+                Item={**key, "regs": sketch.to_bytes(), "last_ts": last, "rev": rev + 1},
+                ConditionExpression="attribute_not_exists(series)" if item is None else "rev = :rev",
+                **({} if item is None else {"ExpressionAttributeValues": {":rev": rev}}),
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+    raise RuntimeError(f"Sketch for {day} kept changing underneath us; retry the batch")
+
+
+def flush_ledger(token):
+    """Ledger of an earlier flush of the stream batch starting at `token`, or None."""
+    return rollup_table.get_item(Key={"series": FLUSH_SERIES, "period": token}, ConsistentRead=True).get("Item")
+
+
+def _open_ledger(token, last):
+    """Chunks of this batch already applied; the ledger is created on the first attempt."""
+    key = {"series": FLUSH_SERIES, "period": token}
+    try:
+        rollup_table.put_item(
+            Item={**key, "last": last, TTL_ATTRIBUTE: int(time.time()) + FLUSH_LEDGER_TTL_S},
+            ConditionExpression="attribute_not_exists(series)",
+        )
+        return set()
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+    item = flush_ledger(token)
+    if item.get("last") != last:
+        # Other records than last time, so other chunks: only the same range can resume
+        raise RuntimeError(f"Batch {token} was flushed through {item.get('last')}, not {last}; retry the batch")
+    return {int(c) for c in item.get("done", ())}
+
+
+# Actions for the resource's client, which takes plain Python values like the Table API
+def _add_action(series, period, attrs):
+    return {"Update": {
+        "TableName": ROLLUP_TABLE,
+        "Key": {"series": series, "period": period},
+        "UpdateExpression": "ADD " + ", ".join(f"#a{i} :v{i}" for i in range(len(attrs))),
+        "ExpressionAttributeNames": {f"#a{i}": k for i, k in enumerate(attrs)},
+        "ExpressionAttributeValues": {f":v{i}": v for i, v in enumerate(attrs.values())},
+    }}
+
+
+def _ledger_action(token, chunk):
+    return {"Update": {
+        "TableName": ROLLUP_TABLE,
+        "Key": {"series": FLUSH_SERIES, "period": token},
+        "UpdateExpression": "ADD done :chunk",
+        "ConditionExpression": "attribute_not_exists(done) OR NOT contains(done, :n)",
+        "ExpressionAttributeValues": {":chunk": {chunk}, ":n": chunk},
+    }}
+
+
+def flush(deltas, token, last):
+    """
+    Apply one stream batch's deltas exactly once. `token` identifies the batch (its first
+    record) and `last` the last record whose changes are in `deltas`.
+    Day sketches go first: merging is idempotent, so a failure there costs nothing.
+    The counter ADDs follow in chunks of FLUSH_CHUNK, each one transaction together with
+    its entry in the batch's ledger. A redelivered batch skips the chunks already applied;
+    changes that cancel out (e.g. a text edit) write nothing.
+    """
+    writes = 0
+    for day, users in deltas["users"].items():
+        writes += _merge_day_sketch(day, users, deltas["last"][day])
+
+    items = []
+    for (series, period), attrs in sorted(deltas["counts"].items()):
+        attrs = {k: v for k, v in sorted(attrs.items()) if v}
+        if attrs:
+            items.append(_add_action(series, period, attrs))
+    if not items:
+        return writes
+
+    done = _open_ledger(token, last)
+    client = dynamodb.meta.client
+    for chunk, first in enumerate(range(0, len(items), FLUSH_CHUNK)):
+        if chunk in done:
+            continue
+        client.transact_write_items(TransactItems=items[first:first + FLUSH_CHUNK] + [_ledger_action(token, chunk)])
+        writes += len(items[first:first + FLUSH_CHUNK])
+    return writes
+
+
+def new_deltas():
+    return {"counts": defaultdict(Counter), "users": defaultdict(set), "last": {}}
+
+
+# ===== READ PATH =====
+def _read_series(series, lo, hi):
+    items = []
+    query = {"KeyConditionExpression": Key("series").eq(series) & Key("period").between(lo, hi)}
+    while True:
+        resp = rollup_table.query(**query)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        query["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    return {i["period"]: i for i in items}
+
+
+def _point(period, items):
+    point = {"period": period, "count": 0, "tiers": Counter(), "tones": Counter()}
+    for item in items:
+        for k, v in item.items():
+            if k == "n":
+                point["count"] += int(v)
+            elif k.startswith("tier#"):
+                point["tiers"][k[5:]] += int(v)
+            elif k.startswith("tone#"):
+                point["tones"][k[5:]] += int(v)
+    point["tiers"] = {k: v for k, v in point["tiers"].items() if v}
+    point["tones"] = {k: v for k, v in point["tones"].items() if v}
+    return point
+
+
+def timeseries(scope, bucket, start, end):
+    """
+    Zero-filled points for one scope between start and end (ISO dates or timestamps).
+    bucket is a multiple of hours, days or weeks; each point folds `multiple` stored
+    rollups together, aligned to the first period at or before `start`.
+    """
+    multiple, unit = parse_bucket(bucket)
+    lo, hi = floor_period(start, unit), floor_period(end, unit)
+    steps = int((hi - lo) / UNITS[unit]) + 1
+    if steps > MAX_POINTS:
+        raise ValueError(f"Range too large for {bucket}: {steps} periods (max {MAX_POINTS})")
+
+    stored = _read_series(f"{scope}#{unit}", period_key(lo, unit), period_key(hi, unit))
+    points = []
+    for first in range(0, steps, multiple):
+        periods = [period_key(lo + UNITS[unit] * (first + j), unit) for j in range(min(multiple, steps - first))]
+        points.append(_point(periods[0], [stored[p] for p in periods if p in stored]))
+    return points
+
+
+def summary(start, end):
+    """
+    Headline KPIs for [start, end] from the daily rollups and merged day sketches:
+    no raw check-ins are read, only one rollup item and one sketch per day.
+    """
+    lo, hi = period_key(start, "d"), period_key(end, "d")
+    days = _read_series(f"{ALL_SCOPE}#d", lo, hi)
+    totals = _point(lo, days.values())
+
+    sketch, last = HyperLogLog(), ""
+    for item in _read_series(HLL_SERIES, lo, hi).values():
+        sketch.merge(HyperLogLog(item["regs"].value))
+        last = max(last, str(item.get("last_ts", "")))
+
+    tones = totals["tones"]
+    return {
+        "start": lo,
+        "end": hi,
+        "total_reflections": totals["count"],
+        "unique_users": sketch.count(),
+        "auto_nudges": totals["tiers"].get("Auto", 0),
+        "most_common_tone": max(tones, key=tones.get) if tones else None,
+        "last_activity": last or None,
+        "tier_distribution": totals["tiers"],
+        "tone_distribution": tones,
+    }
+
+
+def all_time(scope=ALL_SCOPE):
+    """Count and tier/tone totals over the scope's whole history (one item per week)."""
+    return _point("", _read_series(f"{scope}#w", "0000-00-00", "9999-99-99").values())
+
+
+def parse_range(start, end, default_days=30):
+    """Bare dates cover whole days; defaults to the last `default_days` days."""
+    hi = _parse_ts(end) if end else datetime.utcnow()
+    if end and "T" not in end and hi is not None:
+        hi = hi.replace(hour=23, minute=59, second=59)
+    lo = _parse_ts(start) if start else (hi or datetime.utcnow()) - timedelta(days=default_days)
+    if lo is None or hi is None or lo > hi:
+        raise ValueError("Invalid start/end")
+    return lo, hi
+
+
+# ===== BACKFILL =====
+def backfill(table_name):
+    """
+    Rebuild every rollup from SainiCheckins (run once before enabling the stream trigger;
+    overwrites, so it is safe to re-run while writes are paused).
+    """
+    source = dynamodb.Table(table_name)
+    deltas = new_deltas()
+    scan = {"ProjectionExpression": "user_id, #ts, tier, tone", "ExpressionAttributeNames": {"#ts": "timestamp"}}
+    while True:
+        resp = source.scan(**scan)
+        for item in resp.get("Items", []):
+            _contributions(item, 1, deltas)
+        if "LastEvaluatedKey" not in resp:
+            break
+        scan["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+    with rollup_table.batch_writer() as batch:
+        for (series, period), attrs in deltas["counts"].items():
+            batch.put_item(Item={"series": series, "period": period, **attrs})
+        for day, users in deltas["users"].items():
+            sketch = HyperLogLog()
+            for user_id in users:
+                sketch.add(user_id)
+            batch.put_item(Item={"series": HLL_SERIES, "period": day, "regs": sketch.to_bytes(),
+                                 "last_ts": deltas["last"][day], "rev": 0})
+    written = len(deltas["counts"]) + len(deltas["users"])
+    print(f"✅ Wrote {written} rollup items to {ROLLUP_TABLE}")
+    return written
+
+
+if __name__ == "__main__":
+    backfill(os.getenv("TABLE_NAME", "SainiCheckins"))
@@ -0,0 +1 @@
+../shared/row_encoding.py
\ No newline at end of file
@@ -0,0 +1,62 @@
+import zlib
+
+# S3 rejects multipart parts under 5 MiB (except the last), so buffer to this size
+PART_SIZE = 8 * 1024 * 1024
+
+
+class S3MultipartWriter:
+    """
+    Write-only stream into an S3 object via multipart upload, optionally gzip-compressed
+    on the fly. Holds at most one part in memory regardless of the object's final size.
+    """
+
+    def __init__(self, s3, bucket, key, compress=False, content_type="text/csv"):
+        self.s3, self.bucket, self.key = s3, bucket, key
+        self.content_type = content_type
+        # wbits=31 → gzip container (header + CRC trailer), readable by any gunzip
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        self._buffer = bytearray()
+        self._parts = []
+        self._upload_id = None
+        self.bytes_written = 0
+
+    def write(self, data: bytes):
+        if self._gzip is not None:
+            data = self._gzip.compress(data)
+        self._buffer.extend(data)
+        if len(self._buffer) >= PART_SIZE:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self._upload_id is None:
+            self._upload_id = self.s3.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType=self.content_type
+            )["UploadId"]
+        number = len(self._parts) + 1
+        resp = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                   PartNumber=number, Body=bytes(self._buffer))
+        self._parts.append({"PartNumber": number, "ETag": resp["ETag"]})
+        self.bytes_written += len(self._buffer)
+        self._buffer.clear()
+
+    def close(self):
+        """Flush the tail and finish the object; returns its size in bytes."""
+        if self._gzip is not None:
+            self._buffer.extend(self._gzip.flush())
+        if self._upload_id is None:
+            # Small export: one plain PUT instead of a one-part multipart upload
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer),
+                               ContentType=self.content_type)
+            self.bytes_written += len(self._buffer)
+            self._buffer.clear()
+            return self.bytes_written
+        if self._buffer:
+            self._upload_part()
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                          MultipartUpload={"Parts": self._parts})
+        return self.bytes_written
+
+    def abort(self):
+        if self._upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        self._buffer.clear()
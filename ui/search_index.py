@@ -0,0 +1,310 @@
+import base64
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+# ===== CHECK-IN TOKEN INDEX (SainiCheckinSearch) =====
+# HASH bucket, RANGE entry:
+#   bucket "k#<first 2 chars of term>", entry "<term>#<timestamp>#<user_id>"
+#       posting → user_id, ts, tier, tf (term frequency), dl (document length), pos (token positions)
+#   bucket "#stats", entry "#stats" → doc_count, total_len (for BM25 avgdl)
+# Bucketing by the term's first two characters lets one Query serve a prefix ("medic*" →
+# begins_with "medic"), and an exact term's postings are ordered by timestamp, so date
+# ranges become key conditions. Latency follows the size of the matched posting lists
+# (capped at MAX_POSTINGS_PER_TERM, newest first), not the size of SainiCheckins.
+REGION = os.getenv("AWS_REGION", "us-east-2")
+SEARCH_INDEX_TABLE = os.getenv("SEARCH_INDEX_TABLE", "SainiCheckinSearch")
+STATS_KEY = {"bucket": "#stats", "entry": "#stats"}
+MAX_POSTINGS_PER_TERM = int(os.getenv("SEARCH_MAX_POSTINGS", "5000"))
+MIN_PREFIX = 2
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Same tokenizer as lambda/lexical_index.py (memories), kept in sync by hand
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'\-]*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "had", "has",
+    "have", "i", "i'm", "im", "in", "is", "it", "it's", "its", "me", "my", "of", "on", "or",
+    "so", "that", "the", "this", "to", "was", "we", "were", "with", "you", "your",
+}
+
+dynamodb = boto3.resource("dynamodb", region_name=REGION)
+index_table = dynamodb.Table(SEARCH_INDEX_TABLE)
+
+
+def tokenize(text: str):
+    """Lowercase word tokens without stopwords; list order gives phrase positions."""
+    return [t.strip("'-") for t in TOKEN_RE.findall((text or "").lower())
+            if t.strip("'-") and t not in STOPWORDS]
+
+
+def checkin_tokens(item):
+    return tokenize(f"{item.get('message') or ''} {item.get('response') or ''}")
+
+
+def _bucket(term: str) -> str:
+    return f"k#{term[:MIN_PREFIX]}"
+
+
+# ===== WRITE PATH =====
+def index_checkin(item):
+    """Add one check-in's postings and bump the global BM25 counters."""
+    tokens = checkin_tokens(item)
+    if not tokens or not item.get("user_id") or not item.get("timestamp"):
+        return 0
+
+    positions = defaultdict(list)
+    for pos, term in enumerate(tokens):
+        positions[term].append(pos)
+
+    with index_table.batch_writer(overwrite_by_pkeys=["bucket", "entry"]) as batch:
+        for term, pos in positions.items():
+            batch.put_item(Item={
+                "bucket": _bucket(term),
+                "entry": f"{term}#{item['timestamp']}#{item['user_id']}",
+                "user_id": item["user_id"],
+                "ts": item["timestamp"],
+                "tier": item.get("tier", "Unknown"),
+                "tf": len(pos),
+                "dl": len(tokens),
+                "pos": pos,
+            })
+    index_table.update_item(
+        Key=STATS_KEY,
+        UpdateExpression="ADD doc_count :one, total_len :len",
+        ExpressionAttributeValues={":one": 1, ":len": len(tokens)},
+    )
+    return len(tokens)
+
+
+def remove_checkin(item):
+    """Drop one check-in's postings (inverse of index_checkin)."""
+    tokens = checkin_tokens(item)
+    if not tokens or not item.get("user_id") or not item.get("timestamp"):
+        return
+
+    with index_table.batch_writer(overwrite_by_pkeys=["bucket", "entry"]) as batch:
+        for term in set(tokens):
+            batch.delete_item(Key={"bucket": _bucket(term), "entry": f"{term}#{item['timestamp']}#{item['user_id']}"})
+    index_table.update_item(
+        Key=STATS_KEY,
+        UpdateExpression="ADD doc_count :neg, total_len :len",
+        ExpressionAttributeValues={":neg": -1, ":len": -len(tokens)},
+    )
+
+
+def apply_change(old, new):
+    """Keep the index in step with one stream record (INSERT, MODIFY or REMOVE)."""
+    fields = ("message", "response", "tier")
+    if old and new and all(old.get(f) == new.get(f) for f in fields):
+        return
+    if old:
+        remove_checkin(old)
+    if new:
+        index_checkin(new)
+
+
+# ===== QUERY PARSING =====
+def parse_query(q: str):
+    """
+    Clauses from a query string, all of which must match:
+      "walked home"  phrase (consecutive tokens)
+      medic*         prefix (at least MIN_PREFIX characters)
+      anxious        exact term
+    """
+    clauses = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', (q or "").lower()):
+        if phrase:
+            terms = tokenize(phrase)
+            if len(terms) == 1:
+                clauses.append({"term": terms[0], "prefix": False})
+            elif terms:
+                clauses.append({"phrase": terms})
+            continue
+        prefix = word.endswith("*")
+        terms = tokenize(word.rstrip("*"))
+        if not terms:
+            continue
+        for t in terms[:-1]:
+            clauses.append({"term": t, "prefix": False})
+        last = terms[-1]
+        clauses.append({"term": last, "prefix": prefix and len(last) >= MIN_PREFIX})
+    return clauses
+
+
+# ===== READ PATH =====
+def _postings(term, prefix, start=None, end=None):
+    """Postings for a term (or every term starting with it), newest first, capped."""
+    cond = Key("bucket").eq(_bucket(term))
+    if prefix:
+        cond &= Key("entry").begins_with(term)
+    elif start or end:
+        # "~" sorts after "#" and every timestamp character, so the end bound is inclusive
+        cond &= Key("entry").between(f"{term}#{start or ''}", f"{term}#{end or ''}~")
+    else:
+        cond &= Key("entry").begins_with(f"{term}#")
+
+    items = []
+    query = {"KeyConditionExpression": cond, "ScanIndexForward": False}
+    while len(items) < MAX_POSTINGS_PER_TERM:
+        resp = index_table.query(**query)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        query["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    return items[:MAX_POSTINGS_PER_TERM]
+
+
+def _matches(postings, f):
+    """Apply the user/tier/date filters to postings (the same filters /checkins takes)."""
+    out = {}
+    for p in postings:
+        if f["user_ids"] and p["user_id"] not in f["user_ids"]:
+            continue
+        if f["tiers"] and p.get("tier") not in f["tiers"]:
+            continue
+        if not f["include_auto"] and p.get("tier") == "Auto":
+            continue
+        if (f["start"] and p["ts"] < f["start"]) or (f["end"] and p["ts"] > f["end"]):
+            continue
+        doc = (p["user_id"], p["ts"])
+        hit = out.setdefault(doc, {"tf": 0, "dl": int(p["dl"]), "pos": set()})
+        hit["tf"] += int(p["tf"])
+        hit["pos"].update(int(x) for x in p.get("pos", []))
+    return out
+
+
+def _phrase_docs(per_term):
+    """Docs where the phrase terms appear at consecutive positions."""
+    docs = set.intersection(*(set(m) for m in per_term))
+    keep = set()
+    for doc in docs:
+        starts = per_term[0][doc]["pos"]
+        for offset, m in enumerate(per_term[1:], start=1):
+            starts = {p for p in starts if p + offset in m[doc]["pos"]}
+            if not starts:
+                break
+        if starts:
+            keep.add(doc)
+    return keep
+
+
+def rank(f, clauses):
+    """[(score, user_id, timestamp)] best first for every check-in matching all clauses."""
+    stats = index_table.get_item(Key=STATS_KEY).get("Item") or {}
+    doc_count = max(int(stats.get("doc_count", 0)), 1)
+    avgdl = float(stats.get("total_len", 0)) / doc_count or 1.0
+
+    fetched = {}
+
+    def matched(term, prefix):
+        if (term, prefix) not in fetched:
+            fetched[term, prefix] = _matches(_postings(term, prefix, f["start"], f["end"]), f)
+        return fetched[term, prefix]
+
+    candidates, scored = None, []
+    for clause in clauses:
+        if "phrase" in clause:
+            per_term = [matched(t, False) for t in clause["phrase"]]
+            docs = _phrase_docs(per_term)
+            scored.extend((m, docs) for m in per_term)
+        else:
+            m = matched(clause["term"], clause["prefix"])
+            docs = set(m)
+            scored.append((m, docs))
+        candidates = docs if candidates is None else candidates & docs
+        if not candidates:
+            return []
+
+    scores = Counter()
+    for m, _ in scored:
+        idf = math.log(1 + (doc_count - len(m) + 0.5) / (len(m) + 0.5))
+        for doc in candidates:
+            tf, dl = float(m[doc]["tf"]), float(m[doc]["dl"])
+            scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl))
+
+    # Ties go to the newer check-in
+    return sorted(((s, uid, ts) for (uid, ts), s in scores.items()), key=lambda r: (r[0], r[2]), reverse=True)
+
+
+def _hydrate(table_name, keys):
+    """Full check-in rows for one page of hits, in hit order."""
+    if not keys:
+        return []
+    found = {}
+    request = {table_name: {"Keys": [{"user_id": uid, "timestamp": ts} for uid, ts in keys]}}
+    while request:
+        resp = dynamodb.batch_get_item(RequestItems=request)
+        for item in resp.get("Responses", {}).get(table_name, []):
+            found[(item["user_id"], item["timestamp"])] = item
+        request = resp.get("UnprocessedKeys") or None
+    return [found[k] for k in keys if k in found]
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["o"])
+    except Exception:
+        return 0
+
+
+def search(table_name, q, f, page_size=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    One page of ranked check-ins for `q` under the /checkins filters `f`.
+    Returns {"items", "total", "next_cursor"}; items carry their BM25 "score".
+    """
+    clauses = parse_query(q)
+    if not clauses:
+        return {"items": [], "total": 0, "next_cursor": None}
+
+    ranked = rank(f, clauses)
+    page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    offset = decode_cursor(cursor) if cursor else 0
+    page = ranked[offset:offset + page_size]
+
+    items = _hydrate(table_name, [(uid, ts) for _, uid, ts in page])
+    scores = {(uid, ts): s for s, uid, ts in page}
+    for item in items:
+        item["score"] = round(scores[(item["user_id"], item["timestamp"])], 4)
+    more = offset + page_size < len(ranked)
+    return {"items": items, "total": len(ranked), "next_cursor": encode_cursor(offset + page_size) if more else None}
+
+
+# ===== BACKFILL =====
+def backfill(table_name):
+    """Index every existing check-in once (run before enabling the stream trigger)."""
+    source = dynamodb.Table(table_name)
+    scan, docs, total_len = {}, 0, 0
+    while True:
+        resp = source.scan(**scan)
+        for item in resp.get("Items", []):
+            tokens = checkin_tokens(item)
+            if not tokens:
+                continue
+            index_checkin(item)
+            docs += 1
+            total_len += len(tokens)
+        if "LastEvaluatedKey" not in resp:
+            break
+        scan["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    # Counters reflect exactly what was indexed, however many times this has run
+    index_table.put_item(Item={**STATS_KEY, "doc_count": docs, "total_len": total_len})
+    print(f"✅ Indexed {docs} check-ins into {SEARCH_INDEX_TABLE}")
+    return docs
+
+
+if __name__ == "__main__":
+    backfill(os.getenv("TABLE_NAME", "SainiCheckins"))
@@ -1,14 +1,95 @@
 import os
 import json
+import threading
+from collections import OrderedDict
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from utils import checkin_cache
+
 
 # ==========================================
 # 🚀 API FETCH UTILITIES (with caching + normalization)
 # ==========================================
 
+# Shared keep-alive session: one TCP/TLS handshake per host instead of per request
+_session = None
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+        _session = requests.Session()
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+# Most recent 200 per (url, params, Accept), replayed when the API answers 304 Not Modified
+_validated = OrderedDict()
+_validated_lock = threading.Lock()
+MAX_VALIDATED = 64
+
+
+def api_get(url: str, params: dict = None, headers: dict = None, timeout: float = 10) -> requests.Response:
+    """
+    GET over the shared session with If-None-Match. On 304 the previously downloaded
+    response is returned, so callers never see the difference (except the saved transfer).
+    """
+    headers = dict(headers or {})
+    key = (url, tuple(sorted((params or {}).items())), headers.get("Accept", ""))
+    with _validated_lock:
+        cached = _validated.get(key)
+    if cached is not None and cached.headers.get("ETag"):
+        headers["If-None-Match"] = cached.headers["ETag"]
+
+    r = get_session().get(url, params=params, headers=headers, timeout=timeout)
+    if r.status_code == 304 and cached is not None:
+        with _validated_lock:
+            _validated.move_to_end(key)
+        return cached
+    if r.status_code == 200 and r.headers.get("ETag"):
+        with _validated_lock:
+            _validated[key] = r
+            _validated.move_to_end(key)
+            while len(_validated) > MAX_VALIDATED:
+                _validated.popitem(last=False)
+    return r
+
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+# Columnar first, JSON as fallback for older deployments; requests adds Accept-Encoding: gzip
+BULK_HEADERS = {"Accept": f"{ARROW_STREAM}, application/x-ndjson;q=0.8, application/json;q=0.5"}
+
+
+def _decode_rows(resp):
+    """
+    Decode a bulk /checkins response into (rows, watermark).
+    Arrow IPC goes straight to a DataFrame; NDJSON/JSON come back as a list of dicts.
+    """
+    content_type = resp.headers.get("Content-Type", "")
+    watermark = resp.headers.get("X-Watermark")
+    if content_type.startswith(ARROW_STREAM):
+        import pyarrow as pa
+        return pa.ipc.open_stream(resp.content).read_pandas(), watermark
+    if content_type.startswith("application/x-ndjson"):
+        return [json.loads(line) for line in resp.text.splitlines() if line.strip()], watermark
+
+    data = resp.json()
+    if isinstance(data, dict) and isinstance(data.get("body"), str):
+        data = json.loads(data["body"])
+    if isinstance(data, dict) and "items" in data:
+        return data["items"], data.get("watermark", watermark)
+    return (data if isinstance(data, list) else []), watermark
+
+
 @st.cache_data(ttl=60, show_spinner=False)
 def fetch_checkins_via_api(api_base: str) -> pd.DataFrame:
     """
@@ -18,11 +99,10 @@ def fetch_checkins_via_api(api_base: str) -> pd.DataFrame:
     """
     try:
         url = f"{api_base}/checkins".rstrip("/")
-        r = requests.get(url, timeout=20)
+        r = api_get(url, headers=BULK_HEADERS, timeout=20)
         r.raise_for_status()
-        data = _unwrap_api_response(r)
-        df = pd.DataFrame(data)
-        return normalize_df(df)
+        rows, _ = _decode_rows(r)
+        return normalize_df(pd.DataFrame(rows))
     except Exception as e:
         st.error(f"❌ Failed to fetch via API: {e}")
         return pd.DataFrame()
@@ -36,9 +116,9 @@ def fetch_user_analytics(api_base: str, user_id: str) -> dict:
     """
     try:
         url = f"{api_base}/analytics"
-        r = requests.get(url, params={"user_id": user_id}, timeout=10)
+        r = api_get(url, params={"user_id": user_id}, timeout=10)
         r.raise_for_status()
-        data = _unwrap_api_response(r)
+        data = _json_body(r)
         if isinstance(data, dict):
             return data
         if isinstance(data, list) and data:
@@ -49,9 +129,148 @@ def fetch_user_analytics(api_base: str, user_id: str) -> dict:
         return {}
 
 
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_user_analytics_batch(api_base: str, user_ids: tuple) -> dict:
+    """
+    Analytics summaries for several users in one round-trip (/analytics?user_ids=a,b,c).
+    Falls back to concurrent per-user calls over the pooled session if the API predates
+    batching. Returns {user_id: summary}.
+    """
+    if not user_ids:
+        return {}
+    try:
+        r = api_get(f"{api_base}/analytics", params={"user_ids": ",".join(user_ids)}, timeout=10)
+        r.raise_for_status()
+        data = _json_body(r)
+        if isinstance(data, dict) and isinstance(data.get("users"), dict):
+            return data["users"]
+    except Exception as e:
+        st.warning(f"⚠️ Batch analytics unavailable, fetching per user: {e}")
+
+    def fetch_one(uid):
+        try:
+            r = api_get(f"{api_base}/analytics", params={"user_id": uid}, timeout=8)
+            r.raise_for_status()
+            data = _json_body(r)
+            return uid, data if isinstance(data, dict) else {}
+        except Exception:
+            return uid, {}
+
+    with ThreadPoolExecutor(max_workers=min(8, len(user_ids))) as pool:
+        return dict(pool.map(fetch_one, user_ids))
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_timeseries(api_base: str, user_ids: tuple = (), bucket: str = "day", start: str = None, end: str = None) -> dict:
+    """
+    Pre-aggregated counts per period from /timeseries (rollups, no raw rows).
+    Returns {user_id or "all": [{"period", "count", "tiers", "tones"}, ...]} or {} if unavailable.
+    """
+    params = {"bucket": bucket}
+    if user_ids:
+        params["user_ids"] = ",".join(user_ids)
+    if start:
+        params["start"] = start
+    if end:
+        params["end"] = end
+    try:
+        r = api_get(f"{api_base}/timeseries", params=params, timeout=10)
+        r.raise_for_status()
+        data = _json_body(r)
+        return data.get("series", {}) if isinstance(data, dict) else {}
+    except Exception as e:
+        st.warning(f"⚠️ Time series unavailable, charting downloaded rows: {e}")
+        return {}
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_metrics_summary(api_base: str, start: str = None, end: str = None) -> dict:
+    """Headline KPIs from /metrics/summary (streaming counters + HyperLogLog); {} if unavailable."""
+    params = {k: v for k, v in {"start": start, "end": end}.items() if v}
+    try:
+        r = api_get(f"{api_base}/metrics/summary", params=params, timeout=10)
+        r.raise_for_status()
+        data = _json_body(r)
+        return data if isinstance(data, dict) and "total_reflections" in data else {}
+    except Exception:
+        return {}
+
+
+def request_export(api_base: str, filters: dict, compress: bool = False) -> dict:
+    """
+    Start a server-side export of the filtered check-ins to S3 (POST /export).
+    Returns {"export_id", "status": "pending", ...}; poll it with poll_export.
+    Not cached — every click is a fresh export.
+    """
+    body = {k: v for k, v in filters.items() if k != "fields"}
+    body["gzip"] = str(bool(compress)).lower()
+    r = get_session().post(f"{api_base}/export", json=body, timeout=15)
+    r.raise_for_status()
+    data = _json_body(r)
+    if not isinstance(data, dict) or "export_id" not in data:
+        raise ValueError(f"Unexpected export response: {data}")
+    return data
+
+
+def poll_export(api_base: str, export_id: str, wait: int = 20) -> dict:
+    """
+    Status of an export (GET /export/{id}); the server holds the request up to `wait` s.
+    Returns {"status": "pending"} while running, then the "done" body with
+    {"url", "rows", "bytes", "filename", "expires_in"} or {"status": "failed", "error"}.
+    """
+    r = get_session().get(f"{api_base}/export/{export_id}", params={"wait": wait}, timeout=wait + 10)
+    r.raise_for_status()
+    data = _json_body(r)
+    if not isinstance(data, dict) or "status" not in data:
+        raise ValueError(f"Unexpected export status: {data}")
+    return data
+
+
+def _checkin_body(resp) -> dict:
+    """Check-in responses come bare or wrapped as {"body": "<json>"}; always return a dict."""
+    try:
+        outer = resp.json()
+    except Exception:
+        return {"error": resp.text[:200]}
+    body = outer.get("body", outer) if isinstance(outer, dict) else outer
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except Exception:
+            body = {"response": body}
+    return body if isinstance(body, dict) else {"error": f"Unexpected response: {str(outer)[:200]}"}
+
+
+def submit_checkin(api_base: str, user_id: str, message: str) -> tuple:
+    """
+    POST /checkin in async mode → (status, body). 202 carries a checkin_id to poll;
+    200 is an immediate reflection (Critical check-ins always answer synchronously).
+    """
+    r = get_session().post(f"{api_base}/checkin", json={"user_id": user_id, "message": message},
+                           headers={"Prefer": "respond-async"}, timeout=10)
+    return r.status_code, _checkin_body(r)
+
+
+def poll_checkin(api_base: str, checkin_id: str, wait: int = 20) -> tuple:
+    """GET /checkin/{id}: the API holds the request up to `wait` s until the reflection is ready."""
+    r = get_session().get(f"{api_base}/checkin/{checkin_id}", params={"wait": wait}, timeout=wait + 5)
+    return r.status_code, _checkin_body(r)
+
+
 # ==========================================
 # 🧩 UNIVERSAL API RESPONSE UNWRAPPER
 # ==========================================
+def _json_body(resp):
+    """
+    Parsed JSON of an object-shaped API response: bare (Lambda proxy integration)
+    or wrapped as {"statusCode": 200, "body": "<json>"}. Raises on non-JSON.
+    """
+    data = resp.json()
+    if isinstance(data, dict) and isinstance(data.get("body"), str):
+        data = json.loads(data["body"])
+    return data
+
+
 def _unwrap_api_response(resp):
     """
     Normalizes API Gateway responses.
@@ -83,8 +302,29 @@ def _unwrap_api_response(resp):
 # ==========================================
 # 🧭 NORMALIZATION
 # ==========================================
+# Low-cardinality columns → category codes; free text → Arrow-backed strings
+CATEGORICAL_COLS = ["user_id", "tier", "tone", "source"]
+TEXT_COLS = ["message", "response"]
+TEXT_DTYPE = "string[pyarrow]"
+SEARCH_COL = "_search"   # cached lowercase message + response for text filtering
+
+
+def _to_category(series: pd.Series, default: str, clean=str) -> pd.Series:
+    """
+    Categorical with `clean` applied once per distinct value instead of once per row.
+    Values that clean to the same label (e.g. "stable " / "Stable") share one category.
+    """
+    cat = series.fillna(default).astype("category")
+    labels = [clean(str(c)) for c in cat.cat.categories]
+    uniq = sorted(set(labels))
+    pos = {label: i for i, label in enumerate(uniq)}
+    remap = np.array([pos[label] for label in labels], dtype=np.int32)
+    codes = cat.cat.codes.to_numpy()
+    return pd.Series(pd.Categorical.from_codes(remap[codes], uniq), index=series.index, name=series.name)
+
+
 def normalize_df(df: pd.DataFrame) -> pd.DataFrame:
-    """Ensure consistent schema + datatypes for all UI components."""
+    """Ensure consistent schema + memory-lean datatypes for all UI components."""
     if df.empty:
         return df
 
@@ -99,17 +339,24 @@ def normalize_df(df: pd.DataFrame) -> pd.DataFrame:
         "is_auto": False,
     }
 
+    # Embeddings are never rendered; don't carry them through every rerun
+    df = df.drop(columns=["embedding"], errors="ignore")
     for col, default in required_cols.items():
         if col not in df.columns:
             df[col] = default
 
     df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce", utc=True)
 
-    for col in ["user_id", "tier", "message", "response", "tone", "source"]:
-        df[col] = df[col].astype(str).fillna("")
+    df["user_id"] = _to_category(df["user_id"], "unknown")
+    df["source"] = _to_category(df["source"], "N/A")
+    df["tier"] = _to_category(df["tier"], "Unknown", lambda v: v.strip().title())
+    df["tone"] = _to_category(df["tone"], "neutral", lambda v: v.strip().lower())
+    for col in TEXT_COLS:
+        df[col] = df[col].fillna("").astype(TEXT_DTYPE)
+    df["is_auto"] = df["is_auto"].fillna(False).astype(bool)
 
-    df["tier"] = df["tier"].str.strip().str.title()
-    df["tone"] = df["tone"].str.strip().str.lower()
+    # Lowercased once here (and persisted in the Parquet cache), not on every filter rerun
+    df[SEARCH_COL] = (df["message"] + " " + df["response"]).str.lower()
 
     return df.sort_values("timestamp", ascending=False).reset_index(drop=True)
 
@@ -146,6 +393,116 @@ def fetch_checkins_via_dynamodb(table_name: str = None, region: str = None) -> p
         return pd.DataFrame()
 
 
+# ==========================================
+# 🔄 DELTA SYNC (local append-only cache + high-watermark)
+# ==========================================
+# Columns the dashboard renders/exports; everything else stays on the server
+DASHBOARD_FIELDS = ["user_id", "timestamp", "tier", "tone", "message", "response", "source", "is_auto"]
+
+
+def checkin_filter_params(users=None, tiers=None, include_auto=True, date_range=(), query="") -> dict:
+    """Dashboard filter state → /checkins query parameters (evaluated server-side)."""
+    params = {"include_auto": str(bool(include_auto)).lower(), "fields": ",".join(DASHBOARD_FIELDS)}
+    if users:
+        params["user_ids"] = ",".join(sorted(users))
+    if tiers:
+        params["tiers"] = ",".join(sorted(tiers))
+    if len(date_range) == 2:
+        params["start"], params["end"] = date_range[0].isoformat(), date_range[1].isoformat()
+    if query.strip():
+        params["q"] = query.strip()
+    return params
+
+
+def sync_checkins_via_api(api_base: str, filters: dict = None) -> pd.DataFrame:
+    """
+    Fetch only check-ins that match `filters` (see checkin_filter_params) and are newer
+    than the cached high-watermark from /checkins?since=..., merged into the local
+    Parquet cache (see utils/checkin_cache.py). Each filter combination has its own cache.
+    """
+    filters = filters or {}
+    source_key = f"api:{api_base}?" + "&".join(f"{k}={v}" for k, v in sorted(filters.items()))
+
+    def fetch_delta(since):
+        url = f"{api_base}/checkins".rstrip("/")
+        r = api_get(url, params={**filters, "since": since}, headers=BULK_HEADERS, timeout=20)
+        r.raise_for_status()
+        rows, watermark = _decode_rows(r)
+        return rows, watermark or since
+
+    try:
+        # Free-text searches are one-offs: keep them in memory instead of on disk
+        return checkin_cache.sync(source_key, fetch_delta, normalize_df, persist="q" not in filters)
+    except Exception as e:
+        st.error(f"❌ Failed to sync via API (showing cached data): {e}")
+        return checkin_cache.snapshot(source_key)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def search_checkins_via_api(api_base: str, filters: dict, max_results: int = 200) -> pd.DataFrame:
+    """
+    Ranked matches for filters["q"] from the server-side token index (/search), with the
+    same user/tier/date filters as /checkins. Best match first; a "score" column is kept.
+    Query syntax: "exact phrase", prefix*, plain terms (all must match).
+    """
+    params = {k: v for k, v in filters.items() if k != "fields"}
+    params["page_size"] = "100"
+    rows = []
+    try:
+        while len(rows) < max_results:
+            r = api_get(f"{api_base}/search", params=params, timeout=15)
+            r.raise_for_status()
+            page = _json_body(r)
+            if not isinstance(page, dict):
+                break
+            rows.extend(page.get("items", []))
+            if not page.get("next_cursor"):
+                break
+            params["cursor"] = page["next_cursor"]
+    except Exception as e:
+        st.error(f"❌ Search failed: {e}")
+        return pd.DataFrame()
+
+    if not rows:
+        return pd.DataFrame()
+    df = normalize_df(pd.DataFrame(rows[:max_results]))
+    # normalize_df sorts by time; restore rank order
+    if "score" in df.columns:
+        df = df.sort_values("score", ascending=False, kind="stable").reset_index(drop=True)
+    return df
+
+
+def sync_checkins_via_dynamodb(table_name: str = None, region: str = None) -> pd.DataFrame:
+    """
+    Delta sync straight from DynamoDB (requires AWS credentials).
+    The scan still reads the table, but only rows past the watermark are transferred and parsed.
+    """
+    table_name = table_name or os.getenv("TABLE_NAME", "SainiCheckins")
+    region = region or os.getenv("AWS_REGION", "us-east-2")
+    source_key = f"dynamodb:{region}:{table_name}"
+
+    def fetch_delta(since):
+        import boto3
+        from boto3.dynamodb.conditions import Attr
+
+        table = boto3.resource("dynamodb", region_name=region).Table(table_name)
+        scan = {"FilterExpression": Attr("timestamp").gt(since)}
+        items = []
+        while True:
+            resp = table.scan(**scan)
+            items.extend(resp.get("Items", []))
+            if "LastEvaluatedKey" not in resp:
+                break
+            scan["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+        return items, max((i.get("timestamp", "") for i in items), default=since)
+
+    try:
+        return checkin_cache.sync(source_key, fetch_delta, normalize_df)
+    except Exception as e:
+        st.error(f"⚠️ Failed to sync from DynamoDB (showing cached data): {e}")
+        return checkin_cache.snapshot(source_key)
+
+
 # ==========================================
 # 👥 FETCH USER LIST (for dropdown)
 # ==========================================
@@ -161,7 +518,7 @@ def fetch_user_list(api_base: str):
     """
     try:
         url = f"{api_base}/users".rstrip("/")
-        r = requests.get(url, timeout=10)
+        r = api_get(url, timeout=10)
         r.raise_for_status()
         data = _unwrap_api_response(r)
 
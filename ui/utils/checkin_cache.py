@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+
+# ==========================================
+# 💾 LOCAL APPEND-ONLY CHECK-IN CACHE (Parquet)
+# ==========================================
+# One directory per data source:
+#   part-<ms>.parquet   rows fetched by one delta sync (never rewritten)
+#   _meta.json          {"watermark": "<max raw DynamoDB timestamp seen>"}
+# Parts are folded into a single file once there are more than MAX_PARTS.
+# Every filter combination is its own source, so both tiers are bounded: the in-memory
+# frames by MAX_MEMO_SOURCES (LRU), the directories by MAX_CACHED_SOURCES / MAX_SOURCE_AGE_DAYS.
+
+CACHE_DIR = Path(os.getenv("SAINTE_CACHE_DIR", Path.home() / ".cache" / "sainte"))
+MAX_PARTS = int(os.getenv("SAINTE_CACHE_MAX_PARTS", "32"))
+# Don't hit the backend more often than this, even if Streamlit reruns on every click
+MIN_SYNC_INTERVAL = float(os.getenv("SAINTE_SYNC_INTERVAL", "10"))
+# Re-request this far before the watermark. Rows become visible late: eventual consistency, and
+# check-ins whose timestamp is picked before the model call and written after it (up to the
+# check-in handler's CHECKIN_PENDING_TIMEOUT_S). Rows already cached are dropped by _append.
+OVERLAP_SECONDS = int(os.getenv("SAINTE_SYNC_OVERLAP", "150"))
+EPOCH = "1970-01-01T00:00:00"
+DEDUP_KEYS = ["user_id", "timestamp", "message"]
+MAX_MEMO_SOURCES = int(os.getenv("SAINTE_CACHE_MAX_MEMO", "8"))
+MAX_CACHED_SOURCES = int(os.getenv("SAINTE_CACHE_MAX_SOURCES", "16"))
+MAX_SOURCE_AGE_DAYS = float(os.getenv("SAINTE_CACHE_MAX_AGE_DAYS", "7"))
+
+_memo = OrderedDict()
+# _lock guards _memo and _source_locks only and is never held across disk or network I/O;
+# each source's sync is serialized by its own lock, so one slow backend call doesn't
+# block every other source
+_lock = threading.Lock()
+_source_locks = {}
+
+
+def _source_dir(source_key: str) -> Path:
+    return CACHE_DIR / hashlib.sha1(source_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _source_lock(source_key: str) -> threading.Lock:
+    with _lock:
+        return _source_locks.setdefault(source_key, threading.Lock())
+
+
+def _busy_dirs():
+    """Directories of sources being synced right now (never pruned from under them)."""
+    with _lock:
+        return {_source_dir(k) for k, lock in _source_locks.items() if lock.locked()}
+
+
+def _prune_sources(keep: Path):
+    """Drop source directories unused for MAX_SOURCE_AGE_DAYS, then all but the newest MAX_CACHED_SOURCES."""
+    def last_used(d):
+        meta = d / "_meta.json"
+        return (meta if meta.exists() else d).stat().st_mtime
+
+    try:
+        dirs = sorted((d for d in CACHE_DIR.iterdir() if d.is_dir() and d != keep), key=last_used, reverse=True)
+    except OSError:
+        return
+    cutoff = time.time() - MAX_SOURCE_AGE_DAYS * 86400
+    busy = _busy_dirs()
+    for i, d in enumerate(dirs):
+        # `keep` counts toward the limit
+        if d not in busy and (i + 1 >= MAX_CACHED_SOURCES or last_used(d) < cutoff):
+            shutil.rmtree(d, ignore_errors=True)
+
+
+def _parts(path: Path):
+    return sorted(path.glob("part-*.parquet"))
+
+
+def _write_parquet(df: pd.DataFrame, target: Path):
+    tmp = target.with_suffix(".tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, target)
+
+
+def _load(source_key: str, persist: bool = True):
+    """Read every cached part for a source (empty frame + epoch watermark on first run)."""
+    if not persist:
+        return pd.DataFrame(), EPOCH
+    path = _source_dir(source_key)
+    meta_file = path / "_meta.json"
+    parts = _parts(path)
+    if not parts or not meta_file.exists():
+        return pd.DataFrame(), EPOCH
+    try:
+        df = _concat([pd.read_parquet(p) for p in parts])
+        watermark = json.loads(meta_file.read_text()).get("watermark", EPOCH)
+        return df, watermark
+    except Exception as e:
+        print(f"⚠️ Check-in cache unreadable, rebuilding: {e}")
+        return pd.DataFrame(), EPOCH
+
+
+def _concat(frames) -> pd.DataFrame:
+    """pd.concat that keeps categorical columns categorical when the category sets differ."""
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    categorical = {c for f in frames for c in f.columns if isinstance(f[c].dtype, pd.CategoricalDtype)}
+    if len(frames) > 1 and categorical:
+        categories = {c: sorted({v for f in frames if c in f.columns for v in f[c].dropna().unique()})
+                      for c in categorical}
+        frames = [f.astype({c: pd.CategoricalDtype(categories[c]) for c in categorical if c in f.columns})
+                  for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _rewind(watermark: str, seconds: int) -> str:
+    try:
+        return (datetime.fromisoformat(watermark) - timedelta(seconds=seconds)).isoformat()
+    except ValueError:
+        return watermark
+
+
+def _append(source_key: str, cached: pd.DataFrame, new_rows: pd.DataFrame, watermark: str,
+            persist: bool = True) -> pd.DataFrame:
+    """Persist only rows not already cached as a new part; return the merged frame."""
+    if not new_rows.empty and not cached.empty:
+        seen = pd.MultiIndex.from_frame(cached[DEDUP_KEYS].astype(str))
+        fresh = ~pd.MultiIndex.from_frame(new_rows[DEDUP_KEYS].astype(str)).isin(seen)
+        new_rows = new_rows[fresh]
+    if not persist:
+        return _concat([cached, new_rows]) if not new_rows.empty else cached
+
+    path = _source_dir(source_key)
+    if not path.exists():
+        path.mkdir(parents=True)
+        _prune_sources(keep=path)
+        if not cached.empty:
+            # Pruned while still in memory: re-persist it so the watermark below stays truthful
+            _write_parquet(cached, path / f"part-{int(time.time() * 1000):015d}-restore.parquet")
+    if not new_rows.empty:
+        _write_parquet(new_rows, path / f"part-{int(time.time() * 1000):015d}.parquet")
+        cached = _concat([cached, new_rows])
+
+    parts = _parts(path)
+    if len(parts) > MAX_PARTS:
+        # Distinct suffix so the compacted file can't collide with a part written this same ms
+        _write_parquet(cached, path / f"part-{int(time.time() * 1000):015d}-compact.parquet")
+        for p in parts:
+            p.unlink(missing_ok=True)
+
+    (path / "_meta.json").write_text(json.dumps({"watermark": watermark}))
+    return cached
+
+
+def sync(source_key: str, fetch_delta, normalize, persist: bool = True) -> pd.DataFrame:
+    """
+    Delta-sync a source into the local cache and return the full (cached + new) frame.
+    fetch_delta(since) -> (rows newer than `since` as dicts or a DataFrame, new raw watermark)
+    persist=False keeps the cache in memory only (e.g. one-off free-text searches).
+    """
+    with _source_lock(source_key):
+        with _lock:
+            state = _memo.get(source_key)
+            if state is not None:
+                _memo.move_to_end(source_key)
+        if state is None:
+            df, watermark = _load(source_key, persist)
+            state = {"df": df, "watermark": watermark, "synced_at": 0.0}
+            with _lock:
+                _memo[source_key] = state
+                while len(_memo) > MAX_MEMO_SOURCES:
+                    _memo.popitem(last=False)
+
+        if time.time() - state["synced_at"] < MIN_SYNC_INTERVAL:
+            return state["df"]
+
+        since = state["watermark"] if state["df"].empty else _rewind(state["watermark"], OVERLAP_SECONDS)
+        rows, watermark = fetch_delta(since)
+        new_rows = normalize(pd.DataFrame(rows)) if len(rows) else pd.DataFrame()
+        watermark = max(watermark or state["watermark"], state["watermark"])
+
+        df = _append(source_key, state["df"], new_rows, watermark, persist)
+        if not new_rows.empty:
+            df = df.sort_values("timestamp", ascending=False).reset_index(drop=True)
+        with _lock:
+            state.update(df=df, watermark=watermark, synced_at=time.time())
+        return df
+
+
+def snapshot(source_key: str) -> pd.DataFrame:
+    """Whatever is cached for a source without contacting the backend (used when a sync fails)."""
+    with _lock:
+        state = _memo.get(source_key)
+    return state["df"] if state is not None else _load(source_key)[0]